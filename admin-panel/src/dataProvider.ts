@@ -56,6 +56,23 @@ export function makeDataProvider(): DataProvider {
 
   return {
     async getList(resource, params) {
+      // Chapter full-text search is ranked and paginated server-side
+      const q = (params.filter?.q as string | undefined)?.trim();
+      if (resource === "chapters" && q) {
+        const { page, perPage } = params.pagination;
+        const search = new URLSearchParams({
+          q,
+          limit: String(perPage),
+          offset: String((page - 1) * perPage),
+        });
+        if (params.filter.user_id) search.set("user_id", String(params.filter.user_id));
+        const json = await fetchJson(`${apiBase}/search/chapters?${search}`);
+        return {
+          data: json?.results ?? [],
+          pageInfo: { hasNextPage: Boolean(json?.has_more), hasPreviousPage: page > 1 },
+        };
+      }
+
       const url = `${apiBase}/${resource}`;
       const json = await fetchJson(url);
       const all = Array.isArray(json) ? json : [];
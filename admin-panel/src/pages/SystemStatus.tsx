@@ -28,21 +28,55 @@ import ArticleIcon from "@mui/icons-material/Article";
 import MenuBookIcon from "@mui/icons-material/MenuBook";
 import { colors } from "../theme";
 
+// Every probe result carries freshness markers from the background refresher
+type ProbeMeta = { checked_at?: number; age_seconds?: number; stale?: boolean };
+
 type Health = {
   ok: boolean;
-  db?: { ok: boolean; latency_ms?: number; error?: string | null };
-  storage?: { ok: boolean; audio_path?: string; book_path?: string; error?: string | null };
-  smtp?: { configured: boolean; host?: string; port?: number };
-  telegram?: { configured: boolean; ok?: boolean; error?: string };
-  openrouter?: { configured: boolean; base_url?: string; model?: string; ok?: boolean; error?: string };
+  generated_at?: number;
+  db?: ProbeMeta & { ok: boolean; latency_ms?: number; error?: string | null };
+  storage?: ProbeMeta & { ok: boolean; audio_path?: string; book_path?: string; error?: string | null };
+  smtp?: ProbeMeta & { configured: boolean; host?: string; port?: number };
+  telegram?: ProbeMeta & { configured: boolean; ok?: boolean; error?: string };
+  openrouter?: ProbeMeta & { configured: boolean; base_url?: string; model?: string; ok?: boolean; error?: string };
 };
 
+type HealthHistoryEntry = { ts: number; ok: boolean; db_latency_ms?: number };
+
+function checkedLabel(p?: ProbeMeta): string {
+  if (!p || p.age_seconds === undefined) return "—";
+  const age = p.age_seconds < 60 ? `${Math.round(p.age_seconds)}s ago` : `${Math.round(p.age_seconds / 60)}m ago`;
+  return p.stale ? `${age} (stale)` : age;
+}
+
+function latencyTrend(history: HealthHistoryEntry[]): string {
+  const values = history.map((h) => h.db_latency_ms).filter((v): v is number => typeof v === "number");
+  if (!values.length) return "—";
+  const avg = Math.round(values.reduce((a, b) => a + b, 0) / values.length);
+  return `${Math.min(...values)} / ${avg} / ${Math.max(...values)} ms`;
+}
+
 type Stats = {
   users: number;
   chapters: number;
   books: number;
+  chapters_by_status?: Record<string, number>;
+  chapters_by_model?: Record<string, number>;
+  storage_bytes?: Record<string, number> | null;
 };
 
+function formatBytes(n?: number): string {
+  if (n === undefined) return "—";
+  const units = ["B", "KB", "MB", "GB", "TB"];
+  let i = 0;
+  let v = n;
+  while (v >= 1024 && i < units.length - 1) {
+    v /= 1024;
+    i++;
+  }
+  return `${v.toFixed(i ? 1 : 0)} ${units[i]}`;
+}
+
 function getApiBase(): string {
   const fromEnv = (import.meta.env.VITE_API_BASE as string | undefined) || "";
   if (fromEnv) return fromEnv.replace(/\/$/, "");
@@ -169,11 +203,13 @@ function StatsCard({
   value,
   icon,
   color,
+  caption,
 }: {
   title: string;
   value: number;
   icon: React.ReactNode;
   color: string;
+  caption?: string;
 }) {
   return (
     <Card
@@ -214,6 +250,11 @@ function StatsCard({
             >
               {value}
             </Typography>
+            {caption && (
+              <Typography variant="caption" sx={{ color: colors.text.secondary }}>
+                {caption}
+              </Typography>
+            )}
           </Box>
           <Box
             sx={{
@@ -258,6 +299,7 @@ function InfoRow({ label, value }: { label: string; value: string | number | und
 export default function SystemStatus() {
   const [data, setData] = useState<Health | null>(null);
   const [stats, setStats] = useState<Stats | null>(null);
+  const [history, setHistory] = useState<HealthHistoryEntry[]>([]);
   const [loading, setLoading] = useState(true);
   const [seeding, setSeeding] = useState(false);
   const [clearing, setClearing] = useState(false);
@@ -269,9 +311,10 @@ export default function SystemStatus() {
       const apiBase = getApiBase();
 
       // Fetch health and stats in parallel
-      const [healthRes, statsRes] = await Promise.all([
+      const [healthRes, statsRes, historyRes] = await Promise.all([
         fetch(`${apiBase}/admin/health`, { headers: getAdminHeaders() }),
         fetch(`${apiBase}/admin/stats`, { headers: getAdminHeaders() }),
+        fetch(`${apiBase}/admin/health/history?limit=60`, { headers: getAdminHeaders() }),
       ]);
 
       if (healthRes.ok) {
@@ -280,6 +323,9 @@ export default function SystemStatus() {
       if (statsRes.ok) {
         setStats((await statsRes.json()) as Stats);
       }
+      if (historyRes.ok) {
+        setHistory((await historyRes.json()) as HealthHistoryEntry[]);
+      }
     } catch (e: any) {
       notify(e?.message || "Failed to load system status", { type: "error" });
     } finally {
@@ -424,6 +470,7 @@ export default function SystemStatus() {
                   value={stats.chapters}
                   icon={<ArticleIcon sx={{ fontSize: 32 }} />}
                   color={colors.accent.gold}
+                  caption={`${stats.chapters_by_status?.pending ?? 0} pending · ${formatBytes(stats.storage_bytes?.audio)} audio`}
                 />
               </Grid>
               <Grid item xs={12} sm={4}>
@@ -432,6 +479,7 @@ export default function SystemStatus() {
                   value={stats.books}
                   icon={<MenuBookIcon sx={{ fontSize: 32 }} />}
                   color={colors.status.polished}
+                  caption={`${formatBytes(stats.storage_bytes?.books)} on disk`}
                 />
               </Grid>
             </Grid>
@@ -483,6 +531,8 @@ export default function SystemStatus() {
                 <ServiceCard title="Database" icon={<StorageIcon />} ok={data.db?.ok}>
                   <InfoRow label="Status" value={data.db?.ok ? "Connected" : "Disconnected"} />
                   <InfoRow label="Latency" value={data.db?.latency_ms ? `${data.db.latency_ms} ms` : "—"} />
+                  <InfoRow label="Min / Avg / Max" value={latencyTrend(history)} />
+                  <InfoRow label="Checked" value={checkedLabel(data.db)} />
                   {data.db?.error && (
                     <Typography variant="body2" sx={{ color: colors.status.error, mt: 1, fontSize: "0.8rem" }}>
                       {data.db.error}
@@ -496,6 +546,7 @@ export default function SystemStatus() {
                 <ServiceCard title="Storage" icon={<FolderIcon />} ok={data.storage?.ok}>
                   <InfoRow label="Audio Path" value={data.storage?.audio_path} />
                   <InfoRow label="Book Path" value={data.storage?.book_path} />
+                  <InfoRow label="Checked" value={checkedLabel(data.storage)} />
                   {data.storage?.error && (
                     <Typography variant="body2" sx={{ color: colors.status.error, mt: 1, fontSize: "0.8rem" }}>
                       {data.storage.error}
@@ -520,6 +571,7 @@ export default function SystemStatus() {
                   {data.telegram?.ok !== undefined && (
                     <InfoRow label="Connection" value={data.telegram.ok ? "OK" : "Failed"} />
                   )}
+                  <InfoRow label="Checked" value={checkedLabel(data.telegram)} />
                   {data.telegram?.error && (
                     <Typography variant="body2" sx={{ color: colors.status.error, mt: 1, fontSize: "0.8rem" }}>
                       {data.telegram.error}
@@ -533,6 +585,7 @@ export default function SystemStatus() {
                 <ServiceCard title="AI Engine (OpenRouter)" icon={<SmartToyIcon />} ok={data.openrouter?.configured}>
                   <InfoRow label="Configured" value={data.openrouter?.configured ? "Yes" : "No"} />
                   <InfoRow label="Model" value={data.openrouter?.model?.split("/").pop()} />
+                  <InfoRow label="Checked" value={checkedLabel(data.openrouter)} />
                   {data.openrouter?.error && (
                     <Typography variant="body2" sx={{ color: colors.status.error, mt: 1, fontSize: "0.8rem" }}>
                       {data.openrouter.error}
@@ -46,6 +46,8 @@ import { useState, useRef } from "react";
 const statusChoices = [
   { id: "pending", name: "Pending" },
   { id: "polished", name: "Polished" },
+  { id: "failed", name: "Failed" },
+  { id: "duplicate", name: "Duplicate" },
 ];
 
 // Status chip with color coding
@@ -185,6 +187,27 @@ function ChapterTitleField() {
         <MicIcon sx={{ fontSize: 12 }} />
         Segment {record.segment_index + 1}
       </Typography>
+      {Array.isArray(record.snippet) && record.snippet.length > 0 && (
+        <Typography
+          variant="caption"
+          component="div"
+          sx={{ color: colors.text.secondary, mt: 0.5, maxWidth: 480 }}
+        >
+          {record.snippet.map((part: { text: string; match: boolean }, i: number) =>
+            part.match ? (
+              <Box
+                key={i}
+                component="mark"
+                sx={{ bgcolor: alpha(colors.accent.gold, 0.35), color: "inherit", px: 0.25, borderRadius: 0.5 }}
+              >
+                {part.text}
+              </Box>
+            ) : (
+              <span key={i}>{part.text}</span>
+            )
+          )}
+        </Typography>
+      )}
     </Box>
   );
 }
@@ -198,6 +221,8 @@ function ChapterListActions() {
   );
 }
 
+const chapterFilters = [<TextInput key="q" source="q" label="Search memories" alwaysOn resettable />];
+
 export function ChapterList() {
   return (
     <Box sx={{ p: { xs: 2, md: 3 } }}>
@@ -227,6 +252,7 @@ export function ChapterList() {
       >
         <List
           actions={<ChapterListActions />}
+          filters={chapterFilters}
           perPage={25}
           sx={{
             "& .RaList-main": { background: "transparent" },
@@ -493,6 +519,11 @@ function ChapterShowHeader() {
       <Typography sx={{ color: "rgba(255,255,255,0.8)" }}>
         Anchor: {record.anchor_prompt || "None"}
       </Typography>
+      {record.last_error && record.status !== "polished" && (
+        <Typography variant="body2" sx={{ color: "rgba(255,255,255,0.9)", mt: 1 }}>
+          Attempt {record.attempts}: {record.last_error}
+        </Typography>
+      )}
     </Box>
   );
 }
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 16 kHz mono is what Whisper resamples to anyway; anything more is wasted upload bytes.
+SAMPLE_RATE = 16000
+NORMALIZE_FORMAT = (os.getenv("AUDIO_NORMALIZE_FORMAT", "opus") or "opus").strip().lower()
+NORMALIZE_TIMEOUT = int(os.getenv("AUDIO_NORMALIZE_TIMEOUT", "300") or "300")
+NORMALIZE_CONCURRENCY = int(os.getenv("AUDIO_NORMALIZE_CONCURRENCY", "0") or "0") or (os.cpu_count() or 2)
+
+_FORMATS = {
+    # ext, codec args
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"]),
+    "flac": (".flac", ["-c:a", "flac"]),
+}
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(NORMALIZE_CONCURRENCY)
+    return _semaphore
+
+
+def normalized_suffix() -> str:
+    return _FORMATS.get(NORMALIZE_FORMAT, _FORMATS["opus"])[0]
+
+
+def normalized_key(original_key: str) -> str:
+    """Key of the normalized sibling, stored next to the original (same shard)."""
+    return f"{os.path.splitext(original_key)[0]}.16k{normalized_suffix()}"
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+async def normalize_audio(src_path: str) -> Optional[str]:
+    """
+    Transcode an upload to 16 kHz mono Opus (or FLAC) with ffmpeg.
+    At most NORMALIZE_CONCURRENCY ffmpeg processes run at once.
+    Returns the path of a temp file the caller must remove, or None on failure.
+    """
+    if not ffmpeg_available():
+        logger.warning("ffmpeg not found, skipping audio normalization")
+        return None
+
+    ext, codec_args = _FORMATS.get(NORMALIZE_FORMAT, _FORMATS["opus"])
+    fd, out_path = tempfile.mkstemp(suffix=ext)
+    os.close(fd)
+    cmd = [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", src_path,
+        "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        *codec_args,
+        out_path,
+    ]
+
+    async with _get_semaphore():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=NORMALIZE_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logger.error(f"ffmpeg timed out after {NORMALIZE_TIMEOUT}s on {src_path}")
+            os.remove(out_path)
+            return None
+
+    if proc.returncode != 0 or os.path.getsize(out_path) == 0:
+        logger.error(f"ffmpeg failed on {src_path}: {stderr.decode(errors='replace')[:300]}")
+        os.remove(out_path)
+        return None
+
+    logger.info(
+        f"Normalized {src_path}: {os.path.getsize(src_path)} -> {os.path.getsize(out_path)} bytes"
+    )
+    return out_path
+
@@ -0,0 +1,158 @@
+"""
+Offline simulation of the polish planner over historic chapters.
+
+Replays the transcripts of the most recent chapters through
+planner_service.make_plan() and compares it to the old behaviour (one call to
+OPENROUTER_MODEL with max_tokens=2000): predicted chapter latency (p50/p95),
+chapters with a call over 60 s (the read timeout of the old unstreamed
+request) or truncated by max_tokens, and tokens and cost per model.
+Throughput per model comes from the AI call ledger when it has enough
+samples, else PLANNER_DEFAULT_TOKENS_PER_SECOND. Chapters that
+were polished also calibrate the expected output length.
+
+Nothing is sent to a model and nothing is written. Prices are USD per million
+input/output tokens; models without a price count tokens only.
+
+    cd backend-api && DATABASE_URL=... POLISH_FAST_MODEL=... python benchmarks/bench_planner.py \
+        [chapters] [--price openai/gpt-5.2=1.25:10] [--price openai/gpt-4o-mini=0.15:0.6]
+"""
+
+import os
+import statistics
+import sys
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+
+from db import SessionLocal  # noqa: E402
+from models import Chapter  # noqa: E402
+from planner_service import (  # noqa: E402
+    LEGACY_MAX_TOKENS,
+    estimate_tokens,
+    expected_output_chars,
+    expected_output_tokens,
+    load_throughput,
+    make_plan,
+    predict_seconds,
+)
+from services.ai_service import OPENROUTER_MODEL, SLUMDOG_SYSTEM_PROMPT  # noqa: E402
+
+READ_TIMEOUT_SECONDS = 60
+PROMPT_OVERHEAD_TOKENS = 300  # user prompt template around the transcript
+
+
+def parse_prices(args: List[str]) -> Dict[str, Tuple[float, float]]:
+    prices = {}
+    for i, arg in enumerate(args):
+        if arg == "--price" and i + 1 < len(args):
+            model, _, rate = args[i + 1].partition("=")
+            per_in, _, per_out = rate.partition(":")
+            prices[model] = (float(per_in), float(per_out or per_in))
+    return prices
+
+
+def pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Tally:
+    def __init__(self) -> None:
+        self.seconds: List[float] = []
+        self.timeouts = 0
+        self.truncated = 0
+        self.calls = 0
+        self.tokens: Dict[str, List[int]] = {}  # model -> [input, output]
+
+    def add(self, model: str, seconds: float, calls: int, tokens_in: int, tokens_out: int) -> None:
+        self.seconds.append(seconds)
+        self.calls += calls
+        totals = self.tokens.setdefault(model, [0, 0])
+        totals[0] += tokens_in
+        totals[1] += tokens_out
+
+    def cost(self, prices: Dict[str, Tuple[float, float]]) -> float:
+        return sum(
+            tokens_in / 1e6 * prices[model][0] + tokens_out / 1e6 * prices[model][1]
+            for model, (tokens_in, tokens_out) in self.tokens.items()
+            if model in prices
+        )
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    positional = [a for i, a in enumerate(args) if not a.startswith("--") and (i == 0 or args[i - 1] != "--price")]
+    limit = int(positional[0]) if positional else 10_000
+    prices = parse_prices(args)
+
+    db = SessionLocal(replica_reads=True)
+    try:
+        stats = load_throughput(db)
+        chapters = db.execute(
+            select(Chapter.transcript_text, Chapter.polished_text)
+            .where(Chapter.transcript_text.isnot(None), Chapter.transcript_text != "")
+            .order_by(Chapter.id.desc())
+            .limit(limit)
+        ).all()
+    finally:
+        db.close()
+    if not chapters:
+        sys.exit("no chapters with a transcript to simulate")
+
+    system_tokens = estimate_tokens(SLUMDOG_SYSTEM_PROMPT) + PROMPT_OVERHEAD_TOKENS
+    baseline, planned = Tally(), Tally()
+    strategies: Dict[str, int] = {}
+    ratios: List[float] = []
+    for transcript, polished in chapters:
+        expected = expected_output_tokens(transcript)
+        if polished and polished != transcript:
+            ratios.append(len(polished) / expected_output_chars(len(transcript)))
+
+        output = min(expected, LEGACY_MAX_TOKENS)
+        seconds = predict_seconds(OPENROUTER_MODEL, output, stats)
+        baseline.add(OPENROUTER_MODEL, seconds, 1, system_tokens + estimate_tokens(transcript), output)
+        baseline.truncated += expected > LEGACY_MAX_TOKENS
+        baseline.timeouts += seconds > READ_TIMEOUT_SECONDS
+
+        plan = make_plan(transcript, stats=stats)
+        key = f"{plan.tier}/{plan.strategy}"
+        strategies[key] = strategies.get(key, 0) + 1
+        outputs = [expected_output_tokens(c) for c in plan.chunks]
+        planned.add(
+            plan.model,
+            plan.predicted_seconds,
+            len(plan.chunks),
+            sum(system_tokens + estimate_tokens(c) for c in plan.chunks),
+            sum(min(o, plan.max_tokens) for o in outputs),
+        )
+        planned.truncated += any(o > plan.max_tokens for o in outputs)
+        # Counted per call; parts of a chunked plan are separate calls
+        slowest_call = predict_seconds(plan.model, min(max(outputs), plan.max_tokens), stats)
+        planned.timeouts += slowest_call > READ_TIMEOUT_SECONDS
+
+    print(f"chapters simulated: {len(chapters)}")
+    for model, t in stats.items():
+        print(f"throughput {model}: {t.tokens_per_second} tok/s, first token {t.first_token_seconds}s ({t.samples} calls)")
+    if not stats:
+        print("throughput: defaults (the ledger has too few samples)")
+    print("plans:", dict(sorted(strategies.items())))
+    if ratios:
+        print(f"actual / expected output length: median {statistics.median(ratios):.2f} over {len(ratios)} polished chapters")
+    print()
+    print(f"{'':<10} {'p50 s':>7} {'p95 s':>7} {'calls':>7} {'>60s':>6} {'trunc':>6} {'cost $':>9}")
+    for label, tally in (("baseline", baseline), ("planned", planned)):
+        print(
+            f"{label:<10} {pct(tally.seconds, 0.5):7.1f} {pct(tally.seconds, 0.95):7.1f} {tally.calls:7d} "
+            f"{tally.timeouts:6d} {tally.truncated:6d} {tally.cost(prices):9.2f}"
+        )
+    for label, tally in (("baseline", baseline), ("planned", planned)):
+        for model, (tokens_in, tokens_out) in sorted(tally.tokens.items()):
+            print(f"  {label:<8} {model:<40} in {tokens_in:>10,} out {tokens_out:>10,}")
+
+
+if __name__ == "__main__":
+    main()
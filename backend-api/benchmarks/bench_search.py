@@ -0,0 +1,132 @@
+"""
+Latency of /search/chapters on Postgres with the pg_trgm index, at scale.
+
+Seeds N synthetic chapters (mixed Chinese/English memoir text) under a
+throwaway user, runs ANALYZE, then times search_chapters() for substring,
+Chinese, fuzzy (typo) and rare queries. Needs a Postgres DATABASE_URL with
+permission to CREATE EXTENSION pg_trgm; the bench user and its chapters are
+deleted afterwards unless --keep is given.
+
+    cd backend-api && DATABASE_URL=postgresql://... python benchmarks/bench_search.py [rows] [--keep]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from db import SessionLocal, engine  # noqa: E402
+from models import Chapter, User  # noqa: E402
+from schema_service import ensure_schema  # noqa: E402
+from search_service import SEARCH_DOCUMENT_SQL, search_chapters  # noqa: E402
+
+BENCH_EMAIL = "bench-search@example.com"
+BATCH = 5000
+TARGET_MS = 100
+
+ZH = ["我记得", "小时候", "外婆家", "院子里", "那年冬天", "父亲", "母亲", "学校", "火车站", "听诊器", "下雨", "稻田", "老房子", "邻居"]
+EN = ["summer", "kitchen", "river", "factory", "letter", "bicycle", "wedding", "harbor", "garden", "winter", "market"]
+# Rare phrases planted in a small fraction of rows
+RARE = {"the ambulance siren": 0.002, "救护车的警笛": 0.002}
+
+QUERIES = [
+    ("english substring", "bicycle"),
+    ("chinese substring", "外婆家"),
+    ("rare phrase", "the ambulance siren"),
+    ("rare chinese", "救护车的警笛"),
+    ("fuzzy typo", "ambulence siren"),
+    ("user scoped", "river"),
+]
+
+
+def fake_text(rng: random.Random, sentences: int) -> str:
+    out = []
+    for _ in range(sentences):
+        if rng.random() < 0.7:
+            out.append("".join(rng.choice(ZH) for _ in range(rng.randint(3, 7))) + "。")
+        else:
+            out.append(" ".join(rng.choice(EN) for _ in range(rng.randint(4, 9))).capitalize() + ". ")
+    for phrase, p in RARE.items():
+        if rng.random() < p:
+            out.insert(rng.randrange(len(out) + 1), phrase)
+    return "".join(out)
+
+
+def seed(rows: int) -> int:
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE email = :e"), {"e": BENCH_EMAIL})
+        user_id = conn.execute(insert(User).values(name="bench", email=BENCH_EMAIL).returning(User.id)).scalar_one()
+        for start in range(0, rows, BATCH):
+            conn.execute(
+                insert(Chapter),
+                [
+                    {
+                        "user_id": user_id,
+                        "title": f"{rng.choice(ZH)} {rng.choice(EN)} {i}",
+                        "anchor_prompt": rng.choice(EN).title(),
+                        "segment_index": i,
+                        "transcript_text": fake_text(rng, 12),
+                        "polished_text": fake_text(rng, 20),
+                        "status": "polished",
+                    }
+                    for i in range(start, min(rows, start + BATCH))
+                ],
+            )
+            print(f"  seeded {min(rows, start + BATCH)}/{rows}", end="\r", flush=True)
+        conn.execute(text("ANALYZE chapters"))
+    print()
+    return user_id
+
+
+def time_query(q: str, user_id, repeat: int = 7):
+    timings = []
+    hits = 0
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            hits = len(search_chapters(db, q, user_id=user_id, limit=20)["results"])
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    return statistics.median(timings), max(timings), hits
+
+
+def main() -> None:
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    rows = int(args[0]) if args else 100_000
+    keep = "--keep" in sys.argv
+    if engine.dialect.name != "postgresql":
+        sys.exit("bench_search needs a Postgres DATABASE_URL (pg_trgm)")
+
+    ensure_schema(engine)
+    print(f"seeding {rows} chapters ...")
+    user_id = seed(rows)
+    try:
+        print(f"{'query':<20} {'median ms':>10} {'max ms':>8} {'hits':>5}")
+        worst = 0.0
+        for label, q in QUERIES:
+            median, worst_run, hits = time_query(q, user_id if label == "user scoped" else None)
+            worst = max(worst, median)
+            print(f"{label:<20} {median:10.1f} {worst_run:8.1f} {hits:5d}")
+        with engine.connect() as conn:
+            plan = conn.execute(
+                text(f"EXPLAIN SELECT id FROM chapters WHERE {SEARCH_DOCUMENT_SQL} ILIKE :p"),
+                {"p": "%the ambulance siren%"},
+            ).scalars().all()
+        print("index used:", any("ix_chapters_search_trgm" in line for line in plan))
+        print(f"slowest median {worst:.1f} ms ({'OK' if worst < TARGET_MS else 'over'} the {TARGET_MS} ms target)")
+    finally:
+        if not keep:
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-row cost of list serialization: ORM + pydantic (from_attributes) + stdlib
+json versus column select + orjson, on an in-memory SQLite database.
+
+    cd backend-api && python benchmarks/bench_serialization.py [rows]
+"""
+
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import db as db_module  # noqa: E402
+
+# One shared in-memory connection so the schema and rows are visible everywhere
+db_module.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+db_module.SessionLocal.configure(bind=db_module.engine)
+
+from models import Base, Chapter, User  # noqa: E402
+from main import ChapterOut  # noqa: E402
+from serialization import json_response, out_columns  # noqa: E402
+
+
+def seed(rows: int) -> None:
+    Base.metadata.create_all(bind=db_module.engine)
+    with db_module.engine.begin() as conn:
+        conn.execute(insert(User), [{"name": "bench", "email": "bench@example.com"}])
+        text = "我记得那个听诊器。" * 60
+        conn.execute(
+            insert(Chapter),
+            [
+                {
+                    "user_id": 1,
+                    "title": f"Chapter {i}",
+                    "anchor_prompt": "The Stethoscope",
+                    "segment_index": i,
+                    "audio_url": f"ab/cd/{i:032x}.webm",
+                    "transcript_text": text,
+                    "polished_text": text * 2,
+                    "polished_by_model": "bench/model",
+                    "status": "polished",
+                }
+                for i in range(rows)
+            ],
+        )
+
+
+def legacy_path() -> bytes:
+    db = db_module.SessionLocal()
+    try:
+        chapters = db.query(Chapter).order_by(Chapter.segment_index).all()
+        adapter = TypeAdapter(List[ChapterOut])
+        data = adapter.dump_python(adapter.validate_python(chapters), mode="json")
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+    finally:
+        db.close()
+
+
+def fast_path() -> bytes:
+    db = db_module.SessionLocal()
+    try:
+        rows = db.execute(select(*out_columns(Chapter, ChapterOut)).order_by(Chapter.segment_index)).mappings()
+        return json_response(rows).body
+    finally:
+        db.close()
+
+
+def timeit(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    seed(rows)
+    legacy = timeit(legacy_path)
+    fast = timeit(fast_path)
+    print(f"rows: {rows}")
+    print(f"ORM + pydantic + json : {legacy * 1000:8.1f} ms  ({legacy / rows * 1e6:6.1f} us/row)")
+    print(f"columns + orjson      : {fast * 1000:8.1f} ms  ({fast / rows * 1e6:6.1f} us/row)")
+    print(f"speedup               : {legacy / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Cold-start cost of the API: importing `main`, the one-shot prestart (schema)
+step, and time until a fresh server answers /livez and /readyz, for a single
+uvicorn process and for gunicorn with N workers. Also times SIGTERM-to-exit,
+and what importing a module still costs once `main` is loaded: gunicorn
+preloads `main` in the master, so anything imported later is paid again by
+every worker (on its first AI call, say) instead of once before the fork.
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+
+    cd backend-api && python benchmarks/bench_startup.py [repeats] [workers]
+"""
+
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    if not env.get("DATABASE_URL"):
+        env["DATABASE_URL"] = f"sqlite:///{tempfile.gettempdir()}/bench-startup.sqlite"
+    env.setdefault("STORAGE_AUDIO_PATH", os.path.join(tempfile.gettempdir(), "bench-startup", "audio"))
+    env.setdefault("STORAGE_BOOK_PATH", os.path.join(tempfile.gettempdir(), "bench-startup", "books"))
+    env["PYTHONPATH"] = HERE
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_import(repeat: int) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    runs = [
+        float(subprocess.check_output([sys.executable, "-c", code], cwd=HERE, env=_env()).decode().strip())
+        for _ in range(repeat)
+    ]
+    return statistics.median(runs)
+
+
+DEFERRED_MODULES = ("httpx", "boto3")
+
+
+def time_after_main(module: str, repeat: int) -> float:
+    """Median seconds to import `module` in a process that has already imported main."""
+    code = f"import time, main; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], cwd=HERE, env=_env(), capture_output=True, text=True)
+        if result.returncode != 0:
+            return float("nan")  # not installed
+        runs.append(float(result.stdout.strip()))
+    return statistics.median(runs)
+
+
+def time_prestart() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "prestart.py"], cwd=HERE, env=_env(), check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def _wait_for(url: str, deadline: float) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as r:
+                if r.status == 200:
+                    return True
+        except Exception:
+            time.sleep(0.02)
+    return False
+
+
+def time_server(cmd: list, port: int):
+    """(seconds to /livez, seconds to /readyz, seconds from SIGTERM to exit)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not _wait_for(f"{base}/livez", start + 60):
+            raise RuntimeError(f"server did not start: {' '.join(cmd)}")
+        live = time.perf_counter() - start
+        _wait_for(f"{base}/readyz", start + 60)
+        ready = time.perf_counter() - start
+    finally:
+        stop = time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+    return live, ready, time.perf_counter() - stop
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print(f"{'prestart (schema)':<24}: {time_prestart() * 1000:6.0f} ms")
+    print(f"{f'import main (median {repeat})':<24}: {time_import(repeat) * 1000:6.0f} ms")
+    for module in DEFERRED_MODULES:
+        print(f"{f'  then import {module}':<24}: {time_after_main(module, repeat) * 1000:6.0f} ms")
+
+    servers = {
+        "uvicorn, 1 process": lambda port: [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        f"gunicorn, {workers} workers": lambda port: [
+            sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+        ],
+    }
+    for label, build in servers.items():
+        results = [time_server(build(port), port) for port in (_free_port() for _ in range(repeat))]
+        live, ready, stop = (statistics.median(r[i] for r in results) for i in range(3))
+        print(f"{label:<24}: live {live * 1000:6.0f} ms, ready {ready * 1000:6.0f} ms, SIGTERM->exit {stop * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
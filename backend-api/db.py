@@ -1,6 +1,8 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import CompoundSelect, Select, create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from replica_service import pick_replica
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -8,4 +10,40 @@ DATABASE_URL = os.getenv(
 )
 
 engine = create_engine(DATABASE_URL, future=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _replica_safe(clause) -> bool:
+    """Plain SELECTs, and raw SQL explicitly marked execution_options(replica_ok=True)."""
+    if isinstance(clause, (Select, CompoundSelect)):
+        return clause._for_update_arg is None
+    return clause is not None and bool(clause.get_execution_options().get("replica_ok"))
+
+
+class RoutingSession(Session):
+    """
+    Session that can send reads to a read replica (replica_reads=True).
+
+    Writes, flushes, SELECT ... FOR UPDATE and unmarked raw SQL go to the
+    primary, and from then on the whole session stays there, so a request reads
+    its own writes. Reads use one replica per session for a consistent view;
+    without a healthy replica they go to the primary.
+    """
+
+    def __init__(self, *args, replica_reads: bool = False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.replica_reads = replica_reads
+        self._replica = None
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if self.replica_reads:
+            if not self._flushing and _replica_safe(clause):
+                if self._replica is None:
+                    self._replica = pick_replica()
+                if self._replica is not None:
+                    return self._replica
+            else:
+                self.replica_reads = False
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,248 @@
+"""
+Near-duplicate transcripts: MinHash signatures with an LSH index.
+
+Storytellers often retell the same story in several uploads. Each transcript
+is reduced to its set of DEDUP_SHINGLE_CHARS-character shingles (after NFKC,
+lowercasing and dropping everything but letters and digits, so it works for
+Chinese without word segmentation) and summarized by a MinHash signature of
+DEDUP_BANDS x DEDUP_ROWS values. The share of equal values between two
+signatures estimates the Jaccard similarity of their shingle sets.
+
+Signatures are stored as packed uint32 arrays (chapter_signatures). For
+lookup each signature is cut into bands; a band's values hash to one bucket
+(chapter_lsh_buckets, indexed by user and bucket). Chapters sharing at least
+one bucket with a transcript are its candidates, so a query reads a handful
+of index entries instead of every chapter of the user; candidates are then
+scored on their signatures and kept at DEDUP_THRESHOLD or above. With 40
+bands of 3 rows a pair at 0.4 similarity becomes a candidate 93% of the time,
+at 0.6 almost surely, and an unrelated chapter (~0.15) about 13% of the time.
+
+The index is maintained on write: whenever a chapter's transcript is set or
+changed (index_chapter) and removed with the chapter (ON DELETE CASCADE).
+Chapters written in bulk (synthetic data, rows from before this index) are
+added by reindex(). Changing the shingle or band settings needs a reindex.
+"""
+
+import hashlib
+import os
+import random
+import sys
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import Chapter, ChapterLSHBucket, ChapterSignature
+
+
+def _bool_env(name: str, default: bool = False) -> bool:
+    val = (os.getenv(name, "") or "").strip().lower()
+    if not val:
+        return default
+    return val in ("1", "true", "yes", "y", "on")
+
+
+DEDUP_ENABLED = _bool_env("DEDUP_ENABLED", True)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.4") or "0.4")
+# Character bigrams suit Chinese (a retelling scores ~0.45, an unrelated story ~0.15);
+# alphabetic languages need longer shingles (~5)
+DEDUP_SHINGLE_CHARS = int(os.getenv("DEDUP_SHINGLE_CHARS", "2") or "2")
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "40") or "40")
+DEDUP_ROWS = int(os.getenv("DEDUP_ROWS", "3") or "3")
+NUM_PERM = DEDUP_BANDS * DEDUP_ROWS
+MAX_CANDIDATES = 50
+REINDEX_BATCH_SIZE = 500
+
+_PRIME = (1 << 61) - 1
+_MASK32 = 0xFFFFFFFF
+# Fixed seed: signatures must be comparable across workers and deploys
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in "LN")
+
+
+def shingles(text: str, k: int = DEDUP_SHINGLE_CHARS) -> set:
+    norm = normalize(text)
+    if len(norm) <= k:
+        return {norm} if norm else set()
+    return {norm[i : i + k] for i in range(len(norm) - k + 1)}
+
+
+def _hash64(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def signature(text: Optional[str]) -> Optional[array]:
+    """MinHash signature of the text's shingles (NUM_PERM uint32 values), None for empty text."""
+    hashes = [_hash64(s.encode("utf-8")) for s in shingles(text or "")]
+    if not hashes:
+        return None
+    return array("I", (min((a * h + b) % _PRIME for h in hashes) & _MASK32 for a, b in _PERMUTATIONS))
+
+
+def pack(sig: array) -> bytes:
+    if sys.byteorder == "big":
+        sig = array("I", sig)
+        sig.byteswap()
+    return sig.tobytes()
+
+
+def unpack(data: bytes) -> array:
+    sig = array("I")
+    sig.frombytes(data)
+    if sys.byteorder == "big":
+        sig.byteswap()
+    return sig
+
+
+def band_buckets(sig: array) -> List[int]:
+    """One signed 64-bit bucket per band (the band number is hashed in, so one index serves all bands)."""
+    buckets = []
+    for band in range(DEDUP_BANDS):
+        rows = array("I", sig[band * DEDUP_ROWS : (band + 1) * DEDUP_ROWS])
+        bucket = _hash64(band.to_bytes(2, "little") + pack(rows))
+        buckets.append(bucket - (1 << 64) if bucket >= 1 << 63 else bucket)
+    return buckets
+
+
+def similarity(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of the two transcripts' shingle sets."""
+    if len(a) != len(b) or not a:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+# --- index maintenance ------------------------------------------------------------------
+
+
+def store_signature(db: Session, chapter: Chapter, sig: Optional[array]) -> None:
+    """Replace the chapter's index entries (none for an empty transcript). The caller commits."""
+    db.execute(delete(ChapterLSHBucket).where(ChapterLSHBucket.chapter_id == chapter.id))
+    db.execute(delete(ChapterSignature).where(ChapterSignature.chapter_id == chapter.id))
+    if sig is None:
+        return
+    db.execute(insert(ChapterSignature).values(chapter_id=chapter.id, user_id=chapter.user_id, signature=pack(sig)))
+    db.execute(
+        insert(ChapterLSHBucket),
+        [
+            {"chapter_id": chapter.id, "band": band, "user_id": chapter.user_id, "bucket": bucket}
+            for band, bucket in enumerate(band_buckets(sig))
+        ],
+    )
+
+
+def index_chapter(db: Session, chapter: Chapter) -> Optional[array]:
+    """(Re-)index the chapter's current transcript; returns its signature."""
+    sig = signature(chapter.transcript_text)
+    store_signature(db, chapter, sig)
+    return sig
+
+
+def reindex(db: Session, user_id: Optional[int] = None, only_missing: bool = True) -> Dict[str, int]:
+    """Index chapters in batches: those without a signature, or all of them."""
+    indexed = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(Chapter)
+            .where(Chapter.id > last_id, Chapter.transcript_text.isnot(None))
+            .order_by(Chapter.id)
+            .limit(REINDEX_BATCH_SIZE)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Chapter.user_id == user_id)
+        if only_missing:
+            indexed_already = select(ChapterSignature.chapter_id).where(ChapterSignature.chapter_id == Chapter.id)
+            stmt = stmt.where(~indexed_already.exists())
+        chapters = list(db.execute(stmt).scalars())
+        if not chapters:
+            return {"indexed": indexed}
+        for chapter in chapters:
+            index_chapter(db, chapter)
+        db.commit()
+        indexed += len(chapters)
+        last_id = chapters[-1].id
+        db.expunge_all()
+
+
+# --- queries ------------------------------------------------------------------------------
+
+
+def find_similar(
+    db: Session,
+    user_id: int,
+    sig: array,
+    exclude_id: Optional[int] = None,
+    threshold: float = DEDUP_THRESHOLD,
+    limit: int = 5,
+) -> List[Tuple[int, float]]:
+    """(chapter_id, similarity) of the user's chapters at `threshold` or above, most similar first."""
+    stmt = (
+        select(ChapterLSHBucket.chapter_id)
+        .where(ChapterLSHBucket.user_id == user_id, ChapterLSHBucket.bucket.in_(band_buckets(sig)))
+        .group_by(ChapterLSHBucket.chapter_id)
+        # Most shared bands first: the likeliest matches when a user has many candidates
+        .order_by(func.count().desc())
+        .limit(MAX_CANDIDATES)
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(ChapterLSHBucket.chapter_id != exclude_id)
+    candidates = list(db.execute(stmt).scalars())
+    if not candidates:
+        return []
+    rows = db.execute(
+        select(ChapterSignature.chapter_id, ChapterSignature.signature).where(ChapterSignature.chapter_id.in_(candidates))
+    ).all()
+    scored = [(chapter_id, round(similarity(sig, unpack(data)), 3)) for chapter_id, data in rows]
+    return sorted((s for s in scored if s[1] >= threshold), key=lambda s: -s[1])[:limit]
+
+
+def find_polished_duplicate(db: Session, chapter: Chapter, sig: Optional[array]) -> Optional[Tuple[int, float]]:
+    """(chapter_id, similarity) of the user's most similar polished chapter at DEDUP_THRESHOLD or above, if any."""
+    if sig is None:
+        return None
+    matches = find_similar(db, chapter.user_id, sig, exclude_id=chapter.id, limit=MAX_CANDIDATES)
+    if not matches:
+        return None
+    polished = set(
+        db.execute(
+            select(Chapter.id).where(
+                Chapter.id.in_([chapter_id for chapter_id, _ in matches]),
+                Chapter.status == "polished",
+                Chapter.polished_text.isnot(None),
+                Chapter.polished_text != "",
+            )
+        ).scalars()
+    )
+    # matches are most similar first
+    return next(((chapter_id, score) for chapter_id, score in matches if chapter_id in polished), None)
+
+
+def similar_chapters(db: Session, chapter: Chapter, threshold: float, limit: int) -> List[Dict[str, Any]]:
+    data = db.execute(
+        select(ChapterSignature.signature).where(ChapterSignature.chapter_id == chapter.id)
+    ).scalar_one_or_none()
+    sig = unpack(data) if data is not None else signature(chapter.transcript_text)
+    if sig is None:
+        return []
+    matches = find_similar(db, chapter.user_id, sig, exclude_id=chapter.id, threshold=threshold, limit=limit)
+    titles = _titles(db, (chapter_id for chapter_id, _ in matches))
+    return [
+        {"chapter_id": chapter_id, "similarity": score, **titles[chapter_id]}
+        for chapter_id, score in matches
+        if chapter_id in titles
+    ]
+
+
+def _titles(db: Session, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    ids = list(ids)
+    if not ids:
+        return {}
+    rows = db.execute(select(Chapter.id, Chapter.title, Chapter.status).where(Chapter.id.in_(ids))).all()
+    return {row.id: {"title": row.title, "status": row.status} for row in rows}
@@ -0,0 +1,228 @@
+"""
+Chapter change events, pushed to clients over Server-Sent Events.
+
+Writers call publish_chapter()/publish_chapter_deleted() (or
+publish_chapters_deleted() for a whole user's chapters) inside their DB
+transaction. On Postgres the event is a NOTIFY on CHANNEL carrying only ids
+(payloads are capped at 8000 bytes), delivered on commit to every API worker;
+each worker's listener loads the changed chapter once and fans it out to its
+own SSE subscribers. On other databases events are dispatched in-process.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, engine
+from models import Chapter
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "bioweaver_chapters"
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+# Batched deletion ids per NOTIFY, well under the 8000-byte payload cap
+DELETED_IDS_PER_NOTIFY = 500
+
+
+class Subscriber:
+    def __init__(self, user_id: Optional[int]) -> None:
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+
+_subscribers: Set[Subscriber] = set()
+_serializer: Optional[Callable[[Chapter], Dict[str, Any]]] = None
+
+
+def _use_notify() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def set_serializer(fn: Callable[[Chapter], Dict[str, Any]]) -> None:
+    """Register how a Chapter row becomes the JSON sent to clients (the API's ChapterOut)."""
+    global _serializer
+    _serializer = fn
+
+
+def subscribe(user_id: Optional[int] = None) -> Subscriber:
+    sub = Subscriber(user_id)
+    _subscribers.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    _subscribers.discard(sub)
+
+
+def close_all() -> None:
+    """End every open stream (worker shutdown); EventSource clients reconnect on their own."""
+    for sub in list(_subscribers):
+        sub.closed = True
+        try:
+            sub.queue.put_nowait({"type": "close"})  # wake the waiting stream
+        except asyncio.QueueFull:
+            pass  # not waiting: it sees `closed` on its next turn
+        unsubscribe(sub)
+
+
+def _dispatch(event: Dict[str, Any]) -> None:
+    user_id = event.get("user_id")
+    for sub in list(_subscribers):
+        if sub.user_id is not None and sub.user_id != user_id:
+            continue
+        try:
+            sub.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop it and tell it to resync with a full fetch
+            sub.overflowed = True
+            unsubscribe(sub)
+
+
+def _build_event(kind: str, chapter_id: int, user_id: int, chapter: Optional[Chapter]) -> Dict[str, Any]:
+    event: Dict[str, Any] = {"type": kind, "id": chapter_id, "user_id": user_id}
+    if chapter is not None and _serializer is not None:
+        event["chapter"] = _serializer(chapter)
+    return event
+
+
+def publish_chapter(db: Session, chapter: Chapter) -> None:
+    """Announce a created/updated chapter. Call before db.commit() so it rides the transaction."""
+    if _use_notify():
+        _notify(db, {"type": "chapter", "id": chapter.id, "user_id": chapter.user_id})
+    else:
+        _dispatch(_build_event("chapter", chapter.id, chapter.user_id, chapter))
+
+
+def publish_chapter_deleted(db: Session, chapter_id: int, user_id: int) -> None:
+    if _use_notify():
+        _notify(db, {"type": "deleted", "id": chapter_id, "user_id": user_id})
+    else:
+        _dispatch(_build_event("deleted", chapter_id, user_id, None))
+
+
+def publish_chapters_deleted(db: Session, user_id: int, chapter_ids: Iterable[int]) -> None:
+    """Announce many deletions of one user's chapters, several ids per NOTIFY."""
+    if not _use_notify():
+        for chapter_id in chapter_ids:
+            _dispatch(_build_event("deleted", chapter_id, user_id, None))
+        return
+    batch: List[int] = []
+    for chapter_id in chapter_ids:
+        batch.append(chapter_id)
+        if len(batch) >= DELETED_IDS_PER_NOTIFY:
+            _notify(db, {"type": "deleted", "ids": batch, "user_id": user_id})
+            batch = []
+    if batch:
+        _notify(db, {"type": "deleted", "ids": batch, "user_id": user_id})
+
+
+def _notify(db: Session, payload: Dict[str, Any]) -> None:
+    try:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": json.dumps(payload)})
+    except Exception as e:
+        logger.warning(f"pg_notify failed: {e}")
+
+
+# --- Postgres listener --------------------------------------------------------
+
+
+def _load_event(payload: Dict[str, Any]) -> Dict[str, Any]:
+    chapter = None
+    if payload.get("type") == "chapter":
+        db = SessionLocal()
+        try:
+            chapter = db.query(Chapter).filter(Chapter.id == payload["id"]).first()
+            if chapter is None:
+                # deleted again before we got to it
+                return _build_event("deleted", payload["id"], payload["user_id"], None)
+            return _build_event("chapter", chapter.id, chapter.user_id, chapter)
+        finally:
+            db.close()
+    return _build_event(payload.get("type", "chapter"), payload["id"], payload["user_id"], None)
+
+
+async def _handle_notification(raw: str) -> None:
+    try:
+        payload = json.loads(raw)
+        if not any(s.user_id is None or s.user_id == payload.get("user_id") for s in _subscribers):
+            return  # nobody on this worker cares; skip the DB read
+        if "ids" in payload:  # batched deletions, nothing to load
+            for chapter_id in payload["ids"]:
+                _dispatch(_build_event("deleted", chapter_id, payload["user_id"], None))
+            return
+        _dispatch(await asyncio.to_thread(_load_event, payload))
+    except Exception as e:
+        logger.warning(f"Dropping chapter event {raw!r}: {e}")
+
+
+async def listen_loop() -> None:
+    """Per-worker LISTEN on CHANNEL; reconnects with backoff. No-op off Postgres."""
+    if not _use_notify():
+        return
+    loop = asyncio.get_running_loop()
+    backoff = 1
+    while True:
+        raw_conn = None
+        try:
+            raw_conn = await asyncio.to_thread(engine.raw_connection)
+            dbapi_conn = raw_conn.driver_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            logger.info(f"Listening for chapter events on {CHANNEL}")
+            backoff = 1
+
+            ready = asyncio.Event()
+            loop.add_reader(dbapi_conn.fileno(), ready.set)
+            try:
+                while True:
+                    try:
+                        await asyncio.wait_for(ready.wait(), timeout=60)
+                    except asyncio.TimeoutError:
+                        pass
+                    ready.clear()
+                    dbapi_conn.poll()  # raises if the connection dropped
+                    while dbapi_conn.notifies:
+                        note = dbapi_conn.notifies.pop(0)
+                        asyncio.create_task(_handle_notification(note.payload))
+            finally:
+                loop.remove_reader(dbapi_conn.fileno())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Chapter event listener error: {e}; reconnecting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+        finally:
+            if raw_conn is not None:
+                try:
+                    raw_conn.invalidate()
+                except Exception:
+                    pass
+
+
+async def sse_stream(sub: Subscriber):
+    """Yield SSE frames for one subscriber, with periodic heartbeats."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            if sub.closed:
+                return
+            if sub.overflowed and sub.queue.empty():
+                yield "event: resync\ndata: {}\n\n"
+                return
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+    finally:
+        unsubscribe(sub)
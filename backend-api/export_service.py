@@ -0,0 +1,265 @@
+"""
+Streaming memoir archive for one user.
+
+The archive is a tar file: unlike ZIP it needs no CRCs, so its exact layout
+and byte length follow from metadata alone. That gives a Content-Length up
+front and lets any byte range be produced directly (seeking into the stored
+files), which is what resumable downloads over mobile networks need. Nothing
+is buffered beyond one read chunk and the small generated text entries.
+
+Layout:
+    manifest.json
+    chapters/<segment>-<id>.md      title, anchor, transcript and polished text
+    audio/<chapter id>-<name>       original recordings
+    books/<book id>-<name>          generated books
+"""
+
+import json
+import os
+import tarfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Book, Chapter, User
+from storage_service import CHUNK_SIZE, get_storage, key_from_url
+from sync_service import list_etag, weak_etag
+
+BLOCK = tarfile.BLOCKSIZE
+EXPORT_YIELD_PER = 200
+
+# Plain column rows, not ORM entities: nothing is added to the identity map
+CHAPTER_COLUMNS = (
+    Chapter.id,
+    Chapter.title,
+    Chapter.anchor_prompt,
+    Chapter.segment_index,
+    Chapter.audio_url,
+    Chapter.transcript_text,
+    Chapter.polished_text,
+    Chapter.polished_by_model,
+    Chapter.status,
+    Chapter.created_at,
+    Chapter.updated_at,
+)
+BOOK_COLUMNS = (Book.id, Book.title, Book.description, Book.pdf_url, Book.created_at, Book.updated_at)
+
+
+@dataclass
+class _Entry:
+    name: str
+    size: int
+    mtime: float
+    data: Optional[bytes] = None  # generated content
+    kind: Optional[str] = None  # or a stored object
+    key: Optional[str] = None
+
+    def header(self) -> bytes:
+        info = tarfile.TarInfo(self.name)
+        info.size = self.size
+        info.mtime = int(self.mtime)
+        info.mode = 0o644
+        return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def _ts(value: Optional[datetime]) -> float:
+    return value.timestamp() if value else 0.0
+
+
+def _chapter_markdown(ch: Any) -> bytes:
+    parts = [f"# {ch.title}\n"]
+    if ch.anchor_prompt:
+        parts.append(f"\n> {ch.anchor_prompt}\n")
+    if ch.polished_text:
+        parts.append(f"\n## Polished\n\n{ch.polished_text}\n")
+    if ch.transcript_text:
+        parts.append(f"\n## Transcript\n\n{ch.transcript_text}\n")
+    return "".join(parts).encode("utf-8")
+
+
+def _media_entry(kind: str, url: Optional[str], prefix: str, mtime: float) -> Optional[_Entry]:
+    if not url:
+        return None
+    key = key_from_url(kind, url)
+    size = get_storage().size(kind, key) if key else None
+    if size is None:
+        return None
+    return _Entry(name=f"{kind}/{prefix}-{os.path.basename(key)}", size=size, mtime=mtime, kind=kind, key=key)
+
+
+class UserArchive:
+    """Precomputed layout of one user's archive; stream(start, end) yields any byte range."""
+
+    def __init__(self, entries: List[_Entry]) -> None:
+        self.entries = entries
+        self.segments: List[Tuple[int, _Entry, bytes]] = []  # (offset, entry, header)
+        offset = 0
+        for entry in entries:
+            header = entry.header()
+            self.segments.append((offset, entry, header))
+            offset += len(header) + entry.size + (-entry.size % BLOCK)
+        self.data_end = offset
+        self.size = offset + 2 * BLOCK  # end-of-archive marker
+
+    def _entry_bytes(self, entry: _Entry, skip: int) -> Iterator[bytes]:
+        """Entry payload from byte `skip`, always exactly entry.size - skip bytes."""
+        remaining = entry.size - skip
+        if entry.data is not None:
+            yield entry.data[skip:]
+            return
+        try:
+            for chunk in get_storage().get_stream(entry.kind, entry.key, CHUNK_SIZE, offset=skip):
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+                if remaining <= 0:
+                    break
+        except FileNotFoundError:
+            pass
+        if remaining > 0:
+            # object shrank or vanished after the layout was computed; keep the tar valid
+            yield b"\0" * remaining
+
+    def _pieces(self, start: int) -> Iterator[bytes]:
+        for offset, entry, header in self.segments:
+            padding = -entry.size % BLOCK
+            seg_end = offset + len(header) + entry.size + padding
+            if seg_end <= start:
+                continue
+            pos = max(0, start - offset)
+            if pos < len(header):
+                yield header[pos:]
+                pos = len(header)
+            data_pos = pos - len(header)
+            if data_pos < entry.size:
+                yield from self._entry_bytes(entry, data_pos)
+                data_pos = entry.size
+            pad_pos = data_pos - entry.size
+            if pad_pos < padding:
+                yield b"\0" * (padding - pad_pos)
+        tail_start = max(0, start - self.data_end)
+        yield b"\0" * (2 * BLOCK - tail_start)
+
+    def stream(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield bytes [start, end] (inclusive) of the archive."""
+        remaining = (self.size - 1 if end is None else end) - start + 1
+        for piece in self._pieces(start):
+            if remaining <= 0:
+                return
+            if len(piece) > remaining:
+                piece = piece[:remaining]
+            remaining -= len(piece)
+            if piece:
+                yield piece
+
+
+def build_user_archive(db: Session, user: User) -> UserArchive:
+    """
+    Walk the user's chapters and books with a streaming cursor and lay out the
+    archive. Only metadata and the generated text entries are held in memory.
+    """
+    entries: List[_Entry] = []
+    media: List[_Entry] = []
+    manifest: Dict[str, Any] = {
+        "format": "bioweaver-archive/1",
+        "user": {"id": user.id, "name": user.name, "email": user.email, "created_at": str(user.created_at)},
+        "chapters": [],
+        "books": [],
+        "missing": [],  # referenced files no longer in storage
+    }
+
+    chapters = (
+        select(*CHAPTER_COLUMNS)
+        .where(Chapter.user_id == user.id)
+        .order_by(Chapter.segment_index, Chapter.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    for ch in db.execute(chapters):
+        mtime = _ts(ch.updated_at)
+        text_entry = _Entry(
+            name=f"chapters/{ch.segment_index:03d}-{ch.id}.md", size=0, mtime=mtime, data=_chapter_markdown(ch)
+        )
+        text_entry.size = len(text_entry.data)
+        entries.append(text_entry)
+        audio = _media_entry("audio", ch.audio_url, str(ch.id), mtime)
+        if audio:
+            media.append(audio)
+        elif ch.audio_url:
+            manifest["missing"].append(ch.audio_url)
+        manifest["chapters"].append(
+            {
+                "id": ch.id,
+                "title": ch.title,
+                "anchor_prompt": ch.anchor_prompt,
+                "segment_index": ch.segment_index,
+                "status": ch.status,
+                "polished_by_model": ch.polished_by_model,
+                "created_at": str(ch.created_at),
+                "text": text_entry.name,
+                "audio": audio.name if audio else None,
+            }
+        )
+
+    books = (
+        select(*BOOK_COLUMNS)
+        .where(Book.user_id == user.id)
+        .order_by(Book.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    for book in db.execute(books):
+        entry = _media_entry("books", book.pdf_url, str(book.id), _ts(book.updated_at))
+        if entry:
+            media.append(entry)
+        elif book.pdf_url:
+            manifest["missing"].append(book.pdf_url)
+        manifest["books"].append(
+            {
+                "id": book.id,
+                "title": book.title,
+                "description": book.description,
+                "created_at": str(book.created_at),
+                "file": entry.name if entry else None,
+            }
+        )
+
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+    newest = max([e.mtime for e in entries + media] + [_ts(user.updated_at)])
+    head = _Entry(name="manifest.json", size=len(manifest_bytes), mtime=newest, data=manifest_bytes)
+    return UserArchive([head] + entries + media)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" / "bytes=start-" / "bytes=-suffix" range.
+    Returns (start, end) inclusive, None for no/unsupported range,
+    raises ValueError when the range is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    spec = header[len("bytes="):].strip()
+    start_s, _, end_s = spec.partition("-")
+    if not start_s:
+        if not end_s:
+            return None
+        length = int(end_s)
+        if length <= 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def archive_etag(db: Session, user: User) -> str:
+    """
+    Strong ETag (If-Range requires one): the archive bytes are a pure function
+    of the rows and the stored objects, which are immutable per key, so this
+    changes exactly when the user or any of their chapters/books does.
+    """
+    tag = weak_etag("archive", user.id, user.updated_at, list_etag(db, "chapter", user.id), list_etag(db, "book", user.id))
+    return tag[2:]
@@ -0,0 +1,42 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Each worker is one event loop; blocking work already runs in threads, so one
+worker per available core is the default (WEB_CONCURRENCY overrides it).
+Run prestart.py first: importing the app does no schema work.
+"""
+
+import os
+
+from lifecycle_service import GRACEFUL_TIMEOUT_SECONDS
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU pinning
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "") or max(2, _cores()))
+# Import the app once in the master and fork: workers start in milliseconds.
+# Safe because importing main opens no connections (post_fork resets the pool anyway).
+preload_app = True
+# SIGTERM -> workers stop accepting, finish in-flight requests/AI calls, then exit
+graceful_timeout = GRACEFUL_TIMEOUT_SECONDS
+# Heartbeat: restart a worker whose event loop has been blocked this long
+timeout = 60
+keepalive = 5
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from db import engine
+    from replica_service import dispose_replicas
+
+    engine.dispose(close=False)
+    dispose_replicas()
@@ -1,10 +1,29 @@
+"""
+Admin health checks.
+
+Probes run concurrently on a schedule (health_loop, in one worker per host
+via run_singleton) and the latest results are shared through a file
+(write_shared), so /admin/health in any worker serves the same snapshot
+instead of probing inline. Each probe carries its own checked_at/age/stale
+markers, and a bounded list of compact past results backs trend charts.
+"""
+
+import asyncio
+import logging
 import os
 import time
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import httpx
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+
+from db import engine
+from lifecycle_service import read_shared, write_shared
+from replica_service import replica_status, replicas_configured
+from storage_gc_service import gc_status
+from storage_service import get_storage
+
+logger = logging.getLogger(__name__)
 
 
 def _bool_env(name: str, default: bool = False) -> bool:
@@ -14,107 +33,231 @@ def _bool_env(name: str, default: bool = False) -> bool:
     return val in ("1", "true", "yes", "y", "on")
 
 
-def collect_health(db: Session) -> Dict[str, Any]:
-    """
-    Lightweight service status checks for admin dashboard.
-    By default, avoids sending messages/emails; can be made deeper via env flags.
-    """
-    result: Dict[str, Any] = {"ok": True}
+HEALTH_INTERVAL_SECONDS = int(os.getenv("HEALTH_INTERVAL_SECONDS", "30") or "30")
+# Deep probes call third-party APIs; refresh them less often
+HEALTH_DEEP_INTERVAL_SECONDS = int(os.getenv("HEALTH_DEEP_INTERVAL_SECONDS", "300") or "300")
+HEALTH_HISTORY_SIZE = int(os.getenv("HEALTH_HISTORY_SIZE", "288") or "288")
+# A probe result older than this many of its refresh intervals is reported as stale
+STALE_FACTOR = 3
+
+SHARED_HEALTH = "health"
+
+_refresh_lock: Optional[asyncio.Lock] = None
+
 
-    # DB
-    db_start = time.time()
-    db_ok = True
-    db_error = None
+def _get_lock() -> asyncio.Lock:
+    global _refresh_lock
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    return _refresh_lock
+
+
+# --- probes -----------------------------------------------------------------
+
+
+def _db_check() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def probe_db() -> Dict[str, Any]:
+    start = time.perf_counter()
     try:
-        db.execute(text("SELECT 1"))
+        await asyncio.to_thread(_db_check)
+        return {"ok": True, "latency_ms": int((time.perf_counter() - start) * 1000), "error": None}
     except Exception as e:
-        db_ok = False
-        db_error = str(e)
-        result["ok"] = False
-    result["db"] = {
-        "ok": db_ok,
-        "latency_ms": int((time.time() - db_start) * 1000),
-        "error": db_error,
-    }
+        return {"ok": False, "latency_ms": int((time.perf_counter() - start) * 1000), "error": str(e)}
+
 
-    # Storage
-    audio_path = os.getenv("STORAGE_AUDIO_PATH", "/data/storage/audio")
-    book_path = os.getenv("STORAGE_BOOK_PATH", "/data/storage/books")
-    storage_ok = True
-    storage_error = None
+async def probe_storage() -> Dict[str, Any]:
+    storage = get_storage()
     try:
-        os.makedirs(audio_path, exist_ok=True)
-        os.makedirs(book_path, exist_ok=True)
-        # write check
-        probe = os.path.join(book_path, ".healthcheck")
-        with open(probe, "w", encoding="utf-8") as f:
-            f.write("ok")
-        os.remove(probe)
+        await asyncio.to_thread(storage.check)
+        return {"ok": True, **storage.describe(), "error": None}
     except Exception as e:
-        storage_ok = False
-        storage_error = str(e)
-        result["ok"] = False
-    result["storage"] = {
-        "ok": storage_ok,
-        "audio_path": audio_path,
-        "book_path": book_path,
-        "error": storage_error,
-    }
+        return {"ok": False, **storage.describe(), "error": str(e)}
+
 
-    # SMTP
+async def probe_smtp() -> Dict[str, Any]:
     smtp_host = os.getenv("SMTP_HOST", "")
     smtp_port = int(os.getenv("SMTP_PORT", "587") or "587")
     smtp_user = os.getenv("SMTP_USER", "")
     smtp_ok = bool(smtp_host and smtp_user and os.getenv("SMTP_PASS", ""))
-    result["smtp"] = {
-        "configured": smtp_ok,
-        "host": smtp_host,
-        "port": smtp_port,
-    }
+    return {"configured": smtp_ok, "host": smtp_host, "port": smtp_port}
+
 
-    # Telegram
+async def probe_telegram(deep: bool) -> Dict[str, Any]:
     tg_token = os.getenv("TELEGRAM_BOT_TOKEN", "")
     tg_chat_id = os.getenv("TELEGRAM_CHAT_ID", "")
-    tg_configured = bool(tg_token and tg_chat_id)
-    result["telegram"] = {"configured": tg_configured}
+    result: Dict[str, Any] = {"configured": bool(tg_token and tg_chat_id)}
+    if not deep:
+        return result
+    # Deep check: getMe (no side effects)
+    try:
+        if tg_token:
+            async with httpx.AsyncClient(timeout=8) as client:
+                r = await client.get(f"https://api.telegram.org/bot{tg_token}/getMe")
+            result["ok"] = r.status_code == 200 and r.json().get("ok") is True
+        else:
+            result["ok"] = False
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    return result
+
 
-    # OpenRouter
+async def probe_openrouter(deep: bool) -> Dict[str, Any]:
     or_key = os.getenv("OPENROUTER_API_KEY", "")
     or_base = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
     or_model = os.getenv("OPENROUTER_MODEL", "")
-    result["openrouter"] = {
-        "configured": bool(or_key),
-        "base_url": or_base,
-        "model": or_model,
+    result: Dict[str, Any] = {"configured": bool(or_key), "base_url": or_base, "model": or_model}
+    if not deep:
+        return result
+    # Deep check: list models (auth)
+    try:
+        if or_key:
+            async with httpx.AsyncClient(timeout=10) as client:
+                r = await client.get(f"{or_base}/models", headers={"Authorization": f"Bearer {or_key}"})
+            result["ok"] = r.status_code == 200
+        else:
+            result["ok"] = False
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    return result
+
+
+async def probe_replicas() -> Dict[str, Any]:
+    # Checked every few seconds by replica_monitor_loop for routing; report its latest view
+    return replica_status()
+
+
+def _probe_table(deep: bool) -> Dict[str, Any]:
+    """name -> (probe coroutine factory, refresh interval in seconds)"""
+    deep_interval = HEALTH_DEEP_INTERVAL_SECONDS if deep else HEALTH_INTERVAL_SECONDS
+    table = {
+        "db": (probe_db, HEALTH_INTERVAL_SECONDS),
+        "storage": (probe_storage, HEALTH_INTERVAL_SECONDS),
+        "smtp": (probe_smtp, HEALTH_INTERVAL_SECONDS),
+        "telegram": (lambda: probe_telegram(deep), deep_interval),
+        "openrouter": (lambda: probe_openrouter(deep), deep_interval),
     }
+    if replicas_configured():
+        table["replicas"] = (probe_replicas, HEALTH_INTERVAL_SECONDS)
+    return table
 
-    # Optional deep checks (no side effects)
-    if _bool_env("HEALTHCHECK_DEEP", False):
-        # Telegram: getMe
-        try:
-            if tg_token:
-                r = httpx.get(f"https://api.telegram.org/bot{tg_token}/getMe", timeout=8)
-                result["telegram"]["ok"] = r.status_code == 200 and r.json().get("ok") is True
-            else:
-                result["telegram"]["ok"] = False
-        except Exception as e:
-            result["telegram"]["ok"] = False
-            result["telegram"]["error"] = str(e)
-            result["ok"] = False
 
-        # OpenRouter: list models (auth)
-        try:
-            if or_key:
-                r = httpx.get(f"{or_base}/models", headers={"Authorization": f"Bearer {or_key}"}, timeout=10)
-                result["openrouter"]["ok"] = r.status_code == 200
-            else:
-                result["openrouter"]["ok"] = False
-        except Exception as e:
-            result["openrouter"]["ok"] = False
-            result["openrouter"]["error"] = str(e)
-            result["ok"] = False
+# --- snapshot / refresh -----------------------------------------------------
 
+
+def _shared_health() -> Dict[str, Any]:
+    """{"probes": name -> latest result, "history": compact entries, oldest first}"""
+    return read_shared(SHARED_HEALTH) or {"probes": {}, "history": []}
+
+
+async def _run_probe(
+    probes: Dict[str, Dict[str, Any]], name: str, factory: Callable[[], Awaitable[Dict[str, Any]]], interval: int
+) -> None:
+    start = time.perf_counter()
+    try:
+        value = await factory()
+    except Exception as e:
+        value = {"ok": False, "error": str(e)}
+    probes[name] = {
+        "value": value,
+        "checked_at": time.time(),
+        "duration_ms": int((time.perf_counter() - start) * 1000),
+        "interval": interval,
+    }
+
+
+async def refresh_health(force: bool = False) -> None:
+    """
+    Re-run every probe whose result is older than its interval (all of them when
+    force=True), concurrently, then append a compact entry to the history and
+    publish both to the other workers.
+    """
+    async with _get_lock():
+        shared = await asyncio.to_thread(_shared_health)
+        probes = shared["probes"]
+        now = time.time()
+        due = []
+        for name, (factory, interval) in _probe_table(_bool_env("HEALTHCHECK_DEEP", False)).items():
+            entry = probes.get(name)
+            if force or entry is None or now - entry["checked_at"] >= interval:
+                due.append(_run_probe(probes, name, factory, interval))
+        if due:
+            await asyncio.gather(*due)
+            history = shared["history"] + [_history_entry(probes)]
+            shared["history"] = history[-HEALTH_HISTORY_SIZE:] if HEALTH_HISTORY_SIZE > 0 else []
+            await asyncio.to_thread(write_shared, SHARED_HEALTH, shared)
+
+
+def _probe_ok(value: Dict[str, Any]) -> bool:
+    if "ok" in value:
+        return bool(value["ok"])
+    return True
+
+
+def _history_entry(probes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {"ts": time.time()}
+    for name, probe in probes.items():
+        entry[name] = _probe_ok(probe["value"])
+    entry["ok"] = all(_probe_ok(p["value"]) for p in probes.values())
+    if "db" in probes:
+        entry["db_latency_ms"] = probes["db"]["value"].get("latency_ms")
+    return entry
+
+
+def health_snapshot(probes: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Latest probe results in the /admin/health shape, with per-probe staleness.
+    Reads the shared results; never probes.
+    """
+    if probes is None:
+        probes = _shared_health()["probes"]
+    now = time.time()
+    result: Dict[str, Any] = {"ok": True, "generated_at": now}
+    for name, probe in probes.items():
+        age = now - probe["checked_at"]
+        value = dict(probe["value"])
+        value.update(
+            {
+                "checked_at": probe["checked_at"],
+                "age_seconds": round(age, 1),
+                "stale": age > probe["interval"] * STALE_FACTOR,
+                "probe_ms": probe["duration_ms"],
+            }
+        )
+        result[name] = value
+        if not _probe_ok(probe["value"]):
+            result["ok"] = False
+    if "storage" in result:
+        result["storage"]["gc"] = gc_status()
     return result
 
 
+async def get_health(force: bool = False) -> Dict[str, Any]:
+    probes = _shared_health()["probes"]
+    if force or not probes:
+        await refresh_health(force=force)
+        probes = None
+    return health_snapshot(probes)
+
+
+def health_history(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    items = _shared_health()["history"]
+    return items[-limit:] if limit else items
+
 
+async def health_loop() -> None:
+    """
+    Background refresher; cheap probes every HEALTH_INTERVAL_SECONDS, deep ones
+    less often. Run through run_singleton so third-party APIs are probed once per host.
+    """
+    while True:
+        try:
+            await refresh_health()
+        except Exception as e:
+            logger.error(f"Health refresh failed: {e}")
+        await asyncio.sleep(max(1, HEALTH_INTERVAL_SECONDS))
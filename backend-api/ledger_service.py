@@ -0,0 +1,264 @@
+"""
+AI call ledger: what every Whisper / LLM call cost and how long it took.
+
+The AI services report each logical call (retries included) with
+record_call(): model, prompt version, tokens or audio seconds, time until the
+response headers and (streamed polish calls) until the first token, total
+time, attempts and outcome. Records go to an in-memory buffer and
+a background loop inserts them into ai_calls in batches every
+LEDGER_FLUSH_SECONDS (sooner once LEDGER_BATCH_SIZE are waiting), so a call
+never waits on the database. If the database is down the buffer keeps at most
+LEDGER_MAX_BUFFER records and drops the oldest beyond that.
+
+The chapter and user a call is made for come from call_context(), set by the
+pipeline around its AI work (tasks inherit it, including single-flight ones).
+
+rollup() gives p50/p95 latency, tokens and failure counts per model per day.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from sqlalchemy import Date, case, cast, func, insert, select
+from sqlalchemy.orm import Session
+
+from db import engine
+from models import AICall
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FLUSH_SECONDS = float(os.getenv("LEDGER_FLUSH_SECONDS", "5") or "5")
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "200") or "200")
+LEDGER_MAX_BUFFER = int(os.getenv("LEDGER_MAX_BUFFER", "10000") or "10000")
+MAX_ERROR_CHARS = 500
+
+_context: contextvars.ContextVar[Dict[str, Optional[int]]] = contextvars.ContextVar("ai_call_context", default={})
+_buffer: Deque[Dict[str, Any]] = deque()
+_wakeup: Optional[asyncio.Event] = None
+_status: Dict[str, Any] = {"written": 0, "dropped": 0, "last_flush_at": None, "last_error": None}
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+@contextlib.contextmanager
+def call_context(chapter_id: Optional[int] = None, user_id: Optional[int] = None) -> Iterator[None]:
+    """Attribute AI calls made inside the block (and tasks started in it) to a chapter/user."""
+    token = _context.set({"chapter_id": chapter_id, "user_id": user_id})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def _ms(seconds: Optional[float]) -> Optional[int]:
+    return round(seconds * 1000) if seconds is not None else None
+
+
+def record_call(
+    kind: str,
+    model: str,
+    *,
+    total_seconds: float,
+    attempts: int,
+    outcome: str,
+    headers_seconds: Optional[float] = None,
+    first_token_seconds: Optional[float] = None,
+    status_code: Optional[int] = None,
+    prompt_version: Optional[str] = None,
+    plan: Optional[str] = None,
+    input_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None,
+    audio_seconds: Optional[float] = None,
+    error: Optional[str] = None,
+) -> None:
+    """Queue one ledger row; never blocks and never raises into the caller."""
+    ctx = _context.get()
+    _buffer.append(
+        {
+            "created_at": datetime.utcnow(),
+            "kind": kind,
+            "model": model,
+            "prompt_version": prompt_version,
+            "plan": plan,
+            "chapter_id": ctx.get("chapter_id"),
+            "user_id": ctx.get("user_id"),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "audio_seconds": audio_seconds,
+            "headers_ms": _ms(headers_seconds),
+            "first_token_ms": _ms(first_token_seconds),
+            "total_ms": round(total_seconds * 1000),
+            "attempts": attempts,
+            "status_code": status_code,
+            "outcome": outcome,
+            "error": error[:MAX_ERROR_CHARS] if error else None,
+        }
+    )
+    while len(_buffer) > LEDGER_MAX_BUFFER:
+        _buffer.popleft()
+        _status["dropped"] += 1
+    if len(_buffer) >= LEDGER_BATCH_SIZE:
+        _get_wakeup().set()
+
+
+def _insert(rows: List[Dict[str, Any]]) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(AICall), rows)
+
+
+async def flush_ledger() -> int:
+    """Write everything buffered so far; on failure the rows go back to the buffer."""
+    written = 0
+    while _buffer:
+        rows = [_buffer.popleft() for _ in range(min(LEDGER_BATCH_SIZE, len(_buffer)))]
+        try:
+            await asyncio.to_thread(_insert, rows)
+        except Exception as e:
+            _buffer.extendleft(reversed(rows))
+            _status["last_error"] = str(e).splitlines()[0]
+            raise
+        written += len(rows)
+        _status["written"] += len(rows)
+    _status["last_flush_at"] = time.time()
+    _status["last_error"] = None
+    return written
+
+
+async def ledger_loop(interval_seconds: Optional[float] = None) -> None:
+    interval = interval_seconds or LEDGER_FLUSH_SECONDS
+    wakeup = _get_wakeup()
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        try:
+            await flush_ledger()
+        except Exception as e:
+            logger.error(f"AI call ledger flush failed ({len(_buffer)} buffered): {e}")
+
+
+async def close_ledger() -> None:
+    """Final flush on shutdown; whatever cannot be written is logged as lost."""
+    try:
+        await flush_ledger()
+    except Exception as e:
+        logger.error(f"AI call ledger: {len(_buffer)} records lost at shutdown: {e}")
+
+
+def ledger_status() -> Dict[str, Any]:
+    return {**_status, "buffered": len(_buffer), "flush_interval_seconds": LEDGER_FLUSH_SECONDS}
+
+
+# --- reporting ------------------------------------------------------------------------
+
+
+def recent_calls(db: Session, chapter_id: Optional[int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    stmt = select(AICall).order_by(AICall.id.desc()).limit(limit)
+    if chapter_id is not None:
+        stmt = stmt.where(AICall.chapter_id == chapter_id)
+    return [
+        {column.name: getattr(call, column.name) for column in AICall.__table__.columns}
+        for call in db.execute(stmt).scalars()
+    ]
+
+
+def _percentile(sorted_values: List[int], q: float) -> Optional[float]:
+    """Linear interpolation between closest ranks, as Postgres percentile_cont."""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def _rollup_postgres(db: Session, since: datetime, kind: Optional[str]) -> List[Dict[str, Any]]:
+    day = cast(AICall.created_at, Date).label("day")
+    ok = AICall.outcome == "ok"
+
+    def pct(q: float, column):
+        return func.percentile_cont(q).within_group(column)
+
+    stmt = (
+        select(
+            day,
+            AICall.kind,
+            AICall.model,
+            func.count().label("calls"),
+            func.sum(case((ok, 0), else_=1)).label("failed"),
+            func.sum(AICall.attempts - 1).label("retries"),
+            func.sum(AICall.input_tokens).label("input_tokens"),
+            func.sum(AICall.output_tokens).label("output_tokens"),
+            func.sum(AICall.audio_seconds).label("audio_seconds"),
+            pct(0.5, AICall.first_token_ms).label("first_token_p50_ms"),
+            pct(0.95, AICall.first_token_ms).label("first_token_p95_ms"),
+            pct(0.5, AICall.total_ms).label("total_p50_ms"),
+            pct(0.95, AICall.total_ms).label("total_p95_ms"),
+        )
+        .where(AICall.created_at >= since)
+        .group_by(day, AICall.kind, AICall.model)
+        .order_by(day.desc(), AICall.kind, AICall.model)
+    )
+    if kind:
+        stmt = stmt.where(AICall.kind == kind)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+
+def _rollup_python(db: Session, since: datetime, kind: Optional[str]) -> List[Dict[str, Any]]:
+    # Databases without percentile_cont (SQLite in development): aggregate here
+    stmt = select(AICall).where(AICall.created_at >= since)
+    if kind:
+        stmt = stmt.where(AICall.kind == kind)
+    groups: Dict[tuple, List[AICall]] = {}
+    for call in db.execute(stmt).scalars():
+        groups.setdefault((call.created_at.date(), call.kind, call.model), []).append(call)
+
+    def total(calls: List[AICall], attr: str):
+        values = [getattr(c, attr) for c in calls if getattr(c, attr) is not None]
+        return sum(values) if values else None
+
+    rows = []
+    for (day, call_kind, model), calls in groups.items():
+        first_token = sorted(c.first_token_ms for c in calls if c.first_token_ms is not None)
+        total_ms = sorted(c.total_ms for c in calls)
+        rows.append(
+            {
+                "day": day,
+                "kind": call_kind,
+                "model": model,
+                "calls": len(calls),
+                "failed": sum(c.outcome != "ok" for c in calls),
+                "retries": sum(c.attempts - 1 for c in calls),
+                "input_tokens": total(calls, "input_tokens"),
+                "output_tokens": total(calls, "output_tokens"),
+                "audio_seconds": total(calls, "audio_seconds"),
+                "first_token_p50_ms": _percentile(first_token, 0.5),
+                "first_token_p95_ms": _percentile(first_token, 0.95),
+                "total_p50_ms": _percentile(total_ms, 0.5),
+                "total_p95_ms": _percentile(total_ms, 0.95),
+            }
+        )
+    rows.sort(key=lambda r: (-r["day"].toordinal(), r["kind"], r["model"]))
+    return rows
+
+
+def rollup(db: Session, days: int = 7, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Per day, kind and model: call/failure/retry counts, usage totals and p50/p95 latencies (ms)."""
+    since = datetime.combine(datetime.utcnow().date() - timedelta(days=max(days, 1) - 1), datetime.min.time())
+    if engine.dialect.name == "postgresql":
+        return _rollup_postgres(db, since, kind)
+    return _rollup_python(db, since, kind)
@@ -0,0 +1,223 @@
+"""
+Process lifecycle for the API workers: readiness, draining and single-host
+singleton jobs.
+
+- On SIGTERM/SIGINT a worker flips to draining before uvicorn starts its own
+  shutdown: /readyz answers 503 so the proxy stops routing to it, long-lived
+  SSE streams are closed (clients reconnect elsewhere), and in-flight AI calls
+  are allowed to finish within GRACEFUL_TIMEOUT_SECONDS.
+- Jobs that must not run once per worker (storage GC) take a file lock; the
+  worker holding it runs the job, the others retry in case it exits. What the
+  job reports is written next to the lock (write_shared) so every worker on
+  the host answers with the same figures (read_shared).
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import functools
+import json
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import text
+
+from db import engine
+
+logger = logging.getLogger(__name__)
+
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "120") or "120")
+READINESS_DB_TIMEOUT_SECONDS = float(os.getenv("READINESS_DB_TIMEOUT_SECONDS", "2") or "2")
+SINGLETON_LOCK_DIR = os.getenv("SINGLETON_LOCK_DIR", "") or tempfile.gettempdir()
+SINGLETON_RETRY_SECONDS = 60
+
+_started_at = time.time()
+_draining = False
+_drain_callbacks: List[Callable[[], None]] = []
+_inflight: Dict[str, int] = {}
+_idle: Optional[asyncio.Event] = None
+
+T = TypeVar("T")
+
+
+def is_draining() -> bool:
+    return _draining
+
+
+def on_drain(callback: Callable[[], None]) -> None:
+    """Run callback (on the event loop) when the worker starts draining."""
+    _drain_callbacks.append(callback)
+
+
+def _start_draining() -> None:
+    global _draining
+    if _draining:
+        return
+    _draining = True
+    logger.info(f"Draining worker {os.getpid()}: in-flight {_inflight or 'none'}")
+    for callback in _drain_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Drain callback failed: {e}")
+
+
+def install_drain_handler() -> None:
+    """
+    Chain SIGTERM/SIGINT so draining starts before the server's own handler runs.
+    Call from a startup hook: uvicorn installs its handlers before app startup
+    and restores the previous ones on exit.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(_start_draining)
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+# --- in-flight work ---------------------------------------------------------------
+
+
+def _get_idle() -> asyncio.Event:
+    global _idle
+    if _idle is None:
+        _idle = asyncio.Event()
+        _idle.set()
+    return _idle
+
+
+def tracked(kind: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Count calls of an async function as in-flight `kind` work, waited for on shutdown."""
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            _inflight[kind] = _inflight.get(kind, 0) + 1
+            _get_idle().clear()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _inflight[kind] -= 1
+                if not _inflight[kind]:
+                    del _inflight[kind]
+                if not _inflight:
+                    _get_idle().set()
+
+        return wrapper
+
+    return decorator
+
+
+def inflight() -> Dict[str, int]:
+    return dict(_inflight)
+
+
+async def wait_for_inflight(timeout: float = GRACEFUL_TIMEOUT_SECONDS) -> bool:
+    """Wait until no tracked work is running; False if the timeout expired first."""
+    if not _inflight:
+        return True
+    logger.info(f"Waiting up to {timeout}s for in-flight work: {_inflight}")
+    try:
+        await asyncio.wait_for(_get_idle().wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with in-flight work still running: {_inflight}")
+        return False
+
+
+# --- probes -------------------------------------------------------------------------
+
+
+def liveness() -> Dict[str, Any]:
+    """The process is up and its event loop answers; no dependency checks."""
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - _started_at, 1)}
+
+
+def _db_ping() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def readiness() -> Dict[str, Any]:
+    """Whether this worker should receive traffic: not draining and the database answers."""
+    result: Dict[str, Any] = {"ready": False, "pid": os.getpid(), "draining": _draining, "inflight": inflight()}
+    if _draining:
+        return result
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_db_ping), timeout=READINESS_DB_TIMEOUT_SECONDS)
+    except Exception as e:
+        result["error"] = f"database: {e or type(e).__name__}"
+        return result
+    result["ready"] = True
+    return result
+
+
+# --- singleton jobs -------------------------------------------------------------------
+
+
+def _try_lock(name: str) -> Optional[int]:
+    fd = os.open(os.path.join(SINGLETON_LOCK_DIR, f"bioweaver-{name}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except OSError:
+        os.close(fd)
+        return None
+
+
+async def run_singleton(name: str, job: Callable[[], Awaitable[None]]) -> None:
+    """
+    Run `job` in only one worker process on this host. The lock is held for
+    the life of the job and released by the OS if the worker dies.
+    """
+    while not _draining:
+        fd = _try_lock(name)
+        if fd is not None:
+            logger.info(f"Worker {os.getpid()} runs singleton job {name}")
+            try:
+                await job()
+            finally:
+                os.close(fd)
+            return
+        await asyncio.sleep(SINGLETON_RETRY_SECONDS)
+
+
+def _shared_path(name: str) -> str:
+    return os.path.join(SINGLETON_LOCK_DIR, f"bioweaver-{name}.json")
+
+
+def write_shared(name: str, value: Any) -> None:
+    """Publish JSON state under `name` to every worker on this host (atomic replace)."""
+    fd, tmp = tempfile.mkstemp(dir=SINGLETON_LOCK_DIR, prefix=f".bioweaver-{name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, default=str)
+        os.replace(tmp, _shared_path(name))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def read_shared(name: str) -> Optional[Any]:
+    """State last published under `name`, or None if there is none (or it cannot be read)."""
+    try:
+        with open(_shared_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Reading shared state {name} failed: {e}")
+        return None
@@ -0,0 +1,161 @@
+"""
+Live ingest: transcribe a recording while it is still being made.
+
+The mobile recorder sends MediaRecorder timeslices (WebM/Opus or MP4) over a
+WebSocket. Each chunk is appended to a spool file (the original, stored as the
+chapter audio at the end) and piped into one ffmpeg process per session that
+re-encodes to 16 kHz mono Opus and cuts LIVE_WINDOW_SECONDS windows
+(-f segment). ffmpeg lists a window in its segment list once the window is
+complete; that window is then sent to Whisper (through the fair scheduler),
+with the tail of the previous window's text as the prompt so words split at
+a boundary stay coherent.
+
+When recording stops only the last window is still to transcribe, and that
+overlaps with the user typing a title. The chapter is then created with the
+joined transcript and goes straight to polishing. Without ffmpeg,
+or if any window fails, the transcript is left empty and the normal pipeline
+transcribes the whole recording instead.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+from audio_service import SAMPLE_RATE, ffmpeg_available
+from ledger_service import call_context
+from scheduler_service import ai_slot
+from whisper_service import transcribe_file
+
+logger = logging.getLogger(__name__)
+
+LIVE_WINDOW_SECONDS = int(os.getenv("LIVE_WINDOW_SECONDS", "60") or "60")
+LIVE_MAX_BYTES = int(os.getenv("LIVE_MAX_BYTES", str(100 * 1024 * 1024)) or str(100 * 1024 * 1024))
+LIVE_IDLE_TIMEOUT_SECONDS = int(os.getenv("LIVE_IDLE_TIMEOUT_SECONDS", "30") or "30")
+# After recording stops: how long the user may take to name the chapter
+LIVE_COMMIT_TIMEOUT_SECONDS = int(os.getenv("LIVE_COMMIT_TIMEOUT_SECONDS", "900") or "900")
+PROMPT_CHARS = 400  # Whisper reads at most 224 prompt tokens
+
+EXTENSIONS = {"audio/webm": ".webm", "audio/mp4": ".m4a", "audio/ogg": ".ogg"}
+
+
+class LiveIngestError(Exception):
+    """The session cannot continue (size limit, bad input)."""
+
+
+class LiveSession:
+    """Spool + incremental windowed transcription for one recording."""
+
+    def __init__(self, user_id: int, mime_type: str = "audio/webm") -> None:
+        self.user_id = user_id
+        self.mime_type = mime_type.split(";")[0].strip().lower() or "audio/webm"
+        self.dir = tempfile.mkdtemp(prefix="live-")
+        self.spool_path = os.path.join(self.dir, f"original{EXTENSIONS.get(self.mime_type, '.webm')}")
+        self.spool = open(self.spool_path, "wb")
+        self.bytes = 0
+        self.segment_list = os.path.join(self.dir, "segments.csv")
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.windows: Dict[int, "asyncio.Task[str]"] = {}
+        self.texts: Dict[int, str] = {}
+        self.failed = False
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.spool_path)[1]
+
+    async def start(self) -> None:
+        if not ffmpeg_available():
+            logger.warning("ffmpeg not found, live session falls back to transcribing on stop")
+            return
+        cmd = [
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-i", "pipe:0",
+            "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-c:a", "libopus", "-b:a", "24k", "-application", "voip",
+            "-f", "segment", "-segment_time", str(LIVE_WINDOW_SECONDS),
+            "-segment_list", self.segment_list, "-segment_list_type", "csv",
+            os.path.join(self.dir, "window-%04d.ogg"),
+        ]
+        self.proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+
+    async def feed(self, chunk: bytes) -> None:
+        """Append a timeslice; start transcribing any window ffmpeg has finished."""
+        self.bytes += len(chunk)
+        if self.bytes > LIVE_MAX_BYTES:
+            raise LiveIngestError(f"recording exceeds {LIVE_MAX_BYTES} bytes")
+        self.spool.write(chunk)
+        if self.proc and self.proc.stdin and self.proc.returncode is None:
+            try:
+                self.proc.stdin.write(chunk)
+                await self.proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                logger.warning("Live ffmpeg segmenter exited early; falling back to full transcription")
+                self.failed = True
+        self._collect_windows()
+
+    def _completed_windows(self) -> List[str]:
+        if not os.path.exists(self.segment_list):
+            return []
+        with open(self.segment_list, encoding="utf-8") as f:
+            return [line.split(",")[0] for line in f.read().splitlines() if line.strip()]
+
+    def _collect_windows(self) -> None:
+        for index, name in enumerate(self._completed_windows()):
+            if index not in self.windows:
+                self.windows[index] = asyncio.create_task(self._transcribe_window(index, os.path.join(self.dir, name)))
+
+    async def _transcribe_window(self, index: int, path: str) -> str:
+        # Windows run concurrently; only wait for the previous one to borrow its text as prompt
+        prompt = ""
+        if index > 0:
+            prompt = (await asyncio.shield(self.windows[index - 1]))[-PROMPT_CHARS:]
+        # No chapter exists until the recording is committed; the ledger row carries the user only
+        with call_context(user_id=self.user_id):
+            async with ai_slot(self.user_id, "bulk", "transcribe"):
+                text = await transcribe_file(path, prompt=prompt or None)
+        text = (text or "").strip()
+        if not text:
+            # An empty window may be silence, but an API failure looks the same; re-transcribe the whole thing
+            logger.warning(f"Live window {index} returned no text")
+            self.failed = True
+        self.texts[index] = text
+        return text
+
+    def completed(self) -> Dict[int, str]:
+        """Window texts transcribed so far (for progress messages)."""
+        return dict(self.texts)
+
+    async def finish(self) -> Optional[str]:
+        """
+        Close the stream, transcribe the last window and return the joined
+        transcript, or None when the recording must be transcribed as a whole.
+        """
+        self.spool.close()
+        if self.proc is None:
+            return None
+        if self.proc.stdin and not self.proc.stdin.is_closing():
+            self.proc.stdin.close()
+        _, stderr = await self.proc.communicate()
+        if self.proc.returncode != 0:
+            logger.error(f"Live ffmpeg segmenter failed: {stderr.decode(errors='replace')[:300]}")
+            self.failed = True
+        self._collect_windows()
+        texts = await asyncio.gather(*(self.windows[i] for i in sorted(self.windows)), return_exceptions=True)
+        if self.failed or not texts or any(isinstance(t, BaseException) for t in texts):
+            return None
+        return "\n".join(t for t in texts if t)
+
+    async def cleanup(self) -> None:
+        """Stop anything still running and remove the session's temp files."""
+        for task in self.windows.values():
+            task.cancel()
+        if self.proc and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        if not self.spool.closed:
+            self.spool.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
@@ -1,24 +1,79 @@
+import asyncio
+import json
 import os
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import uuid4
 
-from fastapi import Depends, FastAPI, File, Form, UploadFile, status, HTTPException, Request
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, UploadFile, status, HTTPException, Request, Response
+from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from pydantic import BaseModel, field_validator
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from db import SessionLocal, engine
-from models import Base, Chapter, User, Book
-from services.ai_service import rewrite_memory
+from db import SessionLocal
+from models import Chapter, User, Book
 from email_service import send_email
 from telegram_service import send_telegram
-from whisper_service import transcribe_file
 from seed_service import seed_demo, clear_demo
-from health_service import collect_health
-
-# Create tables on startup
-Base.metadata.create_all(bind=engine)
+from synthetic_service import generate_synthetic
+from health_service import get_health, health_history, health_loop
+from stats_service import get_stats, storage_stats_loop
+from serialization import json_response, out_columns, stream_json_array, stream_ndjson
+from search_service import search_chapters
+from sync_service import changes_since, check_list, not_modified, parse_cursor, record_tombstones, row_etag
+from events_service import (
+    close_all as close_event_streams,
+    listen_loop,
+    publish_chapter,
+    publish_chapter_deleted,
+    publish_chapters_deleted,
+    set_serializer,
+    sse_stream,
+    subscribe,
+)
+from lifecycle_service import (
+    install_drain_handler,
+    is_draining,
+    liveness,
+    on_drain,
+    readiness,
+    run_singleton,
+    tracked,
+    wait_for_inflight,
+)
+from media_service import local_media_response, media_allowed, put_precompressed
+from storage_service import (
+    KINDS,
+    LocalStorage,
+    build_public_url,
+    delete_url,
+    get_storage,
+    iter_file_chunks,
+    key_from_url,
+    new_key,
+    signed_url,
+)
+from storage_gc_service import purge_queued_media_now, queue_user_media, run_storage_gc, storage_gc_loop
+from pipeline_service import polish_chapter, process_chapter, recovery_loop, recovery_status, run_recovery
+from ledger_service import close_ledger, ledger_loop, ledger_status, recent_calls, rollup
+from planner_service import planner_status
+from query_stats_service import QueryStatsMiddleware
+from dedup_service import DEDUP_THRESHOLD, reindex, signature, similar_chapters, store_signature
+from replica_service import replica_monitor_loop
+from scheduler_service import queue_stats
+from singleflight_service import flight_stats
+from export_service import archive_etag, build_user_archive, parse_range
+from live_ingest_service import (
+    LIVE_COMMIT_TIMEOUT_SECONDS,
+    LIVE_IDLE_TIMEOUT_SECONDS,
+    LIVE_WINDOW_SECONDS,
+    LiveIngestError,
+    LiveSession,
+)
 
 app = FastAPI(title="BioWeaver API", version="0.1.0")
 
@@ -31,48 +86,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"] ,
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Range", "Content-Disposition", "X-DB-Queries", "X-DB-Time-Ms", "Server-Timing"],
 )
+# Statement counts/time per request: debug headers, slow-query and N+1 logging
+app.add_middleware(QueryStatsMiddleware)
 
 
-def get_db():
-    db = SessionLocal()
+# Schema creation/upgrades run once per deploy in prestart.py, not per worker import.
+
+
+@app.on_event("startup")
+async def start_background_jobs() -> None:
+    install_drain_handler()
+    on_drain(close_event_streams)
+    asyncio.create_task(run_singleton("storage-gc", storage_gc_loop))
+    asyncio.create_task(run_singleton("health", health_loop))
+    asyncio.create_task(listen_loop())
+    asyncio.create_task(recovery_loop())
+    asyncio.create_task(replica_monitor_loop())
+    asyncio.create_task(ledger_loop())
+    asyncio.create_task(run_singleton("storage-stats", storage_stats_loop))
+
+
+@app.on_event("shutdown")
+async def drain_inflight_work() -> None:
+    # Requests have finished by now; this covers AI calls running outside of one
+    await wait_for_inflight()
+    await close_ledger()
+
+
+def get_db(request: Request):
+    # GET/HEAD may read from a replica; anything else reads and writes the primary
+    db = SessionLocal(replica_reads=request.method in ("GET", "HEAD"))
     try:
         yield db
     finally:
         db.close()
 
 
-def _build_public_url(kind: str, filename: str) -> str:
-    public_base = os.getenv("STORAGE_PUBLIC_BASE_URL", "").rstrip("/")
-    return f"{public_base}/{kind}/{filename}" if public_base else filename
-
-
-def _resolve_storage_path(kind: str, filename_or_url: str) -> str:
-    base_dir = os.getenv(
-        "STORAGE_AUDIO_PATH" if kind == "audio" else "STORAGE_BOOK_PATH",
-        "/data/storage/audio" if kind == "audio" else "/data/storage/books",
-    )
-    name = os.path.basename(filename_or_url)
-    return os.path.join(base_dir, name)
+def get_primary_db():
+    # Reads that must not lag behind the primary (sync cursors)
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
 
-def _safe_delete(path: str) -> None:
-    try:
-        if os.path.isfile(path):
-            os.remove(path)
-    except Exception:
-        pass
+def is_admin(request: Request) -> bool:
+    """True when ADMIN_TOKEN is unset or the X-Admin-Token header matches it."""
+    expected = (os.getenv("ADMIN_TOKEN") or "").strip()
+    if not expected:
+        return True
+    provided = (request.headers.get("X-Admin-Token") or "").strip()
+    return provided == expected
 
 
 def require_admin(request: Request) -> None:
     """
     If ADMIN_TOKEN is set, require X-Admin-Token header to match.
     """
-    expected = (os.getenv("ADMIN_TOKEN") or "").strip()
-    if not expected:
-        return
-    provided = (request.headers.get("X-Admin-Token") or "").strip()
-    if provided != expected:
+    if not is_admin(request):
         raise HTTPException(status_code=401, detail="unauthorized")
 
 
@@ -83,21 +157,35 @@ class ChapterOut(BaseModel):
     anchor_prompt: Optional[str] = None
     segment_index: int
     audio_url: Optional[str] = None
+    normalized_audio_url: Optional[str] = None
     transcript_text: Optional[str] = None
     polished_text: Optional[str] = None
     polished_by_model: Optional[str] = None  # Track which AI model was used
     status: str
+    attempts: int = 0
+    last_error: Optional[str] = None
+    duplicate_of: Optional[int] = None  # status "duplicate": retells this polished chapter
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @field_validator("audio_url", "normalized_audio_url")
+    @classmethod
+    def _sign_audio(cls, url: Optional[str]) -> Optional[str]:
+        return signed_url("audio", url)
 
     class Config:
         from_attributes = True
 
 
+set_serializer(lambda ch: ChapterOut.model_validate(ch).model_dump(mode="json"))
+
+
 class UserOut(BaseModel):
     id: int
     name: str
     email: str
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -110,6 +198,12 @@ class BookOut(BaseModel):
     description: Optional[str] = None
     pdf_url: Optional[str] = None
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @field_validator("pdf_url")
+    @classmethod
+    def _sign_pdf(cls, url: Optional[str]) -> Optional[str]:
+        return signed_url("books", url)
 
     class Config:
         from_attributes = True
@@ -120,18 +214,178 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/livez")
+async def livez():
+    """Liveness: the worker's event loop answers. Restart the container only if this fails."""
+    return liveness()
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 503 while draining or when the database is unreachable."""
+    result = await readiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+
+def _signed_rows(rows, kind: str, *fields: str):
+    """Row mappings as dicts with their stored media URLs signed (the *Out validators, for json_response)."""
+    for row in rows:
+        row = dict(row)
+        for field in fields:
+            row[field] = signed_url(kind, row[field])
+        yield row
+
+
 @app.get("/get_chapters", response_model=List[ChapterOut])
-async def get_chapters(user_id: Optional[int] = None, db: Session = Depends(get_db)):
-    query = db.query(Chapter)
+async def get_chapters(request: Request, user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    cached, etag = check_list(request, db, "chapter", user_id)
+    if cached:
+        return cached
+    query = select(*out_columns(Chapter, ChapterOut))
     if user_id is not None:
-        query = query.filter(Chapter.user_id == user_id)
-    chapters = query.order_by(Chapter.segment_index).all()
-    return chapters
+        query = query.where(Chapter.user_id == user_id)
+    rows = db.execute(query.order_by(Chapter.segment_index)).mappings()
+    return json_response(_signed_rows(rows, "audio", "audio_url", "normalized_audio_url"), headers={"ETag": etag})
 
 
 @app.get("/chapters", response_model=List[ChapterOut])
-async def list_chapters(user_id: Optional[int] = None, db: Session = Depends(get_db)):
-    return await get_chapters(user_id=user_id, db=db)
+async def list_chapters(request: Request, user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    return await get_chapters(request=request, user_id=user_id, db=db)
+
+
+# entity -> (model, schema, (media kind, URL fields...) signed on the way out)
+EXPORTS = {
+    "chapters": (Chapter, ChapterOut, ("audio", "audio_url", "normalized_audio_url")),
+    "books": (Book, BookOut, ("books", "pdf_url")),
+    "users": (User, UserOut, None),
+}
+
+
+@app.get("/export/{entity}")
+async def export_rows(request: Request, entity: str, format: str = "ndjson", user_id: Optional[int] = None):
+    """
+    Stream every row of chapters/books/users as NDJSON (default) or a JSON array,
+    from a server-side cursor so memory stays flat regardless of row count.
+    """
+    require_admin(request)
+    if entity not in EXPORTS:
+        raise HTTPException(status_code=404, detail="unknown export")
+    if format not in ("ndjson", "json"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or json")
+    model, schema, media = EXPORTS[entity]
+    query = select(*out_columns(model, schema))
+    if user_id is not None:
+        query = query.where((model.id if model is User else model.user_id) == user_id)
+    query = query.order_by(model.id)
+    map_rows = (lambda rows: _signed_rows(rows, *media)) if media else None
+    if format == "ndjson":
+        return StreamingResponse(stream_ndjson(query, map_rows), media_type="application/x-ndjson")
+    return StreamingResponse(stream_json_array(query, map_rows), media_type="application/json")
+
+
+class SnippetPart(BaseModel):
+    text: str
+    match: bool
+
+
+class ChapterHit(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    anchor_prompt: Optional[str] = None
+    segment_index: int
+    audio_url: Optional[str] = None
+    status: str
+    polished_by_model: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    score: float
+    field: Optional[str] = None  # which text the snippet was cut from
+    snippet: List[SnippetPart]
+
+    @field_validator("audio_url")
+    @classmethod
+    def _sign_audio(cls, url: Optional[str]) -> Optional[str]:
+        return signed_url("audio", url)
+
+
+class SearchResponse(BaseModel):
+    results: List[ChapterHit]
+    offset: int
+    limit: int
+    has_more: bool
+
+
+@app.get("/search/chapters", response_model=SearchResponse)
+async def search(
+    q: str, user_id: Optional[int] = None, limit: int = 20, offset: int = 0, db: Session = Depends(get_db)
+):
+    """
+    Ranked substring/fuzzy search over chapter titles, anchors, transcripts and
+    polished text, with highlighted snippets. Paginate with offset until has_more is false.
+    """
+    if len(q) > 200:
+        raise HTTPException(status_code=400, detail="query too long")
+    return search_chapters(db, q, user_id=user_id, limit=limit, offset=offset)
+
+
+class SyncResponse(BaseModel):
+    cursor: str
+    full: bool
+    users: List[UserOut]
+    chapters: List[ChapterOut]
+    books: List[BookOut]
+    deleted: Dict[str, List[int]]
+
+
+@app.get("/sync", response_model=SyncResponse)
+async def sync(since: Optional[str] = None, user_id: Optional[int] = None, db: Session = Depends(get_primary_db)):
+    """
+    Delta sync: rows changed after `since` plus ids deleted after it.
+    Omit `since` for a full snapshot; pass the returned `cursor` next time.
+    Read on the primary: rows a replica has not replayed yet would fall
+    behind the cursor and never be sent.
+    """
+    try:
+        since_at = parse_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    result = changes_since(db, since_at, user_id)
+    return {
+        "cursor": result["cursor"],
+        "full": result["full"],
+        "users": result["changed"]["user"],
+        "chapters": result["changed"]["chapter"],
+        "books": result["changed"]["book"],
+        "deleted": result["deleted"],
+    }
+
+
+@app.get("/events/chapters")
+async def chapter_events(user_id: Optional[int] = None):
+    """
+    Server-Sent Events stream of chapter changes (optionally for one user).
+    Events: `chapter` (full ChapterOut in data.chapter), `deleted`, and `resync`
+    when the client fell behind and should re-fetch the list.
+    """
+    sub = subscribe(user_id)
+    return StreamingResponse(
+        sse_stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+MAX_IDEMPOTENCY_KEY_CHARS = 64
+
+
+def _chapter_for_key(db: Session, user_id: int, idempotency_key: Optional[str]) -> Optional[Chapter]:
+    """The chapter already created for this client idempotency key, if any."""
+    if not idempotency_key:
+        return None
+    return db.execute(
+        select(Chapter).where(Chapter.user_id == user_id, Chapter.idempotency_key == idempotency_key)
+    ).scalar_one_or_none()
 
 
 @app.post("/upload_audio", response_model=ChapterOut)
@@ -141,57 +395,197 @@ async def upload_audio(
     anchor_prompt: str | None = Form(None),
     segment_index: int = Form(0),
     file: UploadFile = File(...),
+    idempotency_key: str | None = Form(None, max_length=MAX_IDEMPOTENCY_KEY_CHARS),
     db: Session = Depends(get_db),
 ):
-    storage_root = os.getenv("STORAGE_AUDIO_PATH", "/data/storage/audio")
-    os.makedirs(storage_root, exist_ok=True)
-
+    # A retry (or the fallback after a dropped live ingest) of an upload that already made its chapter
+    existing = _chapter_for_key(db, user_id, idempotency_key)
+    if existing is not None:
+        return existing
+    storage = get_storage()
     ext = os.path.splitext(file.filename)[1] or ".wav"
     safe_name = f"{uuid4().hex}{ext}"
-    stored_fs_path = os.path.join(storage_root, safe_name)
+    audio_key = new_key(safe_name)
 
-    with open(stored_fs_path, "wb") as out_file:
-        out_file.write(await file.read())
+    # Stream the spooled upload into storage in chunks, off the event loop
+    await asyncio.to_thread(
+        storage.put_stream, "audio", audio_key, iter_file_chunks(file.file), file.content_type
+    )
+
+    chapter = await _ingest_chapter(db, user_id, title, anchor_prompt, segment_index, audio_key, None, idempotency_key)
+    send_telegram(
+        f"New upload: user {user_id}, title '{title}', anchor '{anchor_prompt}', file {safe_name}, "
+        f"transcribed={'yes' if chapter.transcript_text else 'no'}"
+    )
+
+    return chapter
 
-    audio_url = _build_public_url("audio", safe_name)
 
+async def _ingest_chapter(
+    db: Session,
+    user_id: int,
+    title: str,
+    anchor_prompt: Optional[str],
+    segment_index: int,
+    audio_key: str,
+    transcript_text: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+) -> Chapter:
+    """
+    Create the chapter for stored audio and run the remaining pipeline stages.
+    If another request created the chapter for idempotency_key meanwhile, that
+    chapter is returned (the audio just stored is left to storage GC).
+    """
     chapter = Chapter(
         user_id=user_id,
         title=title,
         anchor_prompt=anchor_prompt,
         segment_index=segment_index,
-        audio_url=audio_url,
-        transcript_text=None,
+        audio_url=build_public_url("audio", audio_key),
+        transcript_text=transcript_text,
         polished_text=None,
         status="pending",
+        attempts=1,
+        idempotency_key=idempotency_key,
     )
     db.add(chapter)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        existing = _chapter_for_key(db, user_id, idempotency_key)
+        if existing is None:
+            raise
+        return existing
+    publish_chapter(db, chapter)
     db.commit()
     db.refresh(chapter)
 
-    transcript_text = None
-    polished_text = None
-    polished_by_model = None
+    # Normalize, transcribe and polish; on failure the chapter stays pending with
+    # last_error set and the recovery sweeper retries it later
+    await process_chapter(db, chapter)
+    db.refresh(chapter)
+    return chapter
+
+
+@app.websocket("/ws/ingest")
+async def live_ingest(websocket: WebSocket):
+    """
+    Record-and-transcribe over one WebSocket. Client -> server:
+      {"type": "start", "user_id": 1, "mime_type": "audio/webm;codecs=opus", "idempotency_key": "<per recording>"}
+      binary MediaRecorder timeslices while recording
+      {"type": "end"} when recording stops (the last window is transcribed now)
+      {"type": "commit", "title": "...", "anchor_prompt": "...", "segment_index": 0} or {"type": "cancel"}
+    Server -> client: {"type": "ready"}, {"type": "window", "index", "text"} per
+    transcribed window, {"type": "transcribed", "live": bool} after "end", then
+    {"type": "chapter", "chapter": {...}}. On {"type": "error"} or a dropped
+    socket the client uploads the recording through /upload_audio instead, with
+    the same idempotency_key: if the chapter was created here after all, that
+    upload returns it instead of creating a second one.
+    """
+    await websocket.accept()
+    if is_draining():
+        await websocket.close(code=1012, reason="server restarting")
+        return
+    session: Optional[LiveSession] = None
+    sent: set = set()
+
+    async def send_windows() -> None:
+        for index, text in sorted(session.completed().items()):
+            if index not in sent:
+                sent.add(index)
+                await websocket.send_json({"type": "window", "index": index, "text": text})
+
+    async def receive(timeout: float) -> dict:
+        message = await asyncio.wait_for(websocket.receive(), timeout=timeout)
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        return message
+
+    async def finish() -> Optional[str]:
+        transcript = await session.finish()
+        await send_windows()
+        await websocket.send_json({"type": "transcribed", "live": transcript is not None})
+        return transcript
+
+    finishing: Optional[asyncio.Task] = None
     try:
-        transcript_text = await transcribe_file(stored_fs_path)
-        polished_text, polished_by_model = await rewrite_memory(anchor_prompt or "", transcript_text, None)
-        chapter.transcript_text = transcript_text
-        chapter.polished_text = polished_text
-        chapter.polished_by_model = polished_by_model
-        chapter.status = "polished"
-        db.add(chapter)
-        db.commit()
-        db.refresh(chapter)
-    except Exception:
-        # Keep as pending if transcribe/polish fails
-        pass
+        start = json.loads((await receive(LIVE_IDLE_TIMEOUT_SECONDS)).get("text") or "{}")
+        if start.get("type") != "start" or not isinstance(start.get("user_id"), int):
+            raise ValueError("expected a start message with user_id")
+        idempotency_key = start.get("idempotency_key")
+        if idempotency_key is not None and (
+            not isinstance(idempotency_key, str) or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_CHARS
+        ):
+            raise ValueError("invalid idempotency_key")
+        session = LiveSession(start["user_id"], start.get("mime_type") or "audio/webm")
+        await session.start()
+        await websocket.send_json({"type": "ready", "window_seconds": LIVE_WINDOW_SECONDS, "live": session.proc is not None})
+
+        while True:
+            message = await receive(LIVE_IDLE_TIMEOUT_SECONDS)
+            if message.get("bytes"):
+                await session.feed(message["bytes"])
+                await send_windows()
+            elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                break
+            if is_draining():
+                raise LiveIngestError("server restarting")
+        if not session.bytes:
+            raise ValueError("no audio received")
+        finishing = asyncio.create_task(finish())
+
+        # The user now types a title; transcription of the last window overlaps with that
+        while True:
+            command = json.loads((await receive(LIVE_COMMIT_TIMEOUT_SECONDS)).get("text") or "{}")
+            if command.get("type") == "cancel":
+                await websocket.close()
+                return
+            if command.get("type") == "commit" and (command.get("title") or "").strip():
+                break
+        title = command["title"].strip()
+        transcript = await finishing
+        payload = await _commit_live_recording(session, title, command, transcript, idempotency_key)
+        send_telegram(
+            f"New live recording: user {session.user_id}, title '{title}', {len(sent)} windows, "
+            f"live transcript={'yes' if transcript else 'no'}"
+        )
+        await websocket.send_json({"type": "chapter", "chapter": payload})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass  # the client still holds the recording and uploads it instead
+    except (asyncio.TimeoutError, LiveIngestError, ValueError) as e:
+        detail = "idle timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=1012 if is_draining() else 1008)
+    finally:
+        if finishing is not None and not finishing.done():
+            finishing.cancel()
+        if session is not None:
+            await session.cleanup()
 
-    send_telegram(
-        f"New upload: user {user_id}, title '{title}', anchor '{anchor_prompt}', file {safe_name}, "
-        f"transcribed={'yes' if transcript_text else 'no'}"
-    )
 
-    return chapter
+@tracked("ingest")
+async def _commit_live_recording(
+    session: LiveSession, title: str, command: dict, transcript: Optional[str], idempotency_key: Optional[str]
+) -> dict:
+    """Store the recording and create its chapter; a drain waits for this to finish."""
+    db = SessionLocal()
+    try:
+        chapter = _chapter_for_key(db, session.user_id, idempotency_key)
+        if chapter is None:  # else the client's fallback upload got there first
+            audio_key = new_key(f"{uuid4().hex}{session.extension}")
+            with open(session.spool_path, "rb") as f:
+                await asyncio.to_thread(
+                    get_storage().put_stream, "audio", audio_key, iter_file_chunks(f), session.mime_type
+                )
+            chapter = await _ingest_chapter(
+                db, session.user_id, title, command.get("anchor_prompt"), int(command.get("segment_index") or 0),
+                audio_key, transcript, idempotency_key,
+            )
+        return ChapterOut.model_validate(chapter).model_dump(mode="json")
+    finally:
+        db.close()
 
 
 class GenerateBookRequest(BaseModel):
@@ -244,21 +638,18 @@ async def generate_book(payload: GenerateBookRequest, db: Session = Depends(get_
     if not chapters:
         raise HTTPException(status_code=404, detail="no chapters found for user")
 
-    storage_root = os.getenv("STORAGE_BOOK_PATH", "/data/storage/books")
-    os.makedirs(storage_root, exist_ok=True)
-
     content_parts = []
     for ch in chapters:
         text = ch.polished_text or ch.transcript_text or ""
         content_parts.append(f"# {ch.title}\n\n{text}\n")
     book_body = "\n\n".join(content_parts)
 
-    file_name = f"{uuid4().hex}.txt"
-    file_path = os.path.join(storage_root, file_name)
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(book_body)
+    book_key = new_key(f"{uuid4().hex}.txt")
+    await asyncio.to_thread(
+        put_precompressed, get_storage(), "books", book_key, book_body.encode("utf-8"), "text/plain; charset=utf-8"
+    )
 
-    book_url = _build_public_url("books", file_name)
+    book_url = build_public_url("books", book_key)
 
     book = Book(user_id=payload.user_id, title=payload.title, description=None, pdf_url=book_url)
     db.add(book)
@@ -281,11 +672,11 @@ async def generate_book(payload: GenerateBookRequest, db: Session = Depends(get_
 
 
 @app.get("/admin/stats")
-async def admin_stats(db: Session = Depends(get_db)):
-    users = db.query(User).count()
-    chapters = db.query(Chapter).count()
-    books = db.query(Book).count()
-    return {"users": users, "chapters": chapters, "books": books}
+async def admin_stats(request: Request, refresh: bool = False):
+    """Users, chapters by status/model, books and storage bytes; cached for a short TTL."""
+    if refresh:
+        require_admin(request)
+    return await get_stats(force=refresh)
 
 
 @app.post("/admin/seed_demo")
@@ -296,6 +687,38 @@ async def admin_seed_demo(request: Request, db: Session = Depends(get_db)):
     return result
 
 
+class SyntheticRequest(BaseModel):
+    users: int = 10
+    chapters_per_user: int = 100
+    books_per_user: int = 1
+    audio: bool = False
+    seed: Optional[int] = None
+
+
+@app.post("/admin/synthetic")
+async def admin_synthetic(payload: SyntheticRequest, request: Request):
+    """
+    Bulk-generate a synthetic dataset (see synthetic_service). Removed again by
+    /admin/clear_demo. For millions of rows prefer the CLI, which needs no open request.
+    """
+    require_admin(request)
+    if min(payload.users, payload.chapters_per_user, payload.books_per_user) < 0:
+        raise HTTPException(status_code=400, detail="counts must not be negative")
+    try:
+        result = await asyncio.to_thread(
+            generate_synthetic,
+            payload.users,
+            payload.chapters_per_user,
+            payload.books_per_user,
+            payload.audio,
+            payload.seed,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    send_telegram(f"Synthetic data generated: {result['users']} users, {result['chapters']} chapters in {result['seconds']}s")
+    return result
+
+
 @app.post("/admin/clear_demo")
 async def admin_clear_demo(request: Request, db: Session = Depends(get_db)):
     """Remove all demo data (demo user + related chapters + books)."""
@@ -306,9 +729,126 @@ async def admin_clear_demo(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/admin/health")
-async def admin_health(request: Request, db: Session = Depends(get_db)):
+async def admin_health(request: Request, refresh: bool = False):
+    """Latest health snapshot (refreshed in the background); ?refresh=true re-probes now."""
     require_admin(request)
-    return collect_health(db)
+    return await get_health(force=refresh)
+
+
+@app.get("/admin/health/history")
+async def admin_health_history(request: Request, limit: Optional[int] = None):
+    require_admin(request)
+    return health_history(limit)
+
+
+@app.get("/admin/recovery")
+async def admin_recovery_status(request: Request):
+    require_admin(request)
+    return recovery_status()
+
+
+@app.post("/admin/recovery")
+async def admin_run_recovery(request: Request):
+    """Sweep stuck pending chapters now instead of waiting for the next interval."""
+    require_admin(request)
+    return await run_recovery()
+
+
+@app.get("/admin/ai_queue")
+async def admin_ai_queue(request: Request):
+    """
+    AI work state of the worker answering: fair-scheduler running/queued calls
+    and wait times per user, and single-flight coalescing counters.
+    """
+    require_admin(request)
+    return {**queue_stats(), "single_flight": flight_stats()}
+
+
+@app.get("/admin/ai_calls")
+async def admin_ai_calls(
+    request: Request, chapter_id: Optional[int] = None, limit: int = 50, db: Session = Depends(get_db)
+):
+    """Latest AI call ledger rows, optionally for one chapter."""
+    require_admin(request)
+    return {"calls": recent_calls(db, chapter_id, max(1, min(limit, 500))), "ledger": ledger_status()}
+
+
+@app.get("/admin/ai_calls/rollup")
+async def admin_ai_calls_rollup(
+    request: Request, days: int = 7, kind: Optional[str] = None, db: Session = Depends(get_db)
+):
+    """
+    Capacity planning: per day, kind and model, call/failure/retry counts,
+    tokens or audio seconds, and p50/p95 time-to-first-byte and total time.
+    """
+    require_admin(request)
+    rows = await asyncio.to_thread(rollup, db, max(1, min(days, 90)), kind)
+    return {"days": days, "rows": rows, "ledger": ledger_status()}
+
+
+@app.get("/admin/ai_planner")
+async def admin_ai_planner(request: Request):
+    """Polish planner settings, observed per-model throughput and this worker's recent decisions."""
+    require_admin(request)
+    return planner_status()
+
+
+@app.post("/admin/chapters/{chapter_id}/retry", response_model=ChapterOut)
+async def admin_retry_chapter(chapter_id: int, request: Request, db: Session = Depends(get_db)):
+    """Re-drive a failed (or stuck) chapter immediately with a fresh retry budget."""
+    require_admin(request)
+    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+    if not chapter:
+        raise HTTPException(status_code=404, detail="chapter not found")
+    if chapter.status == "polished":
+        raise HTTPException(status_code=400, detail="chapter is already polished")
+    chapter.status = "pending"
+    chapter.attempts = 1
+    db.add(chapter)
+    db.commit()
+    await process_chapter(db, chapter, priority="interactive")
+    db.refresh(chapter)
+    return chapter
+
+
+@app.post("/admin/dedup/reindex")
+async def admin_dedup_reindex(
+    request: Request, user_id: Optional[int] = None, all: bool = False, db: Session = Depends(get_db)
+):
+    """Add chapters missing from the near-duplicate index (all=true rebuilds it, e.g. after changing DEDUP_*)."""
+    require_admin(request)
+    return await asyncio.to_thread(reindex, db, user_id, not all)
+
+
+@app.post("/admin/storage_gc")
+async def admin_storage_gc(request: Request, db: Session = Depends(get_db)):
+    """Run one storage GC pass now (quarantine orphans, delete expired ones)."""
+    require_admin(request)
+    return await asyncio.to_thread(run_storage_gc, db)
+
+
+@app.get("/media/{kind}/{key:path}")
+async def media(kind: str, key: str, request: Request, sig: Optional[str] = None, expires: int = 3600):
+    """
+    Authorize a media request, then hand delivery off so bytes never pass
+    through Python: X-Accel-Redirect to nginx for local storage, a presigned
+    redirect for S3. Unauthorized and missing objects both answer 404.
+    """
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail="unknown media kind")
+    key = key_from_url(kind, key)
+    # An open admin API (no ADMIN_TOKEN) does not open hidden or unsigned media
+    admin = bool(os.getenv("ADMIN_TOKEN")) and is_admin(request)
+    if not key or not media_allowed(kind, key, sig, admin):
+        raise HTTPException(status_code=404, detail="media not found")
+    storage = get_storage()
+    if not await asyncio.to_thread(storage.exists, kind, key):
+        raise HTTPException(status_code=404, detail="media not found")
+    if isinstance(storage, LocalStorage):
+        return local_media_response(storage, kind, key)
+    expires = max(60, min(expires, 7 * 24 * 3600))
+    url = await asyncio.to_thread(storage.presigned_url, kind, key, expires)
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
 
 
 class TranscribeRequest(BaseModel):
@@ -327,39 +867,83 @@ async def transcribe_and_polish(
     if not chapter:
         raise HTTPException(status_code=404, detail="chapter not found")
 
-    chapter.transcript_text = payload.transcript_text
     anchor = payload.anchor_prompt or chapter.anchor_prompt or ""
-    polished, model_used = await rewrite_memory(anchor, payload.transcript_text, payload.model)
-    chapter.polished_text = polished
-    chapter.polished_by_model = model_used
-    chapter.status = "polished"
-
-    db.add(chapter)
-    db.commit()
+    db.commit()  # hold no connection while the model runs
+    await polish_chapter(chapter.id, anchor, payload.transcript_text, payload.model)
     db.refresh(chapter)
-
-    send_telegram(f"Chapter polished: id {chapter_id}, title '{chapter.title}', model: {model_used}")
     return chapter
 
 
 @app.get("/chapters/{chapter_id}", response_model=ChapterOut)
-async def get_chapter(chapter_id: int, db: Session = Depends(get_db)):
+async def get_chapter(chapter_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag = row_etag(db, "chapter", chapter_id)
+    if etag:
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        response.headers["ETag"] = etag
+    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+    if not chapter:
+        raise HTTPException(status_code=404, detail="chapter not found")
+    return chapter
+
+
+@app.get("/chapters/{chapter_id}/similar")
+async def get_similar_chapters(
+    chapter_id: int, threshold: float = DEDUP_THRESHOLD, limit: int = 5, db: Session = Depends(get_db)
+):
+    """The same user's chapters whose transcripts are near-duplicates of this one (MinHash LSH)."""
+    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+    if not chapter:
+        raise HTTPException(status_code=404, detail="chapter not found")
+    return similar_chapters(db, chapter, max(0.0, min(threshold, 1.0)), max(1, min(limit, 50)))
+
+
+@app.post("/chapters/{chapter_id}/reuse_polished", response_model=ChapterOut)
+async def reuse_polished_chapter(chapter_id: int, db: Session = Depends(get_db)):
+    """
+    Accept the offer for a chapter held as a near-duplicate: copy the polished
+    text of the chapter it retells instead of calling the model. To polish it
+    anyway, use POST /chapters/{id}/polish.
+    """
     chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
     if not chapter:
         raise HTTPException(status_code=404, detail="chapter not found")
+    if chapter.status != "duplicate":
+        raise HTTPException(status_code=409, detail="chapter is not held as a duplicate")
+    original = db.get(Chapter, chapter.duplicate_of) if chapter.duplicate_of else None
+    if original is None or not original.polished_text:
+        raise HTTPException(status_code=409, detail="chapter has no polished duplicate to reuse")
+    chapter.polished_text = original.polished_text
+    chapter.polished_by_model = original.polished_by_model
+    chapter.status = "polished"
+    db.add(chapter)
+    publish_chapter(db, chapter)
+    db.commit()
+    db.refresh(chapter)
     return chapter
 
 
 @app.get("/books", response_model=List[BookOut])
-async def list_books(user_id: Optional[int] = None, db: Session = Depends(get_db)):
-    query = db.query(Book)
+async def list_books(request: Request, user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    cached, etag = check_list(request, db, "book", user_id)
+    if cached:
+        return cached
+    query = select(*out_columns(Book, BookOut))
     if user_id is not None:
-        query = query.filter(Book.user_id == user_id)
-    return query.order_by(Book.created_at.desc()).all()
+        query = query.where(Book.user_id == user_id)
+    rows = db.execute(query.order_by(Book.created_at.desc())).mappings()
+    return json_response(_signed_rows(rows, "books", "pdf_url"), headers={"ETag": etag})
 
 
 @app.get("/books/{book_id}", response_model=BookOut)
-async def get_book(book_id: int, db: Session = Depends(get_db)):
+async def get_book(book_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag = row_etag(db, "book", book_id)
+    if etag:
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        response.headers["ETag"] = etag
     book = db.query(Book).filter(Book.id == book_id).first()
     if not book:
         raise HTTPException(status_code=404, detail="book not found")
@@ -372,7 +956,8 @@ async def delete_book(book_id: int, db: Session = Depends(get_db)):
     if not book:
         raise HTTPException(status_code=404, detail="book not found")
     if book.pdf_url:
-        _safe_delete(_resolve_storage_path("books", book.pdf_url))
+        delete_url("books", book.pdf_url)
+    record_tombstones(db, "book", Book.id == book.id)
     db.delete(book)
     db.commit()
     return None
@@ -396,19 +981,64 @@ async def update_book(book_id: int, payload: BookUpdate, db: Session = Depends(g
 
 
 @app.get("/users", response_model=List[UserOut])
-async def list_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+async def list_users(request: Request, db: Session = Depends(get_db)):
+    cached, etag = check_list(request, db, "user")
+    if cached:
+        return cached
+    rows = db.execute(select(*out_columns(User, UserOut))).mappings()
+    return json_response(rows, headers={"ETag": etag})
 
 
 @app.get("/users/{user_id}", response_model=UserOut)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag = row_etag(db, "user", user_id)
+    if etag:
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        response.headers["ETag"] = etag
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="user not found")
     return user
 
 
+@app.get("/users/{user_id}/export")
+async def export_user_archive(user_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    The user's whole memoir (manifest, chapter texts, recordings, books) as a
+    tar stream. Supports single byte ranges so interrupted downloads resume.
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="user not found")
+    etag = archive_etag(db, user)
+    archive = await asyncio.to_thread(build_user_archive, db, user)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="bioweaver-user-{user_id}.tar"',
+    }
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), archive.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{archive.size}"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(archive.size)
+        return StreamingResponse(archive.stream(), media_type="application/x-tar", headers=headers)
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+    return StreamingResponse(
+        archive.stream(start, end), status_code=206, media_type="application/x-tar", headers=headers
+    )
+
+
 @app.post("/users")
 async def create_user(payload: CreateUserRequest, db: Session = Depends(get_db)):
     exists = db.query(User).filter(User.email == payload.email).first()
@@ -441,12 +1071,25 @@ async def update_user(user_id: int, payload: UserUpdate, db: Session = Depends(g
 
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+async def delete_user(user_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    if db.execute(select(User.id).where(User.id == user_id)).first() is None:
+        raise HTTPException(status_code=404, detail="user not found")
+    # Queue file paths, tombstones and events first: the chapter/book rows go away with the cascade below
+    queue_user_media(db, user_id)
+    record_tombstones(db, "chapter", Chapter.user_id == user_id)
+    record_tombstones(db, "book", Book.user_id == user_id)
+    record_tombstones(db, "user", User.id == user_id)
+    chapter_ids = db.execute(
+        select(Chapter.id).where(Chapter.user_id == user_id).execution_options(yield_per=1000)
+    ).scalars()
+    publish_chapters_deleted(db, user_id, chapter_ids)
+    # Single DELETE; chapters and books are removed by ON DELETE CASCADE
+    deleted = db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+    if not deleted:
+        db.rollback()
         raise HTTPException(status_code=404, detail="user not found")
-    db.delete(user)
     db.commit()
+    background_tasks.add_task(purge_queued_media_now)
     return None
 
 
@@ -462,17 +1105,9 @@ async def polish_existing_transcript(
     if not chapter.transcript_text:
         raise HTTPException(status_code=400, detail="no transcript to polish")
 
-    anchor = chapter.anchor_prompt or ""
-    polished, model_used = await rewrite_memory(anchor, chapter.transcript_text, model)
-    chapter.polished_text = polished
-    chapter.polished_by_model = model_used
-    chapter.status = "polished"
-
-    db.add(chapter)
-    db.commit()
+    db.commit()  # hold no connection while the model runs
+    await polish_chapter(chapter.id, chapter.anchor_prompt or "", chapter.transcript_text, model, label="re-polished")
     db.refresh(chapter)
-
-    send_telegram(f"Chapter re-polished: id {chapter_id}, title '{chapter.title}', model: {model_used}")
     return chapter
 
 
@@ -492,8 +1127,9 @@ async def update_chapter(
         chapter.anchor_prompt = payload.anchor_prompt
     if payload.status is not None:
         chapter.status = payload.status
-    if payload.transcript_text is not None:
+    if payload.transcript_text is not None and payload.transcript_text != chapter.transcript_text:
         chapter.transcript_text = payload.transcript_text
+        store_signature(db, chapter, await asyncio.to_thread(signature, chapter.transcript_text))
     if payload.polished_text is not None:
         chapter.polished_text = payload.polished_text
     if payload.audio_url is not None:
@@ -502,6 +1138,7 @@ async def update_chapter(
         chapter.segment_index = payload.segment_index
 
     db.add(chapter)
+    publish_chapter(db, chapter)
     db.commit()
     db.refresh(chapter)
     return chapter
@@ -513,7 +1150,11 @@ async def delete_chapter(chapter_id: int, db: Session = Depends(get_db)):
     if not chapter:
         raise HTTPException(status_code=404, detail="chapter not found")
     if chapter.audio_url:
-        _safe_delete(_resolve_storage_path("audio", chapter.audio_url))
+        delete_url("audio", chapter.audio_url)
+    if chapter.normalized_audio_url:
+        delete_url("audio", chapter.normalized_audio_url)
+    publish_chapter_deleted(db, chapter.id, chapter.user_id)
+    record_tombstones(db, "chapter", Chapter.id == chapter.id)
     db.delete(chapter)
     db.commit()
     return None
@@ -0,0 +1,97 @@
+"""
+Media delivery: the API authorizes, nginx moves the bytes.
+
+For local storage /media answers with an empty response carrying
+X-Accel-Redirect: /_protected/<kind>/<key>. nginx serves that internal
+location straight from disk with sendfile, Range, ETag/If-None-Match and
+gzip_static, so no media byte passes through Python. With
+MEDIA_ACCEL_REDIRECT off (running uvicorn without nginx) the file is sent by
+the app instead. S3 objects are delivered by presigned-URL redirect.
+
+Book files are written with a precompressed .gz sibling (when it shrinks by
+at least PRECOMPRESS_MIN_SAVING), so text downloads cost no CPU per request.
+Add "br" to MEDIA_PRECOMPRESS only with an nginx built with ngx_brotli and
+brotli_static enabled; otherwise nothing serves the .br files.
+"""
+
+import gzip
+import hmac
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Response
+from fastapi.responses import FileResponse
+
+from storage_service import LocalStorage, StorageBackend, media_signature
+
+
+def _bool_env(name: str, default: bool = False) -> bool:
+    val = (os.getenv(name, "") or "").strip().lower()
+    if not val:
+        return default
+    return val in ("1", "true", "yes", "y", "on")
+
+
+MEDIA_ACCEL_REDIRECT = _bool_env("MEDIA_ACCEL_REDIRECT", False)
+MEDIA_ACCEL_PREFIX = (os.getenv("MEDIA_ACCEL_PREFIX", "/_protected") or "/_protected").rstrip("/")
+MEDIA_CACHE_SECONDS = int(os.getenv("MEDIA_CACHE_SECONDS", "3600") or "3600")
+PRECOMPRESS_FORMATS = [f.strip() for f in (os.getenv("MEDIA_PRECOMPRESS", "gz") or "").split(",") if f.strip()]
+PRECOMPRESS_MIN_BYTES = 1024
+# Already-compressed formats (EPUB, PDF) do not shrink; skip siblings that save less than this
+PRECOMPRESS_MIN_SAVING = 0.1
+
+
+def media_allowed(kind: str, key: str, sig: Optional[str], is_admin: bool) -> bool:
+    """
+    Whether a /media request may be served: admins may fetch anything; others
+    need a visible key (no dot-prefixed part such as .quarantine) and, when
+    MEDIA_SIGNING_KEY is set, the URL's signature.
+    """
+    if is_admin:
+        return True
+    if any(part.startswith(".") for part in key.split("/")):
+        return False
+    expected = media_signature(kind, key)
+    return expected is None or (sig is not None and hmac.compare_digest(expected, sig))
+
+
+def local_media_response(storage: LocalStorage, kind: str, key: str) -> Response:
+    headers = {"Cache-Control": f"private, max-age={MEDIA_CACHE_SECONDS}"}
+    if MEDIA_ACCEL_REDIRECT:
+        # Content-Type, Range, ETag and compression are decided by nginx for the internal location
+        headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_PREFIX}/{kind}/{quote(key)}"
+        return Response(status_code=200, headers=headers)
+    return FileResponse(storage.path(kind, key), headers=headers)
+
+
+# --- precompressed siblings ------------------------------------------------------------
+
+
+def _compress(fmt: str, data: bytes) -> Optional[bytes]:
+    if fmt == "gz":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if fmt == "br":
+        try:
+            import brotli  # optional (not in requirements.txt): without it no .br siblings
+        except ImportError:
+            return None
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def put_precompressed(storage: StorageBackend, kind: str, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+    """
+    Store `data` under `key` plus compressed "<key>.gz"/"<key>.br" siblings for
+    nginx gzip_static/brotli_static (local storage only; S3 has no equivalent).
+    """
+    written = storage.put_bytes(kind, key, data, content_type)
+    if not isinstance(storage, LocalStorage) or len(data) < PRECOMPRESS_MIN_BYTES:
+        return written
+    for fmt in PRECOMPRESS_FORMATS:
+        compressed = _compress(fmt, data)
+        if compressed is None or len(compressed) > len(data) * (1 - PRECOMPRESS_MIN_SAVING):
+            storage.delete(kind, f"{key}.{fmt}")  # never leave a stale sibling of an overwritten key
+            continue
+        storage.put_bytes(kind, f"{key}.{fmt}", compressed)
+    return written
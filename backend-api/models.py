@@ -1,10 +1,33 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, SmallInteger, String, Text, func
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.sql.expression import FunctionElement
 
 Base = declarative_base()
 
 
+class clock_now(FunctionElement):
+    """
+    Wall-clock time at statement execution. Postgres now() is frozen at
+    transaction start, which would let long AI-call transactions write
+    updated_at values older than a client's sync cursor.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(clock_now, "postgresql")
+def _pg_clock_now(element, compiler, **kw):
+    return "clock_timestamp()"
+
+
+@compiles(clock_now)
+def _default_clock_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -12,37 +35,133 @@ class User(Base):
     name = Column(String(120), nullable=False)
     email = Column(String(255), unique=True, index=True, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=clock_now(), onupdate=clock_now(), index=True, nullable=False)
 
-    chapters = relationship("Chapter", back_populates="user", cascade="all, delete-orphan")
-    books = relationship("Book", back_populates="user", cascade="all, delete-orphan")
+    # Child rows are removed by the database (ON DELETE CASCADE); passive_deletes keeps
+    # SQLAlchemy from loading every chapter/book just to delete it row by row.
+    chapters = relationship("Chapter", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    books = relationship("Book", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Chapter(Base):
     __tablename__ = "chapters"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     title = Column(String(255), nullable=False)
     anchor_prompt = Column(String(255), nullable=True)
     segment_index = Column(Integer, default=0, nullable=False)
     audio_url = Column(String(512), nullable=True)
+    normalized_audio_url = Column(String(512), nullable=True)  # 16 kHz mono copy sent to Whisper
     transcript_text = Column(Text, nullable=True)
     polished_text = Column(Text, nullable=True)
     polished_by_model = Column(String(100), nullable=True)  # Track which AI model was used
-    status = Column(String(50), default="pending", nullable=False)
+    status = Column(String(50), default="pending", nullable=False)  # pending | polished | failed | duplicate (waits for the user)
+    attempts = Column(Integer, default=0, nullable=False)  # processing attempts started
+    last_error = Column(Text, nullable=True)  # why the last attempt failed
+    # Near-duplicate of this (polished) chapter of the same user, found when transcribed (dedup_service)
+    duplicate_of = Column(Integer, ForeignKey("chapters.id", ondelete="SET NULL"), nullable=True)
+    # Client-generated per recording: a retried upload returns the chapter already created for it
+    idempotency_key = Column(String(64), nullable=True)
+    # Lease on the chapter's AI work: one worker at a time calls the models for it (pipeline_service)
+    lease_owner = Column(String(32), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=clock_now(), onupdate=clock_now(), index=True, nullable=False)
 
     user = relationship("User", back_populates="chapters")
 
+    __table_args__ = (
+        # The recovery sweeper scans pending chapters by age
+        Index("ix_chapters_status_updated_at", "status", "updated_at"),
+        Index("ix_chapters_user_idempotency_key", "user_id", "idempotency_key", unique=True),
+    )
+
+
+class ChapterSignature(Base):
+    """MinHash signature of a chapter's transcript: packed little-endian uint32 values (dedup_service)."""
+
+    __tablename__ = "chapter_signatures"
+
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    signature = Column(LargeBinary, nullable=False)
+
+
+class ChapterLSHBucket(Base):
+    """One LSH band of a chapter's signature; chapters sharing a bucket are near-duplicate candidates."""
+
+    __tablename__ = "chapter_lsh_buckets"
+
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), primary_key=True)
+    band = Column(SmallInteger, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    bucket = Column(BigInteger, nullable=False)  # hash of the band's values, band number included
+
+    __table_args__ = (Index("ix_chapter_lsh_buckets_user_bucket", "user_id", "bucket"),)
+
 
 class Book(Base):
     __tablename__ = "books"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     pdf_url = Column(String(512), nullable=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=clock_now(), onupdate=clock_now(), index=True, nullable=False)
 
     user = relationship("User", back_populates="books")
+
+
+class Tombstone(Base):
+    """Record of a deleted row, so delta sync clients learn about deletions."""
+
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String(20), nullable=False)  # "user" | "chapter" | "book"
+    entity_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, index=True, nullable=True)
+    deleted_at = Column(DateTime, default=clock_now(), index=True, nullable=False)
+
+
+class MediaPurge(Base):
+    """A stored object to delete once its rows are gone (user deletion); drained in the background."""
+
+    __tablename__ = "media_purges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)  # "audio" | "books"
+    url = Column(String(512), nullable=False)
+    created_at = Column(DateTime, default=clock_now(), nullable=False)
+
+
+class AICall(Base):
+    """
+    Append-only ledger of upstream AI calls (one row per logical call, retries
+    included), written in batches by ledger_service. No foreign keys: rows
+    outlive the chapters and users they were made for.
+    """
+
+    __tablename__ = "ai_calls"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=func.now(), index=True, nullable=False)
+    kind = Column(String(20), nullable=False)  # "transcribe" | "polish"
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(40), nullable=True)
+    plan = Column(String(80), nullable=True)  # planner decision, e.g. "premium/chunked x3 max=1400"
+    chapter_id = Column(Integer, index=True, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    audio_seconds = Column(Float, nullable=True)
+    headers_ms = Column(Integer, nullable=True)  # until response headers, last attempt (~total_ms unless streamed)
+    first_token_ms = Column(Integer, nullable=True)  # until the first streamed token, last attempt (polish only)
+    total_ms = Column(Integer, nullable=False)  # whole call, all attempts
+    attempts = Column(Integer, nullable=False)
+    status_code = Column(Integer, nullable=True)  # last HTTP status, None if no response
+    outcome = Column(String(20), nullable=False)  # ok | http_error | network_error | error
+    error = Column(Text, nullable=True)
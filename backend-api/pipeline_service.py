@@ -0,0 +1,580 @@
+"""
+Chapter processing pipeline and crash-recovery sweeper.
+
+process_chapter() drives a chapter from wherever it stopped (no transcript ->
+normalize + transcribe; transcript but unpolished -> polish) to "polished",
+saving each stage as it completes. A failed attempt records its reason in
+last_error; after CHAPTER_MAX_ATTEMPTS the chapter becomes "failed".
+
+The sweeper re-drives chapters left "pending" longer than CHAPTER_STUCK_SECONDS
+(a crashed worker, a failed upload). A chapter held as "duplicate" is not
+stuck: it stays held until the user reuses the original's text
+(POST /chapters/{id}/reuse_polished) or polishes it anyway, so the sweeper
+never picks it up. Claims use SELECT ... FOR UPDATE SKIP
+LOCKED and bump attempts/updated_at in the same transaction, so concurrent
+sweepers in other workers skip rows already taken, and a claim acts as a lease
+until the stuck timeout passes again.
+
+Work on a chapter is single-flight: concurrent process/polish requests for the
+same chapter share one run in a worker, and identical Whisper/LLM requests
+share one upstream call. Across workers, a run first claims the chapter's
+lease (lease_owner/lease_until, taken with a conditional UPDATE): the loser
+polls until it is released and then reuses the winner's result, so a chapter
+gets one upstream call however many workers ask. A lease whose holder died
+lapses after CHAPTER_LEASE_SECONDS. Chapter writes still take a per-chapter
+advisory lock for their transaction and re-read the row first, so a run that
+outlived its lease does not overwrite a newer result. No transaction (and so
+no pooled connection) is held while waiting for a lease, a scheduler slot or
+a model; sessions here keep their loaded attributes across commits for that
+reason.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from uuid import uuid4
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from audio_service import normalize_audio, normalized_key
+from db import SessionLocal
+from dedup_service import DEDUP_ENABLED, find_polished_duplicate, signature, store_signature
+from events_service import publish_chapter
+from ledger_service import call_context
+from lifecycle_service import is_draining
+from models import Chapter
+from planner_service import PolishPlan, plan_polish
+from scheduler_service import ai_slot
+from singleflight_service import file_digest, request_key, single_flight, xact_lock
+from services import ai_service
+from services.ai_service import rewrite_memory
+from storage_service import build_public_url, get_storage, iter_file_chunks, key_from_url
+from sync_service import db_now
+from telegram_service import send_telegram
+from whisper_service import transcribe_file
+
+logger = logging.getLogger(__name__)
+
+CHAPTER_MAX_ATTEMPTS = int(os.getenv("CHAPTER_MAX_ATTEMPTS", "3") or "3")
+# Longer than one full normalize + transcribe + polish pass with its retries
+CHAPTER_STUCK_SECONDS = int(os.getenv("CHAPTER_STUCK_SECONDS", "900") or "900")
+RECOVERY_INTERVAL_SECONDS = int(os.getenv("RECOVERY_INTERVAL_SECONDS", "60") or "0")
+RECOVERY_BATCH_SIZE = int(os.getenv("RECOVERY_BATCH_SIZE", "5") or "5")
+# Outlasts a full run like the stuck timeout; only matters when the holder dies
+CHAPTER_LEASE_SECONDS = int(os.getenv("CHAPTER_LEASE_SECONDS", "") or str(CHAPTER_STUCK_SECONDS))
+LEASE_POLL_SECONDS = 1.0
+MAX_ERROR_CHARS = 1000
+
+T = TypeVar("T")
+
+_status: Dict[str, Any] = {
+    "last_run_at": None,
+    "last_duration_seconds": None,
+    "last_result": None,
+    "last_error": None,
+}
+
+
+class PipelineError(Exception):
+    """A stage finished without usable output (the AI services swallow their own errors)."""
+
+
+async def _transcribe(db: Session, chapter: Chapter, priority: str) -> str:
+    storage = get_storage()
+    if not chapter.audio_url:
+        raise PipelineError("no audio to transcribe")
+    audio_key = key_from_url("audio", chapter.audio_url)
+    if not audio_key or not storage.exists("audio", audio_key):
+        raise PipelineError(f"audio object missing: {chapter.audio_url}")
+
+    local_path, is_temp = None, False
+    normalized_path = None
+    try:
+        norm_key = key_from_url("audio", chapter.normalized_audio_url) if chapter.normalized_audio_url else None
+        if norm_key and storage.exists("audio", norm_key):
+            # Normalized on an earlier attempt
+            local_path, is_temp = await asyncio.to_thread(storage.local_copy, "audio", norm_key)
+        else:
+            local_path, is_temp = await asyncio.to_thread(storage.local_copy, "audio", audio_key)
+            # Whisper gets the 16 kHz mono copy when ffmpeg succeeds, else the original
+            normalized_path = await normalize_audio(local_path)
+            if normalized_path:
+                norm_key = normalized_key(audio_key)
+                with open(normalized_path, "rb") as f:
+                    await asyncio.to_thread(storage.put_stream, "audio", norm_key, iter_file_chunks(f))
+                chapter.normalized_audio_url = build_public_url("audio", norm_key)
+                db.add(chapter)
+                db.commit()
+        transcript = await _transcribe_once(chapter.user_id, local_path, normalized_path or local_path, priority)
+    finally:
+        if is_temp and local_path:
+            os.remove(local_path)
+        if normalized_path:
+            os.remove(normalized_path)
+    if not transcript or not transcript.strip():
+        raise PipelineError("transcription returned no text")
+    return transcript
+
+
+async def _transcribe_once(user_id: int, source_path: str, audio_path: str, priority: str) -> str:
+    """Whisper call keyed by the source audio's content, shared by identical concurrent requests."""
+    digest = await asyncio.to_thread(file_digest, source_path)
+
+    async def call() -> str:
+        async with ai_slot(user_id, priority, "transcribe"):
+            return await transcribe_file(audio_path)
+
+    return await single_flight(request_key("transcribe", digest), call)
+
+
+async def _polish_once(
+    chapter_id: int, user_id: int, anchor: str, transcript: str, model: Optional[str], priority: str
+) -> Tuple[str, str]:
+    """
+    Polish as planned by planner_service (model tier, max_tokens, one call or
+    parts polished concurrently and joined); a failed part fails the whole.
+    """
+
+    async def polish_part(plan: PolishPlan, index: int, text: str) -> Tuple[str, str]:
+        part = (index, len(plan.chunks)) if len(plan.chunks) > 1 else None
+        async with ai_slot(user_id, priority, "polish"):
+            return await rewrite_memory(anchor, text, plan.model, plan.max_tokens, part, plan.label)
+
+    async def call() -> Tuple[str, str]:
+        plan = await plan_polish(transcript, model, chapter_id)
+        results = await asyncio.gather(*(polish_part(plan, i, text) for i, text in enumerate(plan.chunks)))
+        if len(results) == 1:
+            return results[0]
+        if not all(model_used for _, model_used in results):
+            return transcript, ""
+        return "\n\n".join(text.strip() for text, _ in results), results[0][1]
+
+    return await single_flight(request_key("polish", anchor, transcript, model or ""), call)
+
+
+def _chapter_lock(chapter_id: int) -> str:
+    return f"chapter:{chapter_id}"
+
+
+def _lock_and_reload(db: Session, chapter_id: int) -> Optional[Chapter]:
+    """
+    Begin a chapter write: take the chapter's advisory lock for this
+    transaction and re-read the row (None if it was deleted meanwhile).
+    """
+    xact_lock(db, _chapter_lock(chapter_id))
+    return db.get(Chapter, chapter_id, populate_existing=True)
+
+
+# --- cross-worker lease ---------------------------------------------------------------
+
+
+def _lease_free(now):
+    return or_(Chapter.lease_until.is_(None), Chapter.lease_until < now)
+
+
+def _claim_lease(chapter_id: int, owner: str) -> bool:
+    """Take the chapter's lease unless a live one is held; False also when the chapter is gone."""
+    with SessionLocal() as db:
+        now = db_now(db)
+        result = db.execute(
+            update(Chapter)
+            .where(Chapter.id == chapter_id, _lease_free(now))
+            # updated_at kept: a lease is not a change clients should sync
+            .values(
+                lease_owner=owner,
+                lease_until=now + timedelta(seconds=CHAPTER_LEASE_SECONDS),
+                updated_at=Chapter.updated_at,
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+def _release_lease(chapter_id: int, owner: str) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(Chapter)
+            .where(Chapter.id == chapter_id, Chapter.lease_owner == owner)
+            .values(lease_owner=None, lease_until=None, updated_at=Chapter.updated_at),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+
+
+async def _wait_for_lease(chapter_id: int) -> bool:
+    """Poll until the chapter's lease is free; True if released, False if it lapsed (holder died)."""
+    while True:
+        with SessionLocal() as db:
+            now = db_now(db)
+            lease_until = db.execute(select(Chapter.lease_until).where(Chapter.id == chapter_id)).scalar_one_or_none()
+        if lease_until is None:
+            return True
+        if lease_until < now:
+            return False
+        await asyncio.sleep(LEASE_POLL_SECONDS)
+
+
+async def _with_lease(chapter_id: int, run: Callable[[], Awaitable[T]], reuse: Callable[[], Optional[T]]) -> T:
+    """
+    Run `run` holding the chapter's lease. If another worker holds it, wait
+    for its release and return reuse() (the winner's outcome, read from the
+    row); when that is None, or the lease lapsed, try to claim it again.
+    """
+    owner = uuid4().hex
+    while True:
+        if _claim_lease(chapter_id, owner):
+            try:
+                return await run()
+            finally:
+                _release_lease(chapter_id, owner)
+        if await _wait_for_lease(chapter_id):
+            reused = reuse()
+            if reused is not None:
+                return reused
+
+
+async def process_chapter(db: Session, chapter: Chapter, priority: str = "bulk") -> bool:
+    """
+    Run the remaining stages for one chapter; True once it is polished (or
+    held as a near-duplicate of a polished chapter, see _hold_if_duplicate).
+    Failures are recorded on the chapter (not raised). The caller counts the
+    attempt by incrementing chapter.attempts before calling. AI calls queue in
+    the fair scheduler under the chapter's user at `priority`.
+
+    Concurrent calls for the same chapter share one run, in this worker and
+    across workers (the lease); `chapter` is refreshed from the database
+    afterwards. The caller's transaction is committed first so its connection
+    is not held during the run.
+    """
+    chapter_id = chapter.id
+    db.commit()
+    ok = await single_flight(
+        f"process:{chapter_id}",
+        lambda: _with_lease(
+            chapter_id, lambda: _run_process(chapter_id, priority), lambda: _process_outcome(chapter_id)
+        ),
+    )
+    db.refresh(chapter)
+    return ok
+
+
+def _finished(chapter: Optional[Chapter]) -> bool:
+    return chapter is not None and chapter.status in ("polished", "duplicate")
+
+
+def _process_outcome(chapter_id: int) -> Optional[bool]:
+    """After another worker's run: its result, or None if the chapter is still pending (run it here)."""
+    with SessionLocal() as db:
+        chapter = db.get(Chapter, chapter_id)
+        if chapter is not None and chapter.status == "pending":
+            return None
+        return _finished(chapter)
+
+
+async def _run_process(chapter_id: int, priority: str) -> bool:
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        chapter = db.get(Chapter, chapter_id)
+        if chapter is None or chapter.status != "pending":
+            # Finished (or given up) by another run
+            return _finished(chapter)
+        db.commit()
+        with call_context(chapter.id, chapter.user_id):
+            return await _process(db, chapter, priority)
+    finally:
+        db.close()
+
+
+async def _process(db: Session, chapter: Chapter, priority: str) -> bool:
+    stage = "transcribe"
+    try:
+        if not chapter.transcript_text:
+            transcript = await _transcribe(db, chapter, priority)
+            if _lock_and_reload(db, chapter.id) is None or chapter.status != "pending":
+                db.commit()
+                return _finished(chapter)
+            if not chapter.transcript_text:  # else another worker transcribed it meanwhile
+                chapter.transcript_text = transcript
+                db.add(chapter)
+                publish_chapter(db, chapter)
+            db.commit()
+        stage = "dedup"
+        if await _hold_if_duplicate(db, chapter):
+            return _finished(chapter)
+        stage = "polish"
+        polished, model_used = await _polish_once(
+            chapter.id, chapter.user_id, chapter.anchor_prompt or "", chapter.transcript_text, None, priority
+        )
+        if not model_used and ai_service.OPENROUTER_API_KEY:
+            raise PipelineError("polishing failed on every model attempt")
+        if _lock_and_reload(db, chapter.id) is None or chapter.status != "pending":
+            db.commit()
+            return _finished(chapter)
+        chapter.polished_text = polished
+        chapter.polished_by_model = model_used
+        chapter.status = "polished"
+        chapter.last_error = None
+        db.add(chapter)
+        publish_chapter(db, chapter)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        reason = str(e) if isinstance(e, PipelineError) else f"{e.__class__.__name__}: {e}"
+        _record_failure(db, chapter, f"{stage}: {reason}")
+        return False
+
+
+async def _hold_if_duplicate(db: Session, chapter: Chapter) -> bool:
+    """
+    Index the transcript and, the first time a chapter turns out to retell an
+    already polished one, hold it as "duplicate" instead of polishing it: the
+    user can reuse the existing text or ask for a new polish. Also True when
+    another worker finished the chapter meanwhile (nothing left to polish).
+    """
+    sig = await asyncio.to_thread(signature, chapter.transcript_text)
+    if _lock_and_reload(db, chapter.id) is None or chapter.status != "pending":
+        db.commit()
+        return True
+    store_signature(db, chapter, sig)
+    found = None
+    if DEDUP_ENABLED and chapter.duplicate_of is None:
+        found = find_polished_duplicate(db, chapter, sig)
+    if found is None:
+        db.commit()
+        return False
+    original_id, score = found
+    logger.info(f"Chapter {chapter.id} is a near-duplicate of {original_id} (similarity {score}), holding it")
+    chapter.duplicate_of = original_id
+    chapter.status = "duplicate"
+    chapter.last_error = None
+    db.add(chapter)
+    publish_chapter(db, chapter)
+    db.commit()
+    return True
+
+
+async def polish_chapter(
+    chapter_id: int,
+    anchor: str,
+    transcript: str,
+    model: Optional[str] = None,
+    priority: str = "interactive",
+    label: str = "polished",
+) -> bool:
+    """
+    (Re-)polish a chapter from `transcript` and save it as polished; False if
+    the chapter does not exist. Identical concurrent requests (double taps,
+    retries, other workers) make one model call, one write and one notification.
+    """
+    key = request_key(f"polish-chapter:{chapter_id}", anchor, transcript, model or "")
+    return await single_flight(
+        key,
+        lambda: _with_lease(
+            chapter_id,
+            lambda: _run_polish(chapter_id, anchor, transcript, model, priority, label),
+            lambda: _polish_outcome(chapter_id, transcript, model),
+        ),
+    )
+
+
+def _polished_as_requested(chapter: Chapter, transcript: str, model: Optional[str]) -> bool:
+    return (
+        chapter.status == "polished"
+        and chapter.transcript_text == transcript
+        and (model is None or chapter.polished_by_model == model)
+    )
+
+
+def _polish_outcome(chapter_id: int, transcript: str, model: Optional[str]) -> Optional[bool]:
+    """After another worker's run: True if it saved this request, False if the chapter is gone, else None."""
+    with SessionLocal() as db:
+        chapter = db.get(Chapter, chapter_id)
+        if chapter is None:
+            return False
+        return True if _polished_as_requested(chapter, transcript, model) else None
+
+
+async def _run_polish(
+    chapter_id: int, anchor: str, transcript: str, model: Optional[str], priority: str, label: str
+) -> bool:
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        chapter = db.get(Chapter, chapter_id)
+        if chapter is None:
+            return False
+        read_at = chapter.updated_at
+        db.commit()
+        with call_context(chapter.id, chapter.user_id):
+            polished, model_used = await _polish_once(chapter.id, chapter.user_id, anchor, transcript, model, priority)
+        sig = await asyncio.to_thread(signature, transcript) if chapter.transcript_text != transcript else None
+        if _lock_and_reload(db, chapter_id) is None:
+            db.commit()
+            return False
+        if chapter.updated_at != read_at and _polished_as_requested(chapter, transcript, model):
+            db.commit()
+            return True  # another worker just saved this exact request
+        if chapter.transcript_text != transcript:
+            chapter.transcript_text = transcript
+            store_signature(db, chapter, sig if sig is not None else signature(transcript))
+        chapter.polished_text = polished
+        chapter.polished_by_model = model_used
+        chapter.status = "polished"
+        chapter.duplicate_of = None  # polished on its own, no longer a held duplicate
+        db.add(chapter)
+        publish_chapter(db, chapter)
+        db.commit()
+        send_telegram(f"Chapter {label}: id {chapter_id}, title '{chapter.title}', model: {model_used}")
+        return True
+    finally:
+        db.close()
+
+
+def _record_failure(db: Session, chapter: Chapter, reason: str) -> None:
+    logger.warning(f"Chapter {chapter.id} attempt {chapter.attempts} failed: {reason}")
+    if _lock_and_reload(db, chapter.id) is None or chapter.status != "pending":
+        db.commit()
+        return  # finished by another worker meanwhile
+    chapter.last_error = reason[:MAX_ERROR_CHARS]
+    if chapter.attempts >= CHAPTER_MAX_ATTEMPTS:
+        chapter.status = "failed"
+    db.add(chapter)
+    publish_chapter(db, chapter)
+    db.commit()
+
+
+# --- sweeper --------------------------------------------------------------------------
+
+
+def claim_stuck_chapters(db: Session, limit: int = RECOVERY_BATCH_SIZE) -> List[int]:
+    """
+    Claim up to `limit` chapters pending for longer than the stuck timeout,
+    oldest first, and count the attempt. Rows locked by another sweeper, or
+    leased by a worker still running them, are skipped.
+    """
+    now = db_now(db)
+    cutoff = now - timedelta(seconds=CHAPTER_STUCK_SECONDS)
+    stuck = (
+        select(Chapter.id)
+        .where(
+            Chapter.status == "pending",
+            Chapter.updated_at < cutoff,
+            Chapter.attempts < CHAPTER_MAX_ATTEMPTS,
+            _lease_free(now),  # still being worked on elsewhere
+        )
+        .order_by(Chapter.updated_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    ids = list(db.execute(stuck).scalars())
+    if ids:
+        db.execute(
+            update(Chapter).where(Chapter.id.in_(ids)).values(attempts=Chapter.attempts + 1),
+            execution_options={"synchronize_session": False},
+        )
+    db.commit()
+    return ids
+
+
+def fail_exhausted_chapters(db: Session) -> List[int]:
+    """
+    Chapters whose last allowed attempt died with its worker never recorded a
+    failure: mark them failed and return their ids. Runs in a worker thread, so
+    the caller publishes the events (see sweep_stuck_chapters).
+    """
+    now = db_now(db)
+    cutoff = now - timedelta(seconds=CHAPTER_STUCK_SECONDS)
+    exhausted = list(
+        db.execute(
+            select(Chapter)
+            .where(
+                Chapter.status == "pending",
+                Chapter.updated_at < cutoff,
+                Chapter.attempts >= CHAPTER_MAX_ATTEMPTS,
+                _lease_free(now),
+            )
+            .with_for_update(skip_locked=True)
+        ).scalars()
+    )
+    for chapter in exhausted:
+        chapter.status = "failed"
+        chapter.last_error = (chapter.last_error or f"gave up after {chapter.attempts} attempts (worker lost)")[:MAX_ERROR_CHARS]
+    db.commit()
+    return [chapter.id for chapter in exhausted]
+
+
+async def sweep_stuck_chapters(limit: int = RECOVERY_BATCH_SIZE) -> Dict[str, Any]:
+    """Claim a batch of stuck chapters and re-drive them one by one."""
+    db = SessionLocal()
+    try:
+        failed = await asyncio.to_thread(fail_exhausted_chapters, db)
+        if failed:
+            # On the event loop and after the commit: in-process subscriber queues are
+            # not thread-safe, and clients must not see "failed" before it is stored
+            for chapter in db.execute(select(Chapter).where(Chapter.id.in_(failed))).scalars():
+                publish_chapter(db, chapter)
+            db.commit()
+        ids = await asyncio.to_thread(claim_stuck_chapters, db, limit)
+        recovered: List[int] = []
+        still_failing: List[int] = []
+        for chapter_id in ids:
+            if is_draining():
+                break  # the claim lapses after the stuck timeout; another worker retries
+            chapter = db.get(Chapter, chapter_id)
+            if chapter is None or chapter.status != "pending":
+                continue
+            logger.info(f"Re-driving chapter {chapter_id} (attempt {chapter.attempts})")
+            if await process_chapter(db, chapter):
+                recovered.append(chapter_id)
+            else:
+                still_failing.append(chapter_id)
+        return {"claimed": ids, "recovered": recovered, "failed_again": still_failing, "marked_failed": len(failed)}
+    finally:
+        db.close()
+
+
+def recovery_status() -> Dict[str, Any]:
+    return {
+        **_status,
+        "interval_seconds": RECOVERY_INTERVAL_SECONDS,
+        "stuck_after_seconds": CHAPTER_STUCK_SECONDS,
+        "max_attempts": CHAPTER_MAX_ATTEMPTS,
+    }
+
+
+async def run_recovery() -> Dict[str, Any]:
+    started = time.time()
+    try:
+        result = await sweep_stuck_chapters()
+        _status["last_error"] = None
+    except Exception as e:
+        _status["last_error"] = str(e)
+        raise
+    finally:
+        _status["last_run_at"] = started
+        _status["last_duration_seconds"] = round(time.time() - started, 3)
+    _status["last_result"] = result
+    return result
+
+
+async def recovery_loop(interval_seconds: Optional[int] = None) -> None:
+    """
+    Periodic sweep. Runs in every worker: SKIP LOCKED keeps them from taking
+    the same chapters, and the batches spread across workers.
+    """
+    interval = interval_seconds or RECOVERY_INTERVAL_SECONDS
+    if interval <= 0:
+        return
+    while not is_draining():
+        await asyncio.sleep(interval)
+        try:
+            result = await run_recovery()
+            if result["claimed"] or result["marked_failed"]:
+                logger.info(f"Chapter recovery: {result}")
+        except Exception as e:
+            logger.error(f"Chapter recovery loop error: {e}")
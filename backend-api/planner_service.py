@@ -0,0 +1,307 @@
+"""
+Length-aware planning of polish requests.
+
+plan_polish() decides, per transcript, which model tier to use, how many
+output tokens to allow and whether to polish in one call or in chunks:
+
+- Tier: transcripts up to PLANNER_FAST_MAX_CHARS go to POLISH_FAST_MODEL
+  when one is configured; they are expanded to a few hundred characters and
+  should not queue behind the premium model. Longer ones use OPENROUTER_MODEL.
+  A model named in the request always wins.
+- max_tokens: the expected output length (the system prompt asks for 500-800
+  characters, or roughly the input length for long transcripts) converted to
+  tokens, with headroom, instead of a flat 2000 that truncates long chapters.
+- Strategy: when the expected output exceeds PLANNER_MAX_OUTPUT_TOKENS, or
+  generating it at the model's observed throughput would take longer than
+  PLANNER_MAX_CALL_SECONDS, the transcript is split at sentence boundaries
+  into parts polished concurrently (within the user's scheduler share) and
+  joined. Each part is told where it sits so only the first opens with the
+  anchor and only the last closes the chapter.
+
+Throughput per model (output tokens per second while generating, and the wait
+for the first token) comes from the AI call ledger and is refreshed every PLANNER_STATS_TTL_SECONDS.
+Each decision is logged, kept in a short in-memory history (/admin/ai_planner)
+and written to the ledger rows of its calls, so the thresholds can be tuned;
+benchmarks/bench_planner.py replays historic chapters through the planner.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import statistics
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import select
+
+from db import SessionLocal
+from models import AICall
+from scheduler_service import AI_MAX_PER_USER
+from services.ai_service import OPENROUTER_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+def _bool_env(name: str, default: bool = False) -> bool:
+    val = (os.getenv(name, "") or "").strip().lower()
+    if not val:
+        return default
+    return val in ("1", "true", "yes", "y", "on")
+
+
+PLANNER_ENABLED = _bool_env("PLANNER_ENABLED", True)
+POLISH_FAST_MODEL = (os.getenv("POLISH_FAST_MODEL", "") or "").strip()
+PLANNER_FAST_MAX_CHARS = int(os.getenv("PLANNER_FAST_MAX_CHARS", "300") or "300")
+PLANNER_MAX_OUTPUT_TOKENS = int(os.getenv("PLANNER_MAX_OUTPUT_TOKENS", "4000") or "4000")
+# Upper bound on one call's latency; the time a part may take before the planner splits
+PLANNER_MAX_CALL_SECONDS = float(os.getenv("PLANNER_MAX_CALL_SECONDS", "45") or "45")
+PLANNER_DEFAULT_TOKENS_PER_SECOND = float(os.getenv("PLANNER_DEFAULT_TOKENS_PER_SECOND", "30") or "30")
+PLANNER_STATS_TTL_SECONDS = int(os.getenv("PLANNER_STATS_TTL_SECONDS", "300") or "300")
+
+LEGACY_MAX_TOKENS = 2000
+MIN_MAX_TOKENS = 600
+TOKEN_HEADROOM = 1.3
+TARGET_CHARS = 800  # upper end of the 500-800 characters the system prompt asks for
+LONG_INPUT_CHARS = 600  # from here the prompt asks to keep the length, lightly expanded
+LONG_EXPANSION = 1.2
+CJK_TOKENS_PER_CHAR = 1.0
+OTHER_CHARS_PER_TOKEN = 4.0
+STATS_WINDOW_DAYS = 7
+STATS_SAMPLE_LIMIT = 2000
+MIN_SAMPLES = 5
+HISTORY_SIZE = 200
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\n])|(?<=\.\s)")
+
+
+@dataclass
+class ModelThroughput:
+    tokens_per_second: float
+    first_token_seconds: float
+    samples: int = 0
+
+
+@dataclass
+class PolishPlan:
+    model: str
+    tier: str  # "fast" | "premium" | "requested"
+    strategy: str  # "single" | "chunked" | "legacy"
+    max_tokens: int  # per call
+    expected_output_tokens: int
+    predicted_seconds: float
+    chunks: List[str] = field(repr=False, default_factory=list)
+
+    @property
+    def label(self) -> str:
+        """Short form stored on ledger rows, e.g. "premium/chunked x3 max=2100"."""
+        parts = f" x{len(self.chunks)}" if len(self.chunks) > 1 else ""
+        return f"{self.tier}/{self.strategy}{parts} max={self.max_tokens}"
+
+
+_throughput: Dict[str, ModelThroughput] = {}
+_throughput_at = 0.0
+_refresh_lock: Optional[asyncio.Lock] = None
+_history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about one token per CJK character, four other characters per token."""
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) / OTHER_CHARS_PER_TOKEN)
+
+
+def expected_output_chars(input_chars: int) -> int:
+    if input_chars <= LONG_INPUT_CHARS:
+        return TARGET_CHARS
+    return math.ceil(input_chars * LONG_EXPANSION)
+
+
+def expected_output_tokens(transcript: str) -> int:
+    # Scale the input's token density to the expected output length
+    chars = max(len(transcript), 1)
+    density = estimate_tokens(transcript) / chars
+    return math.ceil(expected_output_chars(chars) * density)
+
+
+def split_transcript(transcript: str, parts: int) -> List[str]:
+    """Split into `parts` pieces of similar length at sentence boundaries."""
+    if parts <= 1:
+        return [transcript]
+    target = len(transcript) / parts
+    sentences: List[str] = []
+    for sentence in _SENTENCE_END.split(transcript):
+        # Unpunctuated transcripts are common; cut overlong runs by length
+        step = math.ceil(target)
+        sentences.extend(sentence[i : i + step] for i in range(0, len(sentence), step))
+    chunks: List[str] = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + len(sentence) > target and len(chunks) < parts - 1:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current:
+        chunks.append(current)
+    return [c.strip() for c in chunks if c.strip()]
+
+
+def throughput_for(model: str, stats: Optional[Dict[str, ModelThroughput]] = None) -> ModelThroughput:
+    stats = _throughput if stats is None else stats
+    return stats.get(model) or ModelThroughput(PLANNER_DEFAULT_TOKENS_PER_SECOND, 2.0)
+
+
+def predict_seconds(model: str, output_tokens: int, stats: Optional[Dict[str, ModelThroughput]] = None) -> float:
+    t = throughput_for(model, stats)
+    return t.first_token_seconds + output_tokens / max(t.tokens_per_second, 0.1)
+
+
+def make_plan(
+    transcript: str, model: Optional[str] = None, stats: Optional[Dict[str, ModelThroughput]] = None
+) -> PolishPlan:
+    """Pure planning step (no I/O), shared by plan_polish() and the offline simulation."""
+    if not PLANNER_ENABLED:
+        chosen = model or OPENROUTER_MODEL
+        expected = expected_output_tokens(transcript)
+        return PolishPlan(
+            chosen, "requested" if model else "premium", "legacy", LEGACY_MAX_TOKENS,
+            expected, round(predict_seconds(chosen, min(expected, LEGACY_MAX_TOKENS), stats), 2), [transcript],
+        )
+    if model:
+        chosen, tier = model, "requested"
+    elif POLISH_FAST_MODEL and len(transcript) <= PLANNER_FAST_MAX_CHARS:
+        chosen, tier = POLISH_FAST_MODEL, "fast"
+    else:
+        chosen, tier = OPENROUTER_MODEL, "premium"
+
+    expected = expected_output_tokens(transcript)
+    speed = throughput_for(chosen, stats)
+    # Output one call may produce: the model's cap, and what it generates within the time limit
+    in_time = int((PLANNER_MAX_CALL_SECONDS - speed.first_token_seconds) * speed.tokens_per_second)
+    budget_tokens = min(PLANNER_MAX_OUTPUT_TOKENS, max(MIN_MAX_TOKENS, in_time))
+    parts = max(1, math.ceil(expected * TOKEN_HEADROOM / budget_tokens))
+    chunks = split_transcript(transcript, parts)
+    per_call = max(expected_output_tokens(c) for c in chunks)
+    max_tokens = min(PLANNER_MAX_OUTPUT_TOKENS, max(MIN_MAX_TOKENS, math.ceil(per_call * TOKEN_HEADROOM)))
+    return PolishPlan(
+        chosen,
+        tier,
+        "chunked" if len(chunks) > 1 else "single",
+        max_tokens,
+        expected,
+        # Parts run concurrently, at most AI_MAX_PER_USER at a time for one user
+        round(predict_seconds(chosen, per_call, stats) * math.ceil(len(chunks) / max(AI_MAX_PER_USER, 1)), 2),
+        chunks,
+    )
+
+
+# --- observed throughput --------------------------------------------------------------
+
+
+def load_throughput(db) -> Dict[str, ModelThroughput]:
+    """
+    Median generation speed (output tokens/s) and wait for the first token per
+    model, from recent successful single-attempt polish calls.
+
+    Calls with a streamed first token split into the wait and the generation
+    after it. Older calls only have a total, so their rate covers the wait too
+    and no separate wait is added; they are used only while a model has fewer
+    than MIN_SAMPLES streamed calls.
+    """
+    since = datetime.utcnow() - timedelta(days=STATS_WINDOW_DAYS)
+    rows = db.execute(
+        select(AICall.model, AICall.output_tokens, AICall.total_ms, AICall.first_token_ms)
+        .where(
+            AICall.kind == "polish",
+            AICall.outcome == "ok",
+            AICall.attempts == 1,
+            AICall.output_tokens.isnot(None),
+            AICall.created_at >= since,
+        )
+        .order_by(AICall.id.desc())
+        .limit(STATS_SAMPLE_LIMIT)
+    ).all()
+    streamed: Dict[str, List[tuple]] = {}
+    whole: Dict[str, List[tuple]] = {}
+    for model, output_tokens, total_ms, first_token_ms in rows:
+        if total_ms <= 0:
+            continue
+        whole.setdefault(model, []).append((output_tokens / (total_ms / 1000), 0.0))
+        if first_token_ms is not None and total_ms > first_token_ms:
+            generating = (total_ms - first_token_ms) / 1000
+            streamed.setdefault(model, []).append((output_tokens / generating, first_token_ms / 1000))
+    samples = {model: streamed[model] if len(streamed.get(model, [])) >= MIN_SAMPLES else values for model, values in whole.items()}
+    return {
+        model: ModelThroughput(
+            round(statistics.median(tps for tps, _ in values), 2),
+            round(statistics.median(wait for _, wait in values), 3),
+            len(values),
+        )
+        for model, values in samples.items()
+        if len(values) >= MIN_SAMPLES
+    }
+
+
+def _refresh_throughput() -> None:
+    global _throughput, _throughput_at
+    db = SessionLocal(replica_reads=True)
+    try:
+        _throughput = load_throughput(db)
+    finally:
+        db.close()
+    _throughput_at = time.time()
+
+
+async def _current_throughput() -> None:
+    global _refresh_lock, _throughput_at
+    if time.time() - _throughput_at < PLANNER_STATS_TTL_SECONDS:
+        return
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    async with _refresh_lock:
+        if time.time() - _throughput_at < PLANNER_STATS_TTL_SECONDS:
+            return
+        try:
+            await asyncio.to_thread(_refresh_throughput)
+        except Exception as e:
+            # Plan with the previous (or default) figures; retry after the TTL
+            _throughput_at = time.time()
+            logger.warning(f"Planner throughput refresh failed: {e}")
+
+
+async def plan_polish(transcript: str, model: Optional[str] = None, chapter_id: Optional[int] = None) -> PolishPlan:
+    await _current_throughput()
+    plan = make_plan(transcript, model)
+    logger.info(
+        f"Polish plan chapter={chapter_id} chars={len(transcript)} model={plan.model} {plan.label} "
+        f"expected_tokens={plan.expected_output_tokens} predicted={plan.predicted_seconds}s"
+    )
+    _history.append(
+        {
+            "at": time.time(),
+            "chapter_id": chapter_id,
+            "input_chars": len(transcript),
+            **{k: v for k, v in asdict(plan).items() if k != "chunks"},
+            "chunks": len(plan.chunks),
+        }
+    )
+    return plan
+
+
+def planner_status() -> Dict[str, Any]:
+    return {
+        "enabled": PLANNER_ENABLED,
+        "premium_model": OPENROUTER_MODEL,
+        "fast_model": POLISH_FAST_MODEL or None,
+        "fast_max_chars": PLANNER_FAST_MAX_CHARS,
+        "max_output_tokens": PLANNER_MAX_OUTPUT_TOKENS,
+        "max_call_seconds": PLANNER_MAX_CALL_SECONDS,
+        "throughput": {model: asdict(t) for model, t in _throughput.items()},
+        "throughput_refreshed_at": _throughput_at or None,
+        "recent": list(_history)[-50:],
+    }
@@ -0,0 +1,57 @@
+"""
+One-shot pre-start step: wait for the database, then create/upgrade the schema.
+
+Run once per deploy before the API workers start (the Docker image does this
+in its CMD), so importing `main` has no side effects and N workers never race
+on DDL.
+
+    cd backend-api && python prestart.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+from db import engine
+from schema_service import ensure_schema
+
+logger = logging.getLogger("prestart")
+
+PRESTART_DB_WAIT_SECONDS = int(os.getenv("PRESTART_DB_WAIT_SECONDS", "60") or "60")
+
+
+def wait_for_db(timeout: int = PRESTART_DB_WAIT_SECONDS) -> None:
+    deadline = time.monotonic() + timeout
+    delay = 0.5
+    while True:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                raise
+            logger.info(f"Database not ready ({e.__class__.__name__}); retrying in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    started = time.monotonic()
+    try:
+        wait_for_db()
+        ensure_schema(engine)
+    except Exception as e:
+        logger.error(f"Pre-start failed: {e}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+    logger.info(f"Schema ready in {time.monotonic() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
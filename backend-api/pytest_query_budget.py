@@ -0,0 +1,71 @@
+"""
+pytest plugin: SQL query budgets per endpoint, so N+1 regressions fail CI.
+
+Enable it from a conftest.py next to the tests:
+
+    pytest_plugins = ["pytest_query_budget"]
+
+then either check a request against its budget
+
+    def test_list_users(client, query_budget):
+        query_budget.check(client, "GET", "/users", 2)
+
+count a block
+
+    def test_generate_book(client, query_budget):
+        with query_budget(6, "generate_book"):
+            client.post("/generate_book", json={...})
+
+or cap a whole test with a marker:
+
+    @pytest.mark.query_budget(10)
+    def test_upload_flow(client): ...
+
+Counting covers every statement in the process while the block runs,
+including the app's threads under TestClient (query_stats_service). A failure
+lists each statement with how often it ran, which points at the loop or lazy
+load to fix.
+"""
+
+import contextlib
+from typing import Any, Iterator
+
+import pytest
+
+from query_stats_service import QueryStats, count_queries
+
+
+class QueryBudget:
+    @contextlib.contextmanager
+    def __call__(self, max_queries: int, label: str = "block") -> Iterator[QueryStats]:
+        with count_queries(label) as stats:
+            yield stats
+        if stats.count > max_queries:
+            pytest.fail(f"{label} exceeded its query budget of {max_queries}: {stats.report()}", pytrace=False)
+
+    def check(self, client: Any, method: str, url: str, max_queries: int, **kwargs: Any) -> Any:
+        """Send one request through a test client and assert its statement count; returns the response."""
+        with self(max_queries, f"{method} {url}"):
+            return client.request(method, url, **kwargs)
+
+
+@pytest.fixture
+def query_budget() -> QueryBudget:
+    return QueryBudget()
+
+
+def pytest_configure(config) -> None:
+    config.addinivalue_line("markers", "query_budget(n): fail the test if it runs more than n SQL statements")
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+    max_queries = marker.args[0]
+    with count_queries(item.nodeid) as stats:
+        result = yield  # a failing test raises here and is reported as is
+    if stats.count > max_queries:
+        pytest.fail(f"{item.nodeid} exceeded its query budget of {max_queries}: {stats.report()}", pytrace=False)
+    return result
@@ -0,0 +1,162 @@
+"""
+SQL statement counting and timing, per request and for tests.
+
+Engine-level SQLAlchemy events (primary and replicas alike) time every
+statement. QueryStatsMiddleware gives each HTTP request its own tally
+through a context variable, which threads started with asyncio.to_thread and
+FastAPI's threadpool inherit. Per request:
+
+- QUERY_DEBUG_HEADERS adds X-DB-Queries, X-DB-Time-Ms and a Server-Timing
+  entry to the response (counted when the headers are sent, so statements a
+  streaming body runs later are not included).
+- A statement slower than SLOW_QUERY_MS is logged with the request path.
+- The same SQL run QUERY_REPEAT_WARN times or more in one request is logged
+  as a likely N+1 (a lazy relationship load or a lookup inside a loop).
+
+count_queries() tallies every statement in the process while it is open;
+the query_budget pytest fixture (pytest_query_budget.py) builds on it.
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _bool_env(name: str, default: bool = False) -> bool:
+    val = (os.getenv(name, "") or "").strip().lower()
+    if not val:
+        return default
+    return val in ("1", "true", "yes", "y", "on")
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_DEBUG_HEADERS = _bool_env("QUERY_DEBUG_HEADERS", False)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200") or "200")
+QUERY_REPEAT_WARN = int(os.getenv("QUERY_REPEAT_WARN", "20") or "20")
+MAX_LOGGED_SQL_CHARS = 500
+
+
+class QueryStats:
+    """Statements seen and their total time; `statements` counts runs per SQL text."""
+
+    def __init__(self, label: str = "") -> None:
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        # A Counter, not a list: an SSE request lives for hours
+        self.statements: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+
+    @property
+    def milliseconds(self) -> float:
+        return round(self.seconds * 1000, 2)
+
+    def repeated(self, at_least: int) -> List[Any]:
+        """(sql, times) for statements run at least `at_least` times, most frequent first."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= at_least]
+
+    def report(self) -> str:
+        lines = [f"{self.count} statements in {self.milliseconds} ms"]
+        for sql, n in self.statements.most_common():
+            lines.append(f"  {n:>3} x {' '.join(sql.split())[:200]}")
+        return "\n".join(lines)
+
+
+_request_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("request_query_stats", default=None)
+_collectors: List[QueryStats] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("query_started_at")
+    if not starts:
+        return  # hooks installed while this statement was running
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+    for collector in list(_collectors):
+        collector.add(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        where = f" during {stats.label}" if stats is not None else ""
+        sql = " ".join(statement.split())[:MAX_LOGGED_SQL_CHARS]
+        logger.warning(f"Slow query ({elapsed * 1000:.0f} ms){where}: {sql}")
+
+
+def _handle_error(exception_context) -> None:
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started_at"):
+        conn.info["query_started_at"].pop()
+
+
+def install_query_hooks() -> None:
+    """Listen on every Engine (idempotent)."""
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+@contextlib.contextmanager
+def count_queries(label: str = "") -> Iterator[QueryStats]:
+    """Tally every statement run in this process (any thread) while the block is open."""
+    install_query_hooks()
+    stats = QueryStats(label)
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware, so streaming responses are untouched)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        install_query_hooks()
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats(f"{scope['method']} {scope['path']}")
+        token = _request_stats.set(stats)
+
+        async def send_with_headers(message) -> None:
+            if message["type"] == "http.response.start" and QUERY_DEBUG_HEADERS:
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-db-queries", str(stats.count).encode()),
+                    (b"x-db-time-ms", str(stats.milliseconds).encode()),
+                    (b"server-timing", f'db;dur={stats.milliseconds};desc="{stats.count} queries"'.encode()),
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _request_stats.reset(token)
+            for sql, n in stats.repeated(QUERY_REPEAT_WARN):
+                logger.warning(f"{stats.label}: same statement run {n} times (N+1?): {' '.join(sql.split())[:200]}")
@@ -0,0 +1,123 @@
+"""
+Postgres read replicas: engines, lag monitoring and selection.
+
+DATABASE_REPLICA_URLS is a comma-separated list of streaming replicas. Each
+worker checks every replica every REPLICA_CHECK_INTERVAL_SECONDS; a replica is
+used for reads only while it answers and its replay lag is at most
+REPLICA_MAX_LAG_SECONDS. With no healthy replica, reads go to the primary.
+
+Lag is 0 when everything received has been replayed (an idle primary does not
+look like lag), else the age of the last replayed transaction.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+REPLICA_URLS = [u.strip() for u in (os.getenv("DATABASE_REPLICA_URLS", "") or "").split(",") if u.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5") or "5")
+REPLICA_CHECK_INTERVAL_SECONDS = int(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "5") or "5")
+REPLICA_CHECK_TIMEOUT_SECONDS = 2
+
+LAG_SQL = text(
+    "SELECT pg_is_in_recovery(), CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class _Replica:
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self.name = f"{parts.hostname}:{parts.port or 5432}"  # no credentials in status output
+        self.engine = create_engine(
+            url, future=True, pool_pre_ping=True, connect_args={"connect_timeout": REPLICA_CHECK_TIMEOUT_SECONDS}
+        )
+        self.healthy = False  # unknown until the first check passes
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def check(self) -> None:
+        try:
+            with self.engine.connect() as conn:
+                in_recovery, lag = conn.execute(LAG_SQL).one()
+            self.lag_seconds = round(float(lag or 0), 3)
+            if not in_recovery:
+                self.error = "not in recovery (promoted or misconfigured)"
+            elif self.lag_seconds > REPLICA_MAX_LAG_SECONDS:
+                self.error = f"lag {self.lag_seconds}s exceeds {REPLICA_MAX_LAG_SECONDS}s"
+            else:
+                self.error = None
+        except Exception as e:
+            self.lag_seconds = None
+            self.error = str(e).splitlines()[0]
+        was_healthy, self.healthy = self.healthy, self.error is None
+        self.checked_at = time.time()
+        if was_healthy != self.healthy:
+            logger.warning(f"Replica {self.name} {'back in rotation' if self.healthy else 'out of rotation'}: {self.error}")
+
+
+_replicas: List[_Replica] = [_Replica(url) for url in REPLICA_URLS]
+_rotation = itertools.count()
+
+
+def replicas_configured() -> bool:
+    return bool(_replicas)
+
+
+def pick_replica() -> Optional[Engine]:
+    """A healthy replica engine (round-robin), or None to read from the primary."""
+    healthy = [r for r in _replicas if r.healthy]
+    if not healthy:
+        return None
+    return healthy[next(_rotation) % len(healthy)].engine
+
+
+def check_replicas() -> None:
+    for replica in _replicas:
+        replica.check()
+
+
+async def replica_monitor_loop(interval_seconds: Optional[int] = None) -> None:
+    if not _replicas:
+        return
+    interval = interval_seconds or REPLICA_CHECK_INTERVAL_SECONDS
+    while True:
+        try:
+            await asyncio.to_thread(check_replicas)
+        except Exception as e:
+            logger.error(f"Replica monitor error: {e}")
+        await asyncio.sleep(interval)
+
+
+def replica_status() -> Dict[str, Any]:
+    return {
+        "ok": all(r.healthy for r in _replicas),
+        "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+        "in_rotation": sum(r.healthy for r in _replicas),
+        "replicas": [
+            {
+                "name": r.name,
+                "healthy": r.healthy,
+                "lag_seconds": r.lag_seconds,
+                "error": r.error,
+                "checked_at": r.checked_at,
+            }
+            for r in _replicas
+        ],
+    }
+
+
+def dispose_replicas() -> None:
+    """Drop pooled connections inherited across fork (see gunicorn.conf.py)."""
+    for replica in _replicas:
+        replica.engine.dispose(close=False)
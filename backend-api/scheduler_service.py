@@ -0,0 +1,199 @@
+"""
+Fair scheduling of Whisper / LLM calls across users.
+
+Every AI call takes a slot from ai_slot(user_id, priority) first. Waiters sit
+in per-user FIFO queues; when a slot frees, users are served round-robin, so
+one user's 30-segment upload interleaves with everyone else's single chapter
+instead of running ahead of it. Limits:
+
+- AI_MAX_CONCURRENCY calls at once in this worker process (N workers -> N x);
+- AI_MAX_PER_USER calls at once for any one user.
+
+Two priority classes: "interactive" (a person is waiting on a re-polish) is
+served before "bulk" (upload pipeline, recovery sweeper). A bulk waiter older
+than AI_PRIORITY_AGING_SECONDS is served as interactive so bulk work cannot
+starve.
+
+Per-user stats live only while a user has calls running, plus a bounded LRU
+of idle users (AI_STATS_MAX_USERS) so the snapshot still shows recent waits.
+"""
+
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4") or "4")
+AI_MAX_PER_USER = int(os.getenv("AI_MAX_PER_USER", "2") or "2")
+AI_PRIORITY_AGING_SECONDS = float(os.getenv("AI_PRIORITY_AGING_SECONDS", "120") or "120")
+# Wait stats are kept for at most this many idle users, least recently served dropped first
+AI_STATS_MAX_USERS = int(os.getenv("AI_STATS_MAX_USERS", "1000") or "1000")
+PRIORITIES = ("interactive", "bulk")
+WAIT_SAMPLES = 100
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "kind", "enqueued_at", "future")
+
+    def __init__(self, user_id: int, priority: str, kind: str) -> None:
+        self.user_id = user_id
+        self.priority = priority
+        self.kind = kind
+        self.enqueued_at = time.monotonic()
+        self.future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+
+
+class _UserStats:
+    def __init__(self) -> None:
+        self.running = 0
+        self.served = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+
+class FairScheduler:
+    def __init__(
+        self, max_concurrency: int, max_per_user: int, aging_seconds: float, max_idle_users: int = AI_STATS_MAX_USERS
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_user = max(1, max_per_user)
+        self.aging_seconds = aging_seconds
+        self.max_idle_users = max(0, max_idle_users)
+        self.running = 0
+        # priority -> user_id -> FIFO of waiters; OrderedDict order is the round-robin rotation
+        self.queues: Dict[str, "OrderedDict[int, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        # Ordered least recently served first
+        self.users: "OrderedDict[int, _UserStats]" = OrderedDict()
+
+    def _stats(self, user_id: int) -> _UserStats:
+        stats = self.users.get(user_id)
+        if stats is None:
+            stats = self.users[user_id] = _UserStats()
+        else:
+            self.users.move_to_end(user_id)
+        return stats
+
+    def _running(self, user_id: int) -> int:
+        stats = self.users.get(user_id)
+        return stats.running if stats else 0
+
+    def _prune(self) -> None:
+        """Drop the least recently served idle users beyond max_idle_users."""
+        idle = [user_id for user_id, stats in self.users.items() if not stats.running]
+        for user_id in idle[: max(0, len(idle) - self.max_idle_users)]:
+            del self.users[user_id]
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Round-robin over users with capacity; interactive first unless bulk has aged."""
+        now = time.monotonic()
+        order = list(PRIORITIES)
+        bulk = self.queues["bulk"]
+        if any(now - q[0].enqueued_at >= self.aging_seconds for q in bulk.values()):
+            order.reverse()
+        for priority in order:
+            queue = self.queues[priority]
+            for user_id in list(queue):
+                if self._running(user_id) >= self.max_per_user:
+                    continue
+                waiters = queue[user_id]
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(user_id)  # back of the rotation
+                else:
+                    del queue[user_id]
+                return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.future.done():  # cancelled while queued
+                continue
+            stats = self._stats(waiter.user_id)
+            stats.running += 1
+            stats.served += 1
+            stats.waits.append(time.monotonic() - waiter.enqueued_at)
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _release(self, user_id: int) -> None:
+        self.running -= 1
+        stats = self.users[user_id]
+        stats.running -= 1
+        self._dispatch()
+        if not stats.running and len(self.users) > self.max_idle_users:
+            self._prune()
+
+    def _discard(self, waiter: _Waiter) -> None:
+        waiters = self.queues[waiter.priority].get(waiter.user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.queues[waiter.priority][waiter.user_id]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user_id: int, priority: str = "bulk", kind: str = "ai") -> AsyncIterator[None]:
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}")
+        waiter = _Waiter(user_id, priority, kind)
+        self.queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(user_id)  # granted just as we were cancelled
+            else:
+                self._discard(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        per_user: Dict[int, Dict[str, Any]] = {}
+        for user_id in set(self.users) | {u for q in self.queues.values() for u in q}:
+            stats = self.users.get(user_id) or _UserStats()
+            queued = {p: len(self.queues[p].get(user_id, ())) for p in PRIORITIES}
+            oldest = [self.queues[p][user_id][0].enqueued_at for p in PRIORITIES if queued[p]]
+            waits = sorted(stats.waits)
+            per_user[user_id] = {
+                "running": stats.running,
+                "queued": queued,
+                "oldest_wait_seconds": round(now - min(oldest), 2) if oldest else None,
+                "served": stats.served,
+                "wait_avg_seconds": round(sum(waits) / len(waits), 3) if waits else None,
+                "wait_p95_seconds": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else None,
+            }
+        return {
+            "pid": os.getpid(),
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "running": self.running,
+            "queued": sum(len(w) for q in self.queues.values() for w in q.values()),
+            "users": per_user,
+        }
+
+
+_scheduler: Optional[FairScheduler] = None
+
+
+def get_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler(AI_MAX_CONCURRENCY, AI_MAX_PER_USER, AI_PRIORITY_AGING_SECONDS)
+    return _scheduler
+
+
+def ai_slot(user_id: int, priority: str = "bulk", kind: str = "ai"):
+    """`async with ai_slot(user_id, "interactive"):` around one Whisper/LLM call."""
+    return get_scheduler().slot(user_id, priority, kind)
+
+
+def queue_stats() -> Dict[str, Any]:
+    return get_scheduler().snapshot()
@@ -0,0 +1,119 @@
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from models import Base
+from search_service import SEARCH_DOCUMENT_SQL
+
+# Idempotent upgrades for databases created before a model change.
+# create_all() only creates missing tables, it never alters existing ones.
+POSTGRES_UPGRADES: List[str] = [
+    # ON DELETE CASCADE on user-owned rows (only rewritten when not already cascading)
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'chapters_user_id_fkey' AND confdeltype <> 'c'
+        ) THEN
+            ALTER TABLE chapters DROP CONSTRAINT chapters_user_id_fkey;
+            ALTER TABLE chapters ADD CONSTRAINT chapters_user_id_fkey
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE;
+        END IF;
+        IF EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'books_user_id_fkey' AND confdeltype <> 'c'
+        ) THEN
+            ALTER TABLE books DROP CONSTRAINT books_user_id_fkey;
+            ALTER TABLE books ADD CONSTRAINT books_user_id_fkey
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE;
+        END IF;
+    END $$;
+    """,
+    # The cascade looks children up by user_id
+    "CREATE INDEX IF NOT EXISTS ix_chapters_user_id ON chapters (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_books_user_id ON books (user_id)",
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS normalized_audio_url VARCHAR(512)",
+    # updated_at for delta sync / ETags
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now()",
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now()",
+    "ALTER TABLE books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS ix_users_updated_at ON users (updated_at)",
+    "CREATE INDEX IF NOT EXISTS ix_chapters_updated_at ON chapters (updated_at)",
+    "CREATE INDEX IF NOT EXISTS ix_books_updated_at ON books (updated_at)",
+    # Crash recovery (pipeline_service)
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS last_error TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_chapters_status_updated_at ON chapters (status, updated_at)",
+    # Trigram search over chapter text (search_service)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_chapters_search_trgm ON chapters USING gin ({SEARCH_DOCUMENT_SQL} gin_trgm_ops)",
+    # Polish planner decisions on the AI call ledger (planner_service)
+    "ALTER TABLE ai_calls ADD COLUMN IF NOT EXISTS plan VARCHAR(80)",
+    # ttfb_ms was the time until response headers, which for unstreamed calls is the whole call
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns WHERE table_name = 'ai_calls' AND column_name = 'ttfb_ms'
+        ) THEN
+            ALTER TABLE ai_calls RENAME COLUMN ttfb_ms TO headers_ms;
+        END IF;
+    END $$;
+    """,
+    "ALTER TABLE ai_calls ADD COLUMN IF NOT EXISTS first_token_ms INTEGER",
+    # Near-duplicate transcripts (dedup_service)
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS duplicate_of INTEGER REFERENCES chapters (id) ON DELETE SET NULL",
+    # Idempotent uploads (live ingest falling back to /upload_audio)
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_chapters_user_idempotency_key ON chapters (user_id, idempotency_key)",
+    # Cross-worker lease on a chapter's AI work (pipeline_service)
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(32)",
+    "ALTER TABLE chapters ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP",
+    # Names of the one-off POSTGRES_MIGRATIONS already applied
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name VARCHAR(100) PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+# One-off data migrations: (name, statements), applied in order, each exactly
+# once, and recorded in schema_migrations. For work too costly to repeat on
+# every deploy, such as full-table UPDATEs.
+POSTGRES_MIGRATIONS: List[Tuple[str, List[str]]] = [
+    # Media URLs are stored unsigned and signed when served (storage_service.signed_url)
+    (
+        "strip-media-url-signatures",
+        [
+            "UPDATE chapters SET audio_url = split_part(audio_url, '?sig=', 1) WHERE audio_url LIKE '%?sig=%'",
+            "UPDATE chapters SET normalized_audio_url = split_part(normalized_audio_url, '?sig=', 1) "
+            "WHERE normalized_audio_url LIKE '%?sig=%'",
+            "UPDATE books SET pdf_url = split_part(pdf_url, '?sig=', 1) WHERE pdf_url LIKE '%?sig=%'",
+        ],
+    ),
+]
+
+
+def ensure_schema(engine: Engine) -> None:
+    """
+    Create missing tables, apply idempotent upgrades to existing ones, then the
+    one-off migrations not applied yet.
+    """
+    Base.metadata.create_all(bind=engine)
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for stmt in POSTGRES_UPGRADES:
+            conn.execute(text(stmt))
+        # Concurrent prestarts (several hosts) apply each migration once
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+        applied = set(conn.execute(text("SELECT name FROM schema_migrations")).scalars())
+        for name, statements in POSTGRES_MIGRATIONS:
+            if name in applied:
+                continue
+            for stmt in statements:
+                conn.execute(text(stmt))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
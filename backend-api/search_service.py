@@ -0,0 +1,165 @@
+"""
+Chapter search over title, anchor prompt, transcript and polished text.
+
+On Postgres one pg_trgm GIN index covers the concatenated text (see
+schema_service). Trigrams need no tokenizer, so Chinese text is searched as
+well as English. A chapter matches when it contains the query as a substring
+(ILIKE, index-assisted for queries of 3+ characters) or when the query
+fuzzily matches part of the text (word_similarity above SEARCH_FUZZY_THRESHOLD).
+Substring hits rank first, then higher similarity, with title hits boosted.
+Other databases fall back to plain LIKE over each column.
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, literal, literal_column, or_, select, text
+from sqlalchemy.orm import Session
+
+from models import Chapter
+
+# The indexed expression (ix_chapters_search_trgm); queries must repeat it exactly
+SEARCH_DOCUMENT_SQL = (
+    "(coalesce(title, '') || ' ' || coalesce(anchor_prompt, '') || ' ' || "
+    "coalesce(transcript_text, '') || ' ' || coalesce(polished_text, ''))"
+)
+
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.5") or "0.5")
+SEARCH_MAX_LIMIT = 100
+SNIPPET_CHARS = 160
+# Fuzzy matching on one or two characters matches almost everything
+FUZZY_MIN_CHARS = 3
+
+HIT_COLUMNS = (
+    Chapter.id,
+    Chapter.user_id,
+    Chapter.title,
+    Chapter.anchor_prompt,
+    Chapter.segment_index,
+    Chapter.audio_url,
+    Chapter.status,
+    Chapter.polished_by_model,
+    Chapter.created_at,
+    Chapter.updated_at,
+)
+# Searched fields in the order snippets are taken from
+SNIPPET_FIELDS = ("polished_text", "transcript_text", "title", "anchor_prompt")
+
+
+def _like_pattern(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _postgres_statement(db: Session, q: str):
+    document = literal_column(SEARCH_DOCUMENT_SQL)
+    title = func.coalesce(Chapter.title, "")
+    contains = document.ilike(_like_pattern(q), escape="\\")
+    # Similarity against the whole text is only worth computing for fuzzy-only hits;
+    # substring hits already outrank them and are ordered by the (short) title.
+    score = case((contains, 1.0), else_=func.word_similarity(q, document)) + 0.5 * func.word_similarity(q, title)
+    match = contains
+    if len(q) >= FUZZY_MIN_CHARS:
+        # `<%` is word_similarity(q, doc) > pg_trgm.word_similarity_threshold, served by the GIN index
+        db.execute(
+            # Marked replica-safe so it runs on the same connection as the search
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :t, true)").execution_options(replica_ok=True),
+            {"t": str(SEARCH_FUZZY_THRESHOLD)},
+        )
+        match = or_(contains, literal(q).op("<%")(document))
+    return match, score
+
+
+def _generic_statement(q: str):
+    pattern = _like_pattern(q)
+    columns = (Chapter.title, Chapter.anchor_prompt, Chapter.transcript_text, Chapter.polished_text)
+    match = or_(*(column.ilike(pattern, escape="\\") for column in columns))
+    score = case((Chapter.title.ilike(pattern, escape="\\"), 2.0), else_=1.0)
+    return match, score
+
+
+def snippet(row: Dict[str, Any], q: str) -> Dict[str, Any]:
+    """
+    Pick the first field containing a query term and cut a window around it.
+    Returned as parts [{"text", "match"}] so clients can highlight without HTML.
+    """
+    terms = [t for t in q.split() if t] or [q]
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    for field in SNIPPET_FIELDS:
+        value = row.get(field) or ""
+        hit = pattern.search(value)
+        if not hit:
+            continue
+        start = max(0, hit.start() - SNIPPET_CHARS // 3)
+        end = min(len(value), start + SNIPPET_CHARS)
+        window = value[start:end]
+        parts: List[Dict[str, Any]] = []
+        if start > 0:
+            parts.append({"text": "…", "match": False})
+        pos = 0
+        for m in pattern.finditer(window):
+            if m.start() > pos:
+                parts.append({"text": window[pos:m.start()], "match": False})
+            parts.append({"text": m.group(0), "match": True})
+            pos = m.end()
+        if pos < len(window):
+            parts.append({"text": window[pos:], "match": False})
+        if end < len(value):
+            parts.append({"text": "…", "match": False})
+        return {"field": field, "snippet": parts}
+
+    # Fuzzy-only hit: no literal occurrence to highlight
+    for field in SNIPPET_FIELDS:
+        value = row.get(field) or ""
+        if value:
+            cut = value[:SNIPPET_CHARS] + ("…" if len(value) > SNIPPET_CHARS else "")
+            return {"field": field, "snippet": [{"text": cut, "match": False}]}
+    return {"field": None, "snippet": []}
+
+
+def search_chapters(
+    db: Session, q: str, user_id: Optional[int] = None, limit: int = 20, offset: int = 0
+) -> Dict[str, Any]:
+    """
+    Ranked page of chapters matching q. Fetches one row past the page instead
+    of counting every match, so the response carries has_more, not a total.
+    """
+    q = q.strip()
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    if not q:
+        return {"results": [], "offset": offset, "limit": limit, "has_more": False}
+
+    if db.get_bind().dialect.name == "postgresql":
+        match, score = _postgres_statement(db, q)
+    else:
+        match, score = _generic_statement(q)
+
+    score = score.label("score")
+    ranked = select(Chapter.id, score).where(match)
+    if user_id is not None:
+        ranked = ranked.where(Chapter.user_id == user_id)
+    ranked = ranked.order_by(score.desc(), Chapter.updated_at.desc(), Chapter.id.desc()).limit(limit + 1).offset(offset)
+    page = db.execute(ranked).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    # Texts are only read for the page, to cut snippets from
+    rows: Dict[int, Any] = {}
+    if page:
+        texts = select(*HIT_COLUMNS, Chapter.transcript_text, Chapter.polished_text).where(
+            Chapter.id.in_([row.id for row in page])
+        )
+        rows = {row["id"]: row for row in db.execute(texts).mappings()}
+
+    results = []
+    for chapter_id, row_score in page:
+        row = rows.get(chapter_id)
+        if row is None:
+            continue
+        hit = {column.key: row[column.key] for column in HIT_COLUMNS}
+        hit["score"] = round(float(row_score), 4)
+        hit.update(snippet(row, q))
+        results.append(hit)
+    return {"results": results, "offset": offset, "limit": limit, "has_more": has_more}
@@ -1,21 +1,26 @@
-import os
 import struct
 from typing import Dict, List
 
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 
 from models import Book, Chapter, User
+from media_service import put_precompressed
+from storage_service import StorageBackend, build_public_url, get_storage, object_keys
+from sync_service import record_tombstones
+from synthetic_service import clear_synthetic
 
+DEMO_AUDIO_KEY = "demo-silence.wav"
+DEMO_BOOK_KEY = "demo-book.txt"
 
-def _ensure_silence_wav(audio_dir: str, filename: str = "demo-silence.wav") -> str:
+
+def ensure_silence_wav(storage: StorageBackend, key: str = DEMO_AUDIO_KEY) -> str:
     """
-    Create a tiny 1-second silent WAV file if it doesn't exist.
-    Returns absolute file path.
+    Create a tiny 1-second silent WAV object if it doesn't exist.
+    Returns the storage key.
     """
-    os.makedirs(audio_dir, exist_ok=True)
-    path = os.path.join(audio_dir, filename)
-    if os.path.exists(path):
-        return path
+    if storage.exists("audio", key):
+        return key
 
     sample_rate = 8000
     duration_seconds = 1
@@ -46,12 +51,8 @@ def _ensure_silence_wav(audio_dir: str, filename: str = "demo-silence.wav") -> s
     data_chunk_header = b"data" + struct.pack("<I", data_size)
     silence = b"\x00" * data_size
 
-    with open(path, "wb") as f:
-        f.write(header)
-        f.write(fmt_chunk)
-        f.write(data_chunk_header)
-        f.write(silence)
-    return path
+    storage.put_bytes("audio", key, header + fmt_chunk + data_chunk_header + silence, "audio/wav")
+    return key
 
 
 def seed_demo(db: Session) -> Dict:
@@ -66,12 +67,9 @@ def seed_demo(db: Session) -> Dict:
         db.commit()
         db.refresh(user)
 
-    # Ensure demo audio exists and can be served via /static/audio/...
-    audio_dir = os.getenv("STORAGE_AUDIO_PATH", "/data/storage/audio")
-    _ensure_silence_wav(audio_dir)
-    audio_url = os.getenv("STORAGE_PUBLIC_BASE_URL", "").rstrip("/") + "/audio/demo-silence.wav"
-    if audio_url.startswith("/audio/") or audio_url == "/audio/demo-silence.wav":
-        audio_url = "/static/audio/demo-silence.wav"
+    # Ensure demo audio exists and can be served via /media/audio/...
+    storage = get_storage()
+    audio_url = build_public_url("audio", ensure_silence_wav(storage))
 
     anchors = [
         "The Stethoscope",
@@ -138,24 +136,19 @@ def seed_demo(db: Session) -> Dict:
     existing_books = db.query(Book).filter(Book.user_id == user.id).count()
     created_books = 0
     if existing_books < 1:
-        books_dir = os.getenv("STORAGE_BOOK_PATH", "/data/storage/books")
-        os.makedirs(books_dir, exist_ok=True)
-        demo_book_name = "demo-book.txt"
-        demo_book_path = os.path.join(books_dir, demo_book_name)
+        demo_book_name = DEMO_BOOK_KEY
         chapters = (
             db.query(Chapter)
             .filter(Chapter.user_id == user.id)
             .order_by(Chapter.segment_index)
             .all()
         )
-        with open(demo_book_path, "w", encoding="utf-8") as f:
-            f.write("# BioWeaver Demo Book\n\n")
-            for ch in chapters:
-                f.write(f"## {ch.title}\n\n")
-                f.write((ch.polished_text or ch.transcript_text or "") + "\n\n")
-
-        base = os.getenv("STORAGE_PUBLIC_BASE_URL", "").rstrip("/")
-        book_url = f"{base}/books/{demo_book_name}" if base else f"/static/books/{demo_book_name}"
+        parts = ["# BioWeaver Demo Book\n\n"]
+        for ch in chapters:
+            parts.append(f"## {ch.title}\n\n")
+            parts.append((ch.polished_text or ch.transcript_text or "") + "\n\n")
+        put_precompressed(storage, "books", demo_book_name, "".join(parts).encode("utf-8"), "text/plain; charset=utf-8")
+        book_url = build_public_url("books", demo_book_name)
         book = Book(user_id=user.id, title="Demo Memory Book", description="Seeded demo output", pdf_url=book_url)
         db.add(book)
         db.commit()
@@ -165,51 +158,40 @@ def seed_demo(db: Session) -> Dict:
         "user": {"id": user.id, "email": user.email, "name": user.name},
         "created_chapters": created_chapters,
         "created_books": created_books,
-        "audio_url": "/static/audio/demo-silence.wav",
-        "book_url": "/static/books/demo-book.txt",
+        "audio_url": audio_url,
+        "book_url": build_public_url("books", DEMO_BOOK_KEY),
     }
 
 
 def clear_demo(db: Session) -> Dict:
     """
-    Remove all demo data (demo user + related chapters + books).
+    Remove all demo data (demo user + related chapters + books) and every
+    synthetic dataset, with set-based deletes.
     """
     demo_email = "demo@bioweaver.local"
-    user = db.query(User).filter(User.email == demo_email).first()
-    
+    user_id = db.query(User.id).filter(User.email == demo_email).scalar()
+
     deleted_chapters = 0
     deleted_books = 0
-    
-    if user:
-        # Delete chapters
-        deleted_chapters = db.query(Chapter).filter(Chapter.user_id == user.id).delete()
-        # Delete books
-        deleted_books = db.query(Book).filter(Book.user_id == user.id).delete()
-        # Delete user
-        db.delete(user)
+
+    if user_id is not None:
+        record_tombstones(db, "chapter", Chapter.user_id == user_id)
+        record_tombstones(db, "book", Book.user_id == user_id)
+        record_tombstones(db, "user", User.id == user_id)
+        deleted_chapters = db.execute(delete(Chapter).where(Chapter.user_id == user_id)).rowcount
+        deleted_books = db.execute(delete(Book).where(Book.user_id == user_id)).rowcount
+        db.execute(delete(User).where(User.id == user_id))
         db.commit()
-    
+
     # Optionally clean up demo files
-    audio_dir = os.getenv("STORAGE_AUDIO_PATH", "/data/storage/audio")
-    demo_wav = os.path.join(audio_dir, "demo-silence.wav")
-    if os.path.exists(demo_wav):
-        try:
-            os.remove(demo_wav)
-        except:
-            pass
-    
-    books_dir = os.getenv("STORAGE_BOOK_PATH", "/data/storage/books")
-    demo_book = os.path.join(books_dir, "demo-book.txt")
-    if os.path.exists(demo_book):
-        try:
-            os.remove(demo_book)
-        except:
-            pass
-    
+    storage = get_storage()
+    storage.delete("audio", DEMO_AUDIO_KEY)
+    for key in object_keys("books", DEMO_BOOK_KEY):
+        storage.delete("books", key)
+
     return {
-        "deleted_user": demo_email if user else None,
+        "deleted_user": demo_email if user_id is not None else None,
         "deleted_chapters": deleted_chapters,
         "deleted_books": deleted_books,
+        "synthetic": clear_synthetic(db),
     }
-
-
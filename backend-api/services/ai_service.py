@@ -7,12 +7,16 @@ Uses the "Slumdog Millionaire" montage narrative style:
 - Philosophical Echo: A reflective, universal truth to close
 """
 
+import json
 import os
 import logging
-from typing import Optional, Tuple
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
-from httpx import HTTPError
+
+from ledger_service import record_call
+from lifecycle_service import tracked
 
 logger = logging.getLogger(__name__)
 
@@ -72,6 +76,9 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 # Use Claude 3 Opus for superior creative writing, fallback to Claude 3.5 Sonnet
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "anthropic/claude-3-opus-20240229")
+# Recorded with every call in the AI call ledger; bump when SLUMDOG_SYSTEM_PROMPT,
+# the user prompt below or the sampling parameters change
+PROMPT_VERSION = "slumdog-1"
 
 
 def get_current_model() -> str:
@@ -79,10 +86,22 @@ def get_current_model() -> str:
     return OPENROUTER_MODEL
 
 
-async def rewrite_memory(anchor_prompt: str, transcript: str, model: Optional[str] = None) -> Tuple[str, str]:
+@tracked("ai")
+async def rewrite_memory(
+    anchor_prompt: str,
+    transcript: str,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    part: Optional[Tuple[int, int]] = None,
+    plan: Optional[str] = None,
+) -> Tuple[str, str]:
     """
     Call OpenRouter to polish the transcript in Slumdog montage style.
     Falls back to the original transcript on failure.
+
+    `max_tokens` and `part` (index, count) come from the planner
+    (planner_service): a long transcript is polished in parts, each told
+    where it sits in the chapter. `plan` is its label for the call ledger.
     
     Returns:
         Tuple of (polished_text, model_used)
@@ -125,6 +144,30 @@ async def rewrite_memory(anchor_prompt: str, transcript: str, model: Optional[st
 4. 保持第一人称叙述
 
 请直接输出润色后的完整篇章（500-800字），不要加任何标题或解释。"""
+    if part is not None:
+        index, count = part
+        if index == 0:
+            position = "这是开头部分：以锚定物开篇，结尾不要收束，留给下一部分自然承接。"
+        elif index == count - 1:
+            position = "这是最后部分：直接承接上文继续叙述，不要重新开篇，以哲理回响收尾。"
+        else:
+            position = "这是中间部分：直接承接上文继续叙述，不要重新开篇，也不要收尾。"
+        user_prompt = f"""## 锚定物
+{anchor_prompt or "一个有意义的老物件"}
+
+## 原始口述内容（较长口述的第 {index + 1}/{count} 部分，{original_chars} 字）
+{transcript}
+
+---
+
+## 任务要求
+
+请只润色这一部分，它将与其他部分按顺序拼接成一篇完整的传记篇章。
+{position}
+
+**字数要求**：保持原有篇幅，约 {int(original_chars * 1.1)} 字，不要删减事实。
+
+保持第一人称叙述和蒙太奇叙事手法，直接输出润色后的这一部分，不要加任何标题或解释。"""
 
     payload = {
         "model": chosen_model,
@@ -133,7 +176,11 @@ async def rewrite_memory(anchor_prompt: str, transcript: str, model: Optional[st
             {"role": "user", "content": user_prompt},
         ],
         "temperature": 0.8,  # Slightly higher for creative writing
-        "max_tokens": 2000,
+        "max_tokens": max_tokens or 2000,
+        # Streamed, so the ledger sees the time to the first token (headers come right away)
+        # and the 60 s read timeout applies between chunks, not to the whole completion
+        "stream": True,
+        "stream_options": {"include_usage": True},
     }
 
     headers = {
@@ -144,27 +191,87 @@ async def rewrite_memory(anchor_prompt: str, transcript: str, model: Optional[st
     }
 
     last_error = None
+    status_code = None
+    headers_at = None
+    first_token_at = None
+    outcome = "error"
+    started = time.monotonic()
+    attempts = 0
+
+    def record(**usage) -> None:
+        record_call(
+            "polish",
+            chosen_model,
+            prompt_version=f"{PROMPT_VERSION}/part" if part is not None else PROMPT_VERSION,
+            plan=plan,
+            total_seconds=time.monotonic() - started,
+            headers_seconds=headers_at,
+            first_token_seconds=first_token_at,
+            attempts=attempts,
+            status_code=status_code,
+            outcome=outcome,
+            error=last_error if outcome != "ok" else None,
+            **usage,
+        )
+
     for attempt in range(2):  # simple retry
+        attempts = attempt + 1
+        status_code, headers_at, first_token_at = None, None, None
         try:
             logger.info(f"Polishing with model {chosen_model}, attempt {attempt+1}")
             async with httpx.AsyncClient(timeout=60) as client:
-                resp = await client.post(f"{OPENROUTER_BASE_URL}/chat/completions", json=payload, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    result = data["choices"][0]["message"]["content"]
-                    logger.info(f"Polish successful with {chosen_model}: {len(result)} chars")
-                    return result, chosen_model
-                else:
-                    last_error = f"HTTP {resp.status_code}: {resp.text[:200]}"
-                    logger.warning(f"Polish attempt {attempt+1} failed: {last_error}")
-        except HTTPError as e:
+                sent = time.monotonic()
+                async with client.stream("POST", f"{OPENROUTER_BASE_URL}/chat/completions", json=payload, headers=headers) as resp:
+                    headers_at = time.monotonic() - sent
+                    status_code = resp.status_code
+                    if resp.status_code != 200:
+                        await resp.aread()
+                        last_error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                        outcome = "http_error"
+                        logger.warning(f"Polish attempt {attempt+1} failed: {last_error}")
+                        continue
+                    pieces: List[str] = []
+                    usage: Dict[str, Any] = {}
+                    stream_error = None
+                    async for line in resp.aiter_lines():
+                        # Server-sent events: "data: <chunk>" lines; blank lines and ": ..." keep-alives are skipped
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("error"):
+                            stream_error = chunk["error"]
+                            break
+                        for choice in chunk.get("choices") or []:
+                            content = (choice.get("delta") or {}).get("content")
+                            if content:
+                                if first_token_at is None:
+                                    first_token_at = time.monotonic() - sent
+                                pieces.append(content)
+                        usage = chunk.get("usage") or usage
+            result = "".join(pieces)
+            if stream_error is not None or not result.strip():
+                last_error = f"stream error: {stream_error}"[:200] if stream_error is not None else "empty completion"
+                outcome = "http_error"
+                logger.warning(f"Polish attempt {attempt+1} failed: {last_error}")
+                continue
+            logger.info(f"Polish successful with {chosen_model}: {len(result)} chars")
+            outcome = "ok"
+            record(input_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+            return result, chosen_model
+        except httpx.HTTPError as e:
             last_error = str(e)
+            outcome = "network_error"
             logger.warning(f"Polish HTTP error attempt {attempt+1}: {e}")
             continue
         except Exception as e:
             last_error = str(e)
+            outcome = "error"
             logger.error(f"Polish exception attempt {attempt+1}: {e}")
             break
 
     logger.error(f"Polish failed after retries: {last_error}")
+    record()
     return transcript, ""
@@ -0,0 +1,94 @@
+"""
+Single-flight coalescing of identical AI work.
+
+Double taps on "polish", client retries and batch tools can start the same
+Whisper / LLM request at once. These layers keep that to one upstream call:
+
+- single_flight(key, fn): within a worker process, the first caller for a key
+  runs fn as its own task and later callers await the same task. The task is
+  shielded, so a cancelled caller does not cancel the work others wait on.
+- Across workers, pipeline_service leases the chapter (a lease_owner /
+  lease_until claim on its row) before any model call, so other workers wait
+  for the holder's result instead of calling the model themselves.
+- xact_lock(db, key): across workers, a Postgres transaction-level advisory
+  lock taken only in the transaction that writes the result. Writers for the
+  same key serialize there and re-read the row under the lock, so a run that
+  outlived its lease sees a newer result and skips its write. Nothing is held
+  while waiting for a scheduler slot or a model (a session-level lock would
+  pin a pooled connection per queued chapter). A no-op on other databases
+  (single-process dev setups).
+
+Keys come from request_key(), a digest of the normalized request.
+"""
+
+import asyncio
+import hashlib
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from db import engine
+
+T = TypeVar("T")
+
+_flights: Dict[str, "asyncio.Task[Any]"] = {}
+_stats = {"leaders": 0, "joined": 0, "lock_waits": 0}
+
+
+def request_key(kind: str, *parts: Any) -> str:
+    """Digest of a request; text parts are NFC-normalized and stripped first."""
+    h = hashlib.sha256(kind.encode("utf-8"))
+    for part in parts:
+        value = unicodedata.normalize("NFC", part).strip() if isinstance(part, str) else repr(part)
+        h.update(b"\x00" + value.encode("utf-8"))
+    return f"{kind}:{h.hexdigest()}"
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+async def single_flight(key: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """Run fn once per key at a time in this process; concurrent callers share its result."""
+    task = _flights.get(key)
+    if task is not None:
+        _stats["joined"] += 1
+        return await asyncio.shield(task)
+    task = asyncio.ensure_future(fn())
+    _flights[key] = task
+    _stats["leaders"] += 1
+    task.add_done_callback(lambda _t: _flights.pop(key, None))
+    return await asyncio.shield(task)
+
+
+# --- cross-worker --------------------------------------------------------------------
+
+
+def _lock_id(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def xact_lock(db: Session, key: str) -> bool:
+    """
+    Take the advisory lock for key until db's transaction ends (commit or
+    rollback); True if another transaction held it and we had to wait.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    params = {"id": _lock_id(key)}
+    if db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), params).scalar():
+        return False
+    # Held by another worker's write transaction, which is short: block for it
+    _stats["lock_waits"] += 1
+    db.execute(text("SELECT pg_advisory_xact_lock(:id)"), params)
+    return True
+
+
+def flight_stats() -> Dict[str, Any]:
+    return {**_stats, "inflight": len(_flights)}
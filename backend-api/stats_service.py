@@ -0,0 +1,145 @@
+"""
+Dashboard stats for /admin/stats.
+
+Row counts are one grouped statement, cached for STATS_TTL_SECONDS. Storage
+byte totals walk every stored object, so a request never does that:
+storage_stats_loop() measures them every STATS_STORAGE_INTERVAL_SECONDS in
+one worker per host (run_singleton) and shares the figure through a file
+(write_shared), which every worker's requests read.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, literal, null, select, union_all
+
+from db import SessionLocal
+from lifecycle_service import read_shared, write_shared
+from models import Book, Chapter, User
+from storage_service import KINDS, get_storage
+
+logger = logging.getLogger(__name__)
+
+STATS_TTL_SECONDS = float(os.getenv("STATS_TTL_SECONDS", "10") or "10")
+# Summing object sizes walks the whole store; measure it far less often than row counts
+STATS_STORAGE_INTERVAL_SECONDS = float(os.getenv("STATS_STORAGE_INTERVAL_SECONDS", "600") or "600")
+
+SHARED_STORAGE = "storage-stats"
+
+_cache: Dict[str, Any] = {"value": None, "at": 0.0}
+_lock: Optional[asyncio.Lock] = None
+_measuring: Optional[asyncio.Task] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+def _stats_statement():
+    """
+    One round trip: users and books totals plus chapters grouped by
+    (status, polished_by_model), as rows of (metric, status, model, count).
+    """
+    users = select(literal("users").label("metric"), null().label("status"), null().label("model"), func.count().label("n")).select_from(User)
+    books = select(literal("books"), null(), null(), func.count()).select_from(Book)
+    chapters = select(literal("chapters"), Chapter.status, Chapter.polished_by_model, func.count()).group_by(
+        Chapter.status, Chapter.polished_by_model
+    )
+    return union_all(users, books, chapters)
+
+
+def compute_counts() -> Dict[str, Any]:
+    db = SessionLocal(replica_reads=True)
+    try:
+        rows = db.execute(_stats_statement()).all()
+    finally:
+        db.close()
+
+    result: Dict[str, Any] = {"users": 0, "chapters": 0, "books": 0, "chapters_by_status": {}, "chapters_by_model": {}}
+    for metric, status, model, n in rows:
+        if metric != "chapters":
+            result[metric] = n
+            continue
+        result["chapters"] += n
+        by_status = result["chapters_by_status"]
+        by_status[status] = by_status.get(status, 0) + n
+        if model:
+            by_model = result["chapters_by_model"]
+            by_model[model] = by_model.get(model, 0) + n
+    return result
+
+
+def compute_storage_bytes() -> Dict[str, int]:
+    storage = get_storage()
+    return {kind: sum(size for _key, size, _mtime in storage.iter_objects(kind)) for kind in KINDS}
+
+
+def _shared_storage() -> Dict[str, Any]:
+    return read_shared(SHARED_STORAGE) or {"value": None, "at": None, "error": None}
+
+
+async def measure_storage() -> None:
+    """Publish new storage byte totals; on failure keep the previous figure and log why."""
+    try:
+        value = await asyncio.to_thread(compute_storage_bytes)
+        shared = {"value": value, "at": time.time(), "error": None}
+    except Exception as e:
+        shared = {**_shared_storage(), "error": str(e).splitlines()[0] if str(e) else e.__class__.__name__}
+        logger.warning(f"Measuring storage bytes failed, keeping the previous figure: {e}")
+    await asyncio.to_thread(write_shared, SHARED_STORAGE, shared)
+
+
+async def storage_stats_loop(interval_seconds: Optional[float] = None) -> None:
+    """Background measurement; run through run_singleton so only one worker per host walks storage."""
+    interval = interval_seconds or STATS_STORAGE_INTERVAL_SECONDS
+    if interval <= 0:
+        return
+    while True:
+        await measure_storage()
+        await asyncio.sleep(interval)
+
+
+def request_storage_measurement() -> None:
+    """Measure now in this worker, unless it is already measuring (admin refresh)."""
+    global _measuring
+    if _measuring is None or _measuring.done():
+        _measuring = asyncio.create_task(measure_storage())
+
+
+def _storage_fields() -> Dict[str, Any]:
+    shared = _shared_storage()
+    return {
+        "storage_bytes": shared["value"],
+        "storage_measured_at": shared["at"],
+        "storage_error": shared["error"],
+    }
+
+
+async def get_stats(force: bool = False) -> Dict[str, Any]:
+    """
+    Dashboard stats, cached for STATS_TTL_SECONDS so repeated polls cost nothing.
+    Concurrent callers share one refresh. force recounts rows now and starts a
+    new storage measurement (it does not wait for it).
+    """
+    now = time.time()
+    if not force and _cache["value"] is not None and now - _cache["at"] < STATS_TTL_SECONDS:
+        return {**_cache["value"], **_storage_fields(), "cached": True}
+
+    async with _get_lock():
+        now = time.time()
+        if not force and _cache["value"] is not None and now - _cache["at"] < STATS_TTL_SECONDS:
+            return {**_cache["value"], **_storage_fields(), "cached": True}
+
+        if force:
+            request_storage_measurement()
+        counts = await asyncio.to_thread(compute_counts)
+        value = {**counts, "generated_at": now}
+        _cache["value"] = value
+        _cache["at"] = now
+    return {**value, **_storage_fields(), "cached": False}
@@ -0,0 +1,215 @@
+"""
+Storage garbage collector for orphaned audio/book files.
+
+Objects in storage that no Chapter.audio_url / Book.pdf_url points to are first
+moved under a `.quarantine/` prefix, and only deleted once they have sat there
+for the grace period. A quarantined object that becomes referenced again
+(e.g. an admin re-pointed audio_url) is restored.
+
+Each pass also prunes delta-sync tombstones past their retention window, and
+finishes any queued purge (queue_user_media) a crashed worker left behind.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from lifecycle_service import read_shared, write_shared
+from models import Book, Chapter, MediaPurge
+from storage_service import KINDS, PURGE_BATCH_SIZE, StorageBackend, get_storage, key_from_url, object_keys, purge_files
+from sync_service import prune_tombstones
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIR = ".quarantine"
+
+GC_INTERVAL_SECONDS = int(os.getenv("STORAGE_GC_INTERVAL_SECONDS", "21600") or "0")
+# Files younger than this are never touched: an upload writes its file before the row commits.
+GC_MIN_AGE_SECONDS = int(os.getenv("STORAGE_GC_MIN_AGE_SECONDS", "3600") or "0")
+GC_GRACE_SECONDS = int(os.getenv("STORAGE_GC_GRACE_SECONDS", "604800") or "0")
+GC_BATCH_SIZE = int(os.getenv("STORAGE_GC_BATCH_SIZE", "500") or "500")
+GC_YIELD_PER = 1000
+
+_config: Dict[str, Any] = {
+    "enabled": GC_INTERVAL_SECONDS > 0,
+    "interval_seconds": GC_INTERVAL_SECONDS,
+    "grace_seconds": GC_GRACE_SECONDS,
+}
+# Passes run in the singleton worker (or whichever worker got /admin/storage/gc);
+# their outcome is shared through a file so every worker reports the same state.
+SHARED_STATUS = "storage-gc-status"
+
+
+def _shared_status() -> Dict[str, Any]:
+    return read_shared(SHARED_STATUS) or {"running": False, "last_run": None, "total_reclaimed_bytes": 0}
+
+
+def queue_user_media(db: Session, user_id: int) -> None:
+    """
+    INSERT ... SELECT every media URL of the user's chapters and books into
+    media_purges, in the caller's transaction and before the rows are deleted,
+    so no URL list is held in memory. purge_queued_media() deletes the files.
+    """
+    urls = union_all(
+        select(literal("audio"), Chapter.audio_url).where(Chapter.user_id == user_id, Chapter.audio_url.isnot(None)),
+        select(literal("audio"), Chapter.normalized_audio_url).where(
+            Chapter.user_id == user_id, Chapter.normalized_audio_url.isnot(None)
+        ),
+        select(literal("books"), Book.pdf_url).where(Book.user_id == user_id, Book.pdf_url.isnot(None)),
+    )
+    db.execute(insert(MediaPurge).from_select(["kind", "url"], select(urls.subquery())))
+
+
+def purge_queued_media(db: Session, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Delete the files queued in media_purges, one batch per transaction, and
+    their queue rows. Blocking; call from a thread. Returns objects removed.
+    """
+    removed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(MediaPurge.id, MediaPurge.kind, MediaPurge.url)
+            .where(MediaPurge.id > last_id)
+            .order_by(MediaPurge.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return removed
+        for kind in KINDS:
+            removed += purge_files(kind, (row.url for row in rows if row.kind == kind), batch_size)
+        last_id = rows[-1].id
+        db.execute(delete(MediaPurge).where(MediaPurge.id <= last_id))
+        db.commit()
+
+
+def purge_queued_media_now() -> int:
+    """purge_queued_media in its own session; the background task after a user deletion."""
+    db = SessionLocal()
+    try:
+        return purge_queued_media(db)
+    except Exception as e:
+        logger.error(f"Purging queued media failed (the next GC pass retries): {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def _referenced_keys(db: Session, kind: str) -> Set[str]:
+    """Storage keys referenced by the DB, read through a streaming cursor."""
+    columns = [Chapter.audio_url, Chapter.normalized_audio_url] if kind == "audio" else [Book.pdf_url]
+    keys: Set[str] = set()
+    for column in columns:
+        query = db.query(column).filter(column.isnot(None)).execution_options(yield_per=GC_YIELD_PER)
+        for (url,) in query:
+            if url:
+                keys.update(object_keys(kind, key_from_url(kind, url)))  # with precompressed siblings
+    return keys
+
+
+def _batches(items: Iterator[Tuple[str, int, float]], batch_size: int) -> Iterator[List[Tuple[str, int, float]]]:
+    batch: List[Tuple[str, int, float]] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _collect_kind(storage: StorageBackend, kind: str, referenced: Set[str], now: float, stats: Dict[str, int]) -> None:
+    # 1) move old-enough orphans into quarantine
+    for batch in _batches(storage.iter_objects(kind), GC_BATCH_SIZE):
+        for key, _size, mtime in batch:
+            stats["scanned"] += 1
+            if key in referenced or now - mtime < GC_MIN_AGE_SECONDS:
+                continue
+            try:
+                storage.move(kind, key, f"{QUARANTINE_DIR}/{key}")
+                stats["quarantined"] += 1
+            except Exception as e:
+                logger.warning(f"GC could not quarantine {kind}/{key}: {e}")
+
+    # 2) restore re-referenced objects, delete expired ones
+    prefix_len = len(QUARANTINE_DIR) + 1
+    for batch in _batches(storage.iter_objects(kind, QUARANTINE_DIR), GC_BATCH_SIZE):
+        for qkey, size, mtime in batch:
+            key = qkey[prefix_len:]
+            try:
+                if key in referenced:
+                    storage.move(kind, qkey, key)
+                    stats["restored"] += 1
+                elif now - mtime >= GC_GRACE_SECONDS and storage.delete(kind, qkey):
+                    stats["deleted"] += 1
+                    stats["reclaimed_bytes"] += size
+            except Exception as e:
+                logger.warning(f"GC could not process {kind}/{qkey}: {e}")
+
+
+def run_storage_gc(db: Session) -> Dict[str, Any]:
+    """
+    Run one GC pass over every storage directory. Blocking; call from a thread.
+    """
+    started = time.time()
+    result: Dict[str, Any] = {"started_at": started, "ok": True, "error": None, "kinds": {}}
+    write_shared(SHARED_STATUS, {**_shared_status(), "running": True})
+    try:
+        result["queued_purged"] = purge_queued_media(db)
+        storage = get_storage()
+        for kind in KINDS:
+            stats = {"scanned": 0, "quarantined": 0, "restored": 0, "deleted": 0, "reclaimed_bytes": 0}
+            referenced = _referenced_keys(db, kind)
+            _collect_kind(storage, kind, referenced, time.time(), stats)
+            result["kinds"][kind] = stats
+        result["tombstones_pruned"] = prune_tombstones(db)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Storage GC failed: {e}")
+        result["ok"] = False
+        result["error"] = str(e)
+    result["reclaimed_bytes"] = sum(k["reclaimed_bytes"] for k in result["kinds"].values())
+    result["duration_ms"] = int((time.time() - started) * 1000)
+    shared = _shared_status()
+    write_shared(
+        SHARED_STATUS,
+        {
+            "running": False,
+            "last_run": result,
+            "total_reclaimed_bytes": shared["total_reclaimed_bytes"] + result["reclaimed_bytes"],
+        },
+    )
+    logger.info(f"Storage GC finished: {result}")
+    return result
+
+
+def gc_status() -> Dict[str, Any]:
+    """Snapshot of GC state for /admin/health, the same in every worker on the host."""
+    return {**_config, **_shared_status()}
+
+
+def _run_with_own_session() -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return run_storage_gc(db)
+    finally:
+        db.close()
+
+
+async def storage_gc_loop(interval_seconds: Optional[int] = None) -> None:
+    """Periodic GC; runs each pass in a worker thread so the event loop stays free."""
+    interval = interval_seconds or GC_INTERVAL_SECONDS
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_run_with_own_session)
+        except Exception as e:
+            logger.error(f"Storage GC loop error: {e}")
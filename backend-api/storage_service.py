@@ -0,0 +1,469 @@
+"""
+Media storage backends.
+
+Objects are addressed by (kind, key): kind is "audio" or "books", key is a
+relative path such as "3f/a2/3fa2....webm". New keys are fanned out over two
+levels of hashed sub-directories so no directory grows unbounded; legacy flat
+keys ("<uuid>.wav") keep working unchanged.
+
+STORAGE_BACKEND selects the driver:
+- local (default): files under STORAGE_AUDIO_PATH / STORAGE_BOOK_PATH; the API's
+  /media endpoint authorizes each request and nginx sends the file (X-Accel-Redirect)
+- s3: any S3-compatible endpoint (AWS, MinIO, ...), objects stored as "<kind>/<key>"
+
+With MEDIA_SIGNING_KEY set, /media refuses URLs without a valid HMAC of
+(kind, key), so keys cannot be guessed or enumerated. Rows store unsigned URLs;
+the API signs them as it serves them (signed_url), so the key can be set or
+rotated without rewriting rows.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+import time
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("audio", "books")
+CHUNK_SIZE = 1024 * 1024
+PURGE_BATCH_SIZE = int(os.getenv("STORAGE_PURGE_BATCH_SIZE", "200") or "200")
+# Precompressed siblings ("<key>.gz", "<key>.br") written next to book files for nginx gzip_static
+PRECOMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+def media_signature(kind: str, key: str) -> Optional[str]:
+    """HMAC of (kind, key) under MEDIA_SIGNING_KEY; None when signing is off."""
+    secret = os.getenv("MEDIA_SIGNING_KEY", "")
+    if not secret:
+        return None
+    return hmac.new(secret.encode("utf-8"), f"{kind}/{key}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def signing_fingerprint() -> str:
+    """Short digest of MEDIA_SIGNING_KEY ("" when signing is off), for cache validators."""
+    secret = os.getenv("MEDIA_SIGNING_KEY", "")
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:8] if secret else ""
+
+
+def build_public_url(kind: str, key: str) -> str:
+    """The URL stored in audio_url/pdf_url: unsigned, see signed_url."""
+    public_base = os.getenv("STORAGE_PUBLIC_BASE_URL", "").rstrip("/")
+    return f"{public_base}/{kind}/{key}" if public_base else key
+
+
+def signed_url(kind: str, url: Optional[str]) -> Optional[str]:
+    """
+    A stored URL as handed to clients: any query string dropped (including a
+    signature baked in by older versions) and the current ?sig= appended.
+    """
+    if not url:
+        return url
+    base = url.split("?", 1)[0].split("#", 1)[0]
+    sig = media_signature(kind, key_from_url(kind, base))
+    return f"{base}?sig={sig}" if sig else base
+
+
+def new_key(filename: str) -> str:
+    """Hashed two-level fan-out key for a new object, e.g. "3f/a2/<filename>"."""
+    digest = hashlib.md5(filename.encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def key_from_url(kind: str, url: str) -> str:
+    """
+    Recover the storage key from a stored audio_url/pdf_url (public URL or bare key).
+    Query strings (signatures) and path traversal components are dropped.
+    """
+    path = urlsplit(url).path
+    marker = f"/{kind}/"
+    idx = path.find(marker)
+    if idx >= 0:
+        path = path[idx + len(marker):]
+    parts = [p for p in path.split("/") if p not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+def iter_file_chunks(fileobj: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class StorageBackend:
+    """Interface shared by all drivers. Every method is blocking; call from a thread in async code."""
+
+    name = "base"
+
+    def put_stream(self, kind: str, key: str, chunks: Iterable[bytes], content_type: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def put_bytes(self, kind: str, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+        return self.put_stream(kind, key, [data], content_type)
+
+    def get_stream(self, kind: str, key: str, chunk_size: int = CHUNK_SIZE, offset: int = 0) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def exists(self, kind: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, kind: str, key: str) -> Optional[int]:
+        """Object size in bytes, or None if it does not exist."""
+        raise NotImplementedError
+
+    def delete(self, kind: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def move(self, kind: str, src_key: str, dst_key: str) -> None:
+        """Move an object; the destination's modification time becomes "now"."""
+        raise NotImplementedError
+
+    def iter_objects(self, kind: str, prefix: str = "") -> Iterator[Tuple[str, int, float]]:
+        """Yield (key, size, mtime) under prefix, skipping dot-prefixed names below it."""
+        raise NotImplementedError
+
+    def local_copy(self, kind: str, key: str) -> Tuple[str, bool]:
+        """Return (local_path, is_temp); temp copies must be removed by the caller."""
+        raise NotImplementedError
+
+    def presigned_url(self, kind: str, key: str, expires: int = 3600) -> str:
+        raise NotImplementedError
+
+    def check(self) -> None:
+        """Raise if the backend is not reachable/writable."""
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, audio_path: str, book_path: str) -> None:
+        self.roots = {"audio": audio_path, "books": book_path}
+
+    def path(self, kind: str, key: str) -> str:
+        return os.path.join(self.roots[kind], *key.split("/"))
+
+    def put_stream(self, kind: str, key: str, chunks: Iterable[bytes], content_type: Optional[str] = None) -> int:
+        target = self.path(kind, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write next to the root under a dot name (ignored by GC), then rename into place.
+        tmp = os.path.join(self.roots[kind], f".tmp-{uuid4().hex}")
+        written = 0
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return written
+
+    def get_stream(self, kind: str, key: str, chunk_size: int = CHUNK_SIZE, offset: int = 0) -> Iterator[bytes]:
+        with open(self.path(kind, key), "rb") as f:
+            if offset:
+                f.seek(offset)
+            yield from iter_file_chunks(f, chunk_size)
+
+    def exists(self, kind: str, key: str) -> bool:
+        return os.path.isfile(self.path(kind, key))
+
+    def size(self, kind: str, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(kind, key))
+        except OSError:
+            return None
+
+    def delete(self, kind: str, key: str) -> bool:
+        try:
+            path = self.path(kind, key)
+            if os.path.isfile(path):
+                os.remove(path)
+                return True
+        except Exception:
+            pass
+        return False
+
+    def move(self, kind: str, src_key: str, dst_key: str) -> None:
+        target = self.path(kind, dst_key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self.path(kind, src_key), target)
+        now = time.time()
+        os.utime(target, (now, now))
+
+    def iter_objects(self, kind: str, prefix: str = "") -> Iterator[Tuple[str, int, float]]:
+        root = self.roots[kind]
+        stack = [prefix.strip("/")]
+        while stack:
+            rel = stack.pop()
+            try:
+                with os.scandir(os.path.join(root, rel) if rel else root) as it:
+                    for entry in it:
+                        if entry.name.startswith("."):
+                            continue
+                        key = f"{rel}/{entry.name}" if rel else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(key)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            yield key, st.st_size, st.st_mtime
+            except FileNotFoundError:
+                continue
+
+    def local_copy(self, kind: str, key: str) -> Tuple[str, bool]:
+        return self.path(kind, key), False
+
+    def presigned_url(self, kind: str, key: str, expires: int = 3600) -> str:
+        # nginx serves the storage root directly under /static
+        if os.getenv("STORAGE_PUBLIC_BASE_URL", ""):
+            return build_public_url(kind, key)
+        return f"/static/{kind}/{key}"
+
+    def check(self) -> None:
+        for root in self.roots.values():
+            os.makedirs(root, exist_ok=True)
+        probe = os.path.join(self.roots["books"], ".healthcheck")
+        with open(probe, "w", encoding="utf-8") as f:
+            f.write("ok")
+        os.remove(probe)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"driver": self.name, "audio_path": self.roots["audio"], "book_path": self.roots["books"]}
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible driver (AWS S3, MinIO, R2, ...). Requires boto3."""
+
+    name = "s3"
+    # S3 requires every multipart part except the last to be >= 5 MiB
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+    ) -> None:
+        import boto3  # optional dependency, only needed for this driver
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+
+    def _key(self, kind: str, key: str) -> str:
+        return f"{kind}/{key}"
+
+    def put_stream(self, kind: str, key: str, chunks: Iterable[bytes], content_type: Optional[str] = None) -> int:
+        extra = {"ContentType": content_type} if content_type else {}
+        object_key = self._key(kind, key)
+        buf = bytearray()
+        written = 0
+        upload_id = None
+        parts: List[Dict[str, Any]] = []
+        try:
+            for chunk in chunks:
+                buf.extend(chunk)
+                written += len(chunk)
+                while len(buf) >= self.PART_SIZE:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=object_key, **extra
+                        )["UploadId"]
+                    part = bytes(buf[: self.PART_SIZE])
+                    del buf[: self.PART_SIZE]
+                    resp = self.client.upload_part(
+                        Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                        PartNumber=len(parts) + 1, Body=part,
+                    )
+                    parts.append({"ETag": resp["ETag"], "PartNumber": len(parts) + 1})
+            if upload_id is None:
+                # small object: single PUT
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=bytes(buf), **extra)
+                return written
+            if buf:
+                resp = self.client.upload_part(
+                    Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                    PartNumber=len(parts) + 1, Body=bytes(buf),
+                )
+                parts.append({"ETag": resp["ETag"], "PartNumber": len(parts) + 1})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            return written
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+                except Exception:
+                    pass
+            raise
+
+    def get_stream(self, kind: str, key: str, chunk_size: int = CHUNK_SIZE, offset: int = 0) -> Iterator[bytes]:
+        extra = {"Range": f"bytes={offset}-"} if offset else {}
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(kind, key), **extra)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def exists(self, kind: str, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(kind, key))
+            return True
+        except Exception:
+            return False
+
+    def size(self, kind: str, key: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(kind, key))["ContentLength"]
+        except Exception:
+            return None
+
+    def delete(self, kind: str, key: str) -> bool:
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(kind, key))
+            return True
+        except Exception:
+            return False
+
+    def move(self, kind: str, src_key: str, dst_key: str) -> None:
+        # CopyObject sets LastModified to now, which is what quarantine relies on
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(kind, dst_key),
+            CopySource={"Bucket": self.bucket, "Key": self._key(kind, src_key)},
+        )
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(kind, src_key))
+
+    def iter_objects(self, kind: str, prefix: str = "") -> Iterator[Tuple[str, int, float]]:
+        base = f"{kind}/"
+        prefix = prefix.strip("/")
+        full_prefix = base + (prefix + "/" if prefix else "")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=full_prefix):
+            for obj in page.get("Contents", []):
+                rel = obj["Key"][len(full_prefix):]
+                if any(part.startswith(".") for part in rel.split("/")):
+                    continue
+                yield obj["Key"][len(base):], obj["Size"], obj["LastModified"].timestamp()
+
+    def local_copy(self, kind: str, key: str) -> Tuple[str, bool]:
+        suffix = os.path.splitext(key)[1]
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in self.get_stream(kind, key):
+                    out.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, True
+
+    def presigned_url(self, kind: str, key: str, expires: int = 3600) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(kind, key)},
+            ExpiresIn=expires,
+        )
+
+    def check(self) -> None:
+        self.client.head_bucket(Bucket=self.bucket)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "driver": self.name,
+            "audio_path": f"s3://{self.bucket}/audio",
+            "book_path": f"s3://{self.bucket}/books",
+        }
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Process-wide storage backend, built from env on first use."""
+    global _storage
+    if _storage is None:
+        driver = (os.getenv("STORAGE_BACKEND", "local") or "local").strip().lower()
+        if driver == "s3":
+            _storage = S3Storage(
+                bucket=os.getenv("S3_BUCKET", "bioweaver"),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                region=os.getenv("S3_REGION"),
+                access_key=os.getenv("S3_ACCESS_KEY_ID"),
+                secret_key=os.getenv("S3_SECRET_ACCESS_KEY"),
+            )
+        else:
+            _storage = LocalStorage(
+                os.getenv("STORAGE_AUDIO_PATH", "/data/storage/audio"),
+                os.getenv("STORAGE_BOOK_PATH", "/data/storage/books"),
+            )
+    return _storage
+
+
+def object_keys(kind: str, key: str) -> List[str]:
+    """An object's key plus the precompressed siblings stored with book files."""
+    return [key, *(key + suffix for suffix in PRECOMPRESSED_SUFFIXES)] if kind == "books" else [key]
+
+
+def delete_url(kind: str, url: str) -> bool:
+    key = key_from_url(kind, url)
+    if not key:
+        return False
+    storage = get_storage()
+    deleted = storage.delete(kind, key)
+    for sibling in object_keys(kind, key)[1:]:
+        storage.delete(kind, sibling)
+    return deleted
+
+
+def purge_files(kind: str, urls: Iterable[str], batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Remove stored objects for the given public URLs, in batches.
+    Meant to run as a background task after the rows are gone; never raises.
+    Returns the number of objects actually removed.
+    """
+    removed = 0
+    batch: List[str] = []
+    for url in urls:
+        if not url:
+            continue
+        batch.append(key_from_url(kind, url))
+        if len(batch) >= batch_size:
+            removed += _purge_batch(kind, batch)
+            batch = []
+    if batch:
+        removed += _purge_batch(kind, batch)
+    logger.info(f"Purged {removed} {kind} file(s)")
+    return removed
+
+
+def _purge_batch(kind: str, keys: List[str]) -> int:
+    storage = get_storage()
+    # Several chapters may share one object (e.g. demo audio); remove each key once.
+    removed = 0
+    for key in set(keys):
+        if key and storage.delete(kind, key):
+            removed += 1
+            for sibling in object_keys(kind, key)[1:]:
+                storage.delete(kind, sibling)
+    return removed
@@ -0,0 +1,174 @@
+"""
+Delta sync and conditional GET helpers.
+
+- Every write bumps updated_at (indexed); deletions leave a Tombstone row.
+- /sync?since=<cursor> returns rows changed after the cursor plus deleted ids.
+  Tombstones are kept for SYNC_TOMBSTONE_RETENTION_SECONDS (pruned by the
+  storage GC pass); an older cursor gets a full snapshot instead.
+- List/detail GETs carry weak ETags derived from max(updated_at), the
+  latest tombstone and the media signing key, so unchanged polls are
+  answered with 304 and no body.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import Book, Chapter, Tombstone, User, clock_now
+from replica_service import replicas_configured
+from storage_service import signing_fingerprint
+
+# Cursors are rewound by this much so rows committed slightly after their
+# updated_at was stamped are not skipped; clients must treat rows as upserts.
+SYNC_OVERLAP_SECONDS = int(os.getenv("SYNC_OVERLAP_SECONDS", "5") or "5")
+SYNC_TOMBSTONE_RETENTION_SECONDS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_SECONDS", "2592000") or "2592000")
+
+ENTITIES = {"user": User, "chapter": Chapter, "book": Book}
+
+
+def _owner_column(model):
+    return model.id if model is User else model.user_id
+
+
+def record_tombstones(db: Session, entity: str, *criteria) -> None:
+    """
+    INSERT ... SELECT a tombstone for every row of `entity` matching criteria.
+    Run before the rows are deleted (in the same transaction).
+    """
+    model = ENTITIES[entity]
+    rows = select(literal(entity), model.id, _owner_column(model), clock_now()).where(*criteria)
+    db.execute(
+        insert(Tombstone).from_select(["entity", "entity_id", "user_id", "deleted_at"], rows)
+    )
+
+
+def _retention_cutoff(db: Session) -> datetime:
+    return db_now(db) - timedelta(seconds=SYNC_TOMBSTONE_RETENTION_SECONDS)
+
+
+def prune_tombstones(db: Session) -> int:
+    """Delete tombstones older than the retention window; returns how many. The caller commits."""
+    result = db.execute(delete(Tombstone).where(Tombstone.deleted_at < _retention_cutoff(db)))
+    return result.rowcount or 0
+
+
+# --- cursors ------------------------------------------------------------------
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[datetime]:
+    if not cursor:
+        return None
+    return datetime.fromisoformat(cursor)
+
+
+def db_now(db: Session) -> datetime:
+    """The database clock, as the naive datetime updated_at is stored in."""
+    now = db.execute(select(clock_now())).scalar_one()
+    if isinstance(now, str):  # SQLite returns text for CURRENT_TIMESTAMP
+        now = datetime.fromisoformat(now)
+    return now.replace(tzinfo=None)
+
+
+def _next_cursor(db: Session) -> str:
+    return (db_now(db) - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+
+
+def changes_since(db: Session, since: Optional[datetime], user_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Rows changed after `since` (all rows when None) and ids deleted after it,
+    scoped to one user when user_id is given. A `since` older than the
+    tombstone retention window may have missed deletions, so it gets a full
+    snapshot (full: True) and the client must drop rows not in it.
+    """
+    cursor = _next_cursor(db)
+    if since is not None and since < _retention_cutoff(db):
+        since = None
+    changed: Dict[str, List[Any]] = {}
+    for entity, model in ENTITIES.items():
+        query = db.query(model)
+        if user_id is not None:
+            query = query.filter(_owner_column(model) == user_id)
+        if since is not None:
+            query = query.filter(model.updated_at > since)
+        changed[entity] = query.order_by(model.updated_at).all()
+
+    deleted: Dict[str, List[int]] = {entity: [] for entity in ENTITIES}
+    if since is not None:
+        tq = db.query(Tombstone.entity, Tombstone.entity_id).filter(Tombstone.deleted_at > since)
+        if user_id is not None:
+            tq = tq.filter(Tombstone.user_id == user_id)
+        for entity, entity_id in tq:
+            deleted.setdefault(entity, []).append(entity_id)
+
+    return {"cursor": cursor, "full": since is None, "changed": changed, "deleted": deleted}
+
+
+# --- ETags ----------------------------------------------------------------------
+
+
+def weak_etag(*parts: Any) -> str:
+    # Bodies carry media URLs signed under MEDIA_SIGNING_KEY: rotating it changes every tag
+    parts += (signing_fingerprint(),)
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def list_etag(db: Session, entity: str, user_id: Optional[int] = None) -> str:
+    """
+    ETag for a list of `entity` (optionally one user's): one statement reading
+    max(updated_at) and the latest matching tombstone, both served by indexes.
+    """
+    model = ENTITIES[entity]
+    latest_row = select(func.max(model.updated_at))
+    latest_delete = select(func.max(Tombstone.deleted_at)).where(Tombstone.entity == entity)
+    if user_id is not None:
+        latest_row = latest_row.where(_owner_column(model) == user_id)
+        latest_delete = latest_delete.where(Tombstone.user_id == user_id)
+    row = db.execute(select(latest_row.scalar_subquery(), latest_delete.scalar_subquery())).one()
+    return weak_etag(entity, user_id, row[0], row[1])
+
+
+def check_list(request: Request, db: Session, entity: str, user_id: Optional[int] = None) -> Tuple[Optional[Response], str]:
+    """
+    Conditional GET for a list whose rows are read in `db`: (304 response or
+    None, ETag for the 200). If-None-Match is compared with the primary's
+    ETag, so a lagging replica never answers 304 while the primary has newer
+    rows; a 200 carries the ETag of the rows it was read from, so a stale body
+    is never cached under a fresh tag.
+    """
+    if not (db.replica_reads and replicas_configured()):
+        etag = list_etag(db, entity, user_id)
+        return not_modified(request, etag), etag
+    with SessionLocal() as primary:
+        current = list_etag(primary, entity, user_id)
+    cached = not_modified(request, current)
+    if cached:
+        return cached, current
+    return None, list_etag(db, entity, user_id)
+
+
+def row_etag(db: Session, entity: str, row_id: int) -> Optional[str]:
+    """ETag for one row from its updated_at alone; None if the row does not exist."""
+    model = ENTITIES[entity]
+    updated_at = db.execute(select(model.updated_at).where(model.id == row_id)).scalar_one_or_none()
+    if updated_at is None:
+        return None
+    return weak_etag(entity, row_id, updated_at)
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response when If-None-Match matches etag (weak comparison), else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {tag.strip() for tag in header.split(",")}
+    bare = etag[2:] if etag.startswith("W/") else etag
+    if "*" in candidates or etag in candidates or bare in candidates:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
@@ -0,0 +1,298 @@
+"""
+Synthetic dataset generator for load, pagination, index and search testing.
+
+Bulk-inserts N users x M chapters x K books with realistic text lengths
+(log-normal), mixed Chinese/English text, statuses and timestamps spread over
+two years. On Postgres chapters are loaded with COPY; elsewhere with batched
+multi-row INSERTs. Generated users share SYNTHETIC_DOMAIN so clear_synthetic()
+(also run by clear_demo) removes everything in a few set-based statements.
+
+Optional placeholder audio: on local storage every chapter gets a sparse file
+of a realistic size (no disk blocks used); other backends share one small
+placeholder object.
+
+    cd backend-api && python synthetic_service.py --users 1000 --chapters 1000 --books 1 [--audio] [--seed 1]
+    cd backend-api && python synthetic_service.py --clear
+"""
+
+import argparse
+import csv
+import io
+import math
+import os
+import random
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, engine
+from models import Book, Chapter, User
+from storage_service import LocalStorage, build_public_url, get_storage
+from sync_service import record_tombstones
+
+SYNTHETIC_DOMAIN = "synthetic.bioweaver.local"
+SYNTHETIC_PREFIX = "synthetic"
+SYNTHETIC_BATCH_SIZE = int(os.getenv("SYNTHETIC_BATCH_SIZE", "5000") or "5000")
+
+# (median characters, sigma) of log-normal text lengths
+TRANSCRIPT_LENGTH = (900, 0.6)
+POLISHED_RATIO = (1.3, 0.15)
+AUDIO_BYTES = (1_500_000, 0.7)
+STATUS_WEIGHTS = {"polished": 0.8, "pending": 0.2}
+MODELS = ["anthropic/claude-3.5-sonnet", "openai/gpt-4o-mini", "google/gemini-flash-1.5"]
+
+ZH_PHRASES = [
+    "我记得", "小时候", "外婆家的院子", "那年冬天", "父亲的自行车", "母亲做的饭", "村口的小学", "火车站的钟",
+    "第一次穿白大褂", "夜班的呼叫器", "雨打在屋顶上", "稻田边的小路", "老房子的窗户", "邻居的收音机", "救护车的警笛",
+]
+EN_WORDS = [
+    "summer", "kitchen", "river", "factory", "letter", "bicycle", "wedding", "harbor", "garden", "winter",
+    "market", "clinic", "night", "shift", "window", "photograph", "station", "teacher", "village", "road",
+]
+ANCHORS = [
+    "The Stethoscope", "Old Clinic Sign", "Night Shift Pager", "First White Coat", "The Waiting Room Clock",
+    "The Ambulance Siren", "A Family Photo", "Rain on the Roof", "The Village Road", "A Wedding Invitation",
+]
+
+CHAPTER_FIELDS = [
+    "user_id", "title", "anchor_prompt", "segment_index", "audio_url", "transcript_text", "polished_text",
+    "polished_by_model", "status", "created_at", "updated_at",
+]
+
+_running = threading.Lock()
+
+
+def _sentence_pool(rng: random.Random, size: int = 4000) -> List[str]:
+    pool = []
+    for _ in range(size):
+        if rng.random() < 0.65:
+            pool.append("，".join(rng.choice(ZH_PHRASES) for _ in range(rng.randint(2, 5))) + "。")
+        else:
+            pool.append(" ".join(rng.choice(EN_WORDS) for _ in range(rng.randint(5, 14))).capitalize() + ". ")
+    return pool
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    return rng.lognormvariate(math.log(median), sigma)
+
+
+def _text(rng: random.Random, pool: List[str], length: int) -> str:
+    # Sentences average ~25 characters; overshoot, then cut to length
+    return "".join(rng.choices(pool, k=length // 20 + 1))[:length]
+
+
+class _Generator:
+    def __init__(self, seed: Optional[int], audio: bool) -> None:
+        self.rng = random.Random(seed)
+        self.pool = _sentence_pool(self.rng)
+        self.run = f"{int(time.time()):x}{self.rng.randrange(16 ** 4):04x}"
+        self.storage = get_storage()
+        self.audio = audio
+        self.sparse = isinstance(self.storage, LocalStorage)
+        self.shared_audio_url: Optional[str] = None
+        self.audio_files = 0
+        self.now = datetime.utcnow()
+
+    def audio_url(self, n: int) -> Optional[str]:
+        if not self.audio:
+            return None
+        if not self.sparse:
+            if self.shared_audio_url is None:
+                from seed_service import ensure_silence_wav  # seed_service imports this module
+
+                key = ensure_silence_wav(self.storage, f"{SYNTHETIC_PREFIX}/placeholder.wav")
+                self.shared_audio_url = build_public_url("audio", key)
+            return self.shared_audio_url
+        key = f"{SYNTHETIC_PREFIX}/{self.run}/{n // 1000:04d}/{n}.webm"
+        path = self.storage.path("audio", key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(int(_lognormal(self.rng, *AUDIO_BYTES)))  # sparse: size without blocks
+        self.audio_files += 1
+        return build_public_url("audio", key)
+
+    def created_at(self) -> datetime:
+        return self.now - timedelta(seconds=self.rng.randrange(2 * 365 * 86400))
+
+    def chapters(self, user_ids: List[int], per_user: int, counter: List[int]) -> Iterator[Dict[str, Any]]:
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        for user_id in user_ids:
+            for i in range(per_user):
+                counter[0] += 1
+                status = self.rng.choices(statuses, weights)[0]
+                transcript_len = int(_lognormal(self.rng, *TRANSCRIPT_LENGTH))
+                polished_len = int(transcript_len * _lognormal(self.rng, *POLISHED_RATIO))
+                anchor = self.rng.choice(ANCHORS)
+                created = self.created_at()
+                yield {
+                    "user_id": user_id,
+                    "title": f"Chapter {i + 1}: {anchor}",
+                    "anchor_prompt": anchor,
+                    "segment_index": i,
+                    "audio_url": self.audio_url(counter[0]),
+                    "transcript_text": _text(self.rng, self.pool, transcript_len),
+                    "polished_text": _text(self.rng, self.pool, polished_len) if status == "polished" else None,
+                    "polished_by_model": self.rng.choice(MODELS) if status == "polished" else None,
+                    "status": status,
+                    "created_at": created,
+                    "updated_at": created,
+                }
+
+
+def _batches(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_chapters(batch: List[Dict[str, Any]]) -> None:
+    """COPY one batch into chapters (Postgres); NULLs are unquoted empty fields."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in batch:
+        writer.writerow(["" if row[f] is None else row[f] for f in CHAPTER_FIELDS])
+    buf.seek(0)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.copy_expert(f"COPY chapters ({', '.join(CHAPTER_FIELDS)}) FROM STDIN WITH (FORMAT csv)", buf)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def _insert_chapters(batch: List[Dict[str, Any]]) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(Chapter), batch)
+
+
+def generate_synthetic(
+    users: int,
+    chapters_per_user: int,
+    books_per_user: int = 1,
+    audio: bool = False,
+    seed: Optional[int] = None,
+    batch_size: int = SYNTHETIC_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Generate a synthetic dataset. Rows are committed batch by batch, so an
+    interrupted run leaves a partial but consistent dataset that clear_synthetic() removes.
+    """
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("a synthetic generation run is already in progress")
+    try:
+        started = time.monotonic()
+        gen = _Generator(seed, audio)
+        copy = engine.dialect.name == "postgresql"
+        write_chapters = _copy_chapters if copy else _insert_chapters
+
+        user_ids: List[int] = []
+        for start in range(0, users, batch_size):
+            rows = [
+                {
+                    "name": f"Synthetic {n}",
+                    "email": f"{gen.run}-{n}@{SYNTHETIC_DOMAIN}",
+                    "created_at": gen.created_at(),
+                    "updated_at": gen.now,
+                }
+                for n in range(start, min(users, start + batch_size))
+            ]
+            with engine.begin() as conn:
+                user_ids.extend(conn.execute(insert(User).returning(User.id), rows).scalars().all())
+
+        counter = [0]
+        for batch in _batches(gen.chapters(user_ids, chapters_per_user, counter), batch_size):
+            write_chapters(batch)
+
+        books = (
+            {
+                "user_id": user_id,
+                "title": f"Memory Book {k + 1}",
+                "description": "Synthetic load-test book",
+                "pdf_url": None,
+                "created_at": gen.now,
+                "updated_at": gen.now,
+            }
+            for user_id in user_ids
+            for k in range(books_per_user)
+        )
+        book_count = 0
+        for batch in _batches(books, batch_size):
+            with engine.begin() as conn:
+                conn.execute(insert(Book), batch)
+            book_count += len(batch)
+
+        return {
+            "run": gen.run,
+            "users": len(user_ids),
+            "chapters": counter[0],
+            "books": book_count,
+            "audio_files": gen.audio_files,
+            "method": "copy" if copy else "insert",
+            "seconds": round(time.monotonic() - started, 2),
+        }
+    finally:
+        _running.release()
+
+
+def clear_synthetic(db: Session) -> Dict[str, int]:
+    """Delete every synthetic user with their chapters, books and placeholder audio."""
+    synthetic_users = select(User.id).where(User.email.like(f"%@{SYNTHETIC_DOMAIN}"))
+    record_tombstones(db, "chapter", Chapter.user_id.in_(synthetic_users))
+    record_tombstones(db, "book", Book.user_id.in_(synthetic_users))
+    record_tombstones(db, "user", User.id.in_(synthetic_users))
+    # Children explicitly: not every dev database enforces ON DELETE CASCADE
+    chapters = db.execute(delete(Chapter).where(Chapter.user_id.in_(synthetic_users))).rowcount
+    books = db.execute(delete(Book).where(Book.user_id.in_(synthetic_users))).rowcount
+    users = db.execute(delete(User).where(User.email.like(f"%@{SYNTHETIC_DOMAIN}"))).rowcount
+    db.commit()
+
+    storage = get_storage()
+    files = 0
+    if isinstance(storage, LocalStorage):
+        root = storage.path("audio", SYNTHETIC_PREFIX)
+        files = sum(1 for _ in storage.iter_objects("audio", SYNTHETIC_PREFIX))
+        shutil.rmtree(root, ignore_errors=True)
+    else:
+        for key, _size, _mtime in list(storage.iter_objects("audio", SYNTHETIC_PREFIX)):
+            files += storage.delete("audio", key)
+    return {"deleted_users": users, "deleted_chapters": chapters, "deleted_books": books, "deleted_files": files}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate or clear a synthetic BioWeaver dataset")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--chapters", type=int, default=100, help="chapters per user")
+    parser.add_argument("--books", type=int, default=1, help="books per user")
+    parser.add_argument("--audio", action="store_true", help="create placeholder audio files")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=SYNTHETIC_BATCH_SIZE)
+    parser.add_argument("--clear", action="store_true", help="delete all synthetic data instead")
+    args = parser.parse_args()
+
+    if args.clear:
+        db = SessionLocal()
+        try:
+            print(clear_synthetic(db))
+        finally:
+            db.close()
+        return
+    from schema_service import ensure_schema
+
+    ensure_schema(engine)
+    print(generate_synthetic(args.users, args.chapters, args.books, args.audio, args.seed, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
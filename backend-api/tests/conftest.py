@@ -0,0 +1,65 @@
+"""
+Shared fixtures: the API on a throwaway SQLite database, and the query_budget
+plugin (pytest_query_budget.py).
+
+Run from backend-api:
+
+    pip install -r requirements-dev.txt && python -m pytest
+"""
+
+import os
+import tempfile
+
+# Configure before the app's modules read the environment at import time
+_tmp = tempfile.mkdtemp(prefix="bioweaver-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["STORAGE_AUDIO_PATH"] = os.path.join(_tmp, "audio")
+os.environ["STORAGE_BOOK_PATH"] = os.path.join(_tmp, "books")
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+os.environ.pop("ADMIN_TOKEN", None)
+os.environ.pop("OPENROUTER_API_KEY", None)
+os.environ.pop("OPENAI_API_KEY", None)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from db import SessionLocal, engine  # noqa: E402
+from models import Base, Chapter, User  # noqa: E402
+
+pytest_plugins = ["pytest_query_budget"]
+
+
+@pytest.fixture
+def client():
+    # Without `with`, so startup hooks (background loops) do not run
+    from main import app
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return TestClient(app)
+
+
+@pytest.fixture
+def user(client) -> User:
+    """A user with five transcribed, polished chapters."""
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        user = User(name="Ada", email="ada@example.com")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            Chapter(
+                user_id=user.id,
+                title=f"Chapter {i}",
+                segment_index=i,
+                transcript_text=f"transcript {i}",
+                polished_text=f"polished {i}",
+                status="polished",
+            )
+            for i in range(5)
+        )
+        db.commit()
+        return user
+    finally:
+        db.close()
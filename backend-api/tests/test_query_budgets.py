@@ -0,0 +1,63 @@
+"""
+SQL statements per request for the endpoints clients poll most. A lookup
+added inside a loop or a lazy relationship load raises the count and fails
+here; raise a budget only with a reason.
+"""
+
+import pytest
+
+from db import SessionLocal
+from models import User
+
+
+def test_list_users(client, user, query_budget):
+    # ETag, then the rows
+    response = query_budget.check(client, "GET", "/users", 2)
+    assert response.status_code == 200
+    assert [u["email"] for u in response.json()] == ["ada@example.com"]
+
+
+def test_list_users_not_modified(client, user, query_budget):
+    etag = client.get("/users").headers["etag"]
+    response = query_budget.check(client, "GET", "/users", 1, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_list_chapters(client, user, query_budget):
+    # Same cost for one chapter or many: no per-row statements
+    response = query_budget.check(client, "GET", f"/chapters?user_id={user.id}", 2)
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+
+
+def test_update_user(client, user, query_budget):
+    # Load, email uniqueness check, update, refresh
+    response = query_budget.check(
+        client, "PATCH", f"/users/{user.id}", 4, json={"name": "Ada L.", "email": "ada.l@example.com"}
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == "Ada L."
+
+
+# The plugin itself: both forms must fail a test that goes over budget
+
+
+def _lookups(user_id: int, times: int) -> None:
+    db = SessionLocal()
+    try:
+        for _ in range(times):
+            db.query(User).filter(User.id == user_id).first()
+    finally:
+        db.close()
+
+
+def test_block_over_budget_fails(client, user, query_budget):
+    with pytest.raises(pytest.fail.Exception, match="exceeded its query budget of 2"):
+        with query_budget(2, "lookups"):
+            _lookups(user.id, 3)
+
+
+@pytest.mark.xfail(strict=True, raises=pytest.fail.Exception, reason="3 statements against a budget of 1")
+@pytest.mark.query_budget(1)
+def test_marker_over_budget_fails(client, user):
+    _lookups(user.id, 3)
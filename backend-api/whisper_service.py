@@ -1,16 +1,23 @@
 import os
 import mimetypes
-import httpx
-from httpx import HTTPError
 import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ledger_service import record_call
+from lifecycle_service import tracked
 
 logger = logging.getLogger(__name__)
 
 
-async def transcribe_file(file_path: str) -> str:
+@tracked("ai")
+async def transcribe_file(file_path: str, prompt: Optional[str] = None) -> str:
     """
     Call Whisper transcription via OpenAI API.
     OpenRouter does NOT support audio endpoints, so we use OpenAI directly.
+    `prompt` is preceding text (e.g. the previous live window) for continuity.
     Falls back to empty string on failure to keep pipeline non-blocking.
     """
     # Try OpenAI API first (for Whisper)
@@ -45,31 +52,67 @@ async def transcribe_file(file_path: str) -> str:
         "Authorization": f"Bearer {api_key}",
     }
 
-    data = {"model": model, "response_format": "text"}
+    # json (not text) so the response carries usage: audio seconds or tokens, depending on the model
+    data = {"model": model, "response_format": "json"}
+    if prompt:
+        data["prompt"] = prompt
     last_error = None
+    status_code = None
+    headers_at = None
+    outcome = "error"
+    started = time.monotonic()
+    attempts = 0
+
+    def record(usage: Dict[str, Any]) -> None:
+        record_call(
+            "transcribe",
+            model,
+            total_seconds=time.monotonic() - started,
+            headers_seconds=headers_at,
+            attempts=attempts,
+            status_code=status_code,
+            outcome=outcome,
+            error=last_error if outcome != "ok" else None,
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+            audio_seconds=usage.get("seconds"),
+        )
 
     for attempt in range(2):  # simple retry
+        attempts = attempt + 1
         try:
             async with httpx.AsyncClient(timeout=120) as client:
                 with open(file_path, "rb") as f:
                     files = {"file": (os.path.basename(file_path), f, mime)}
-                    resp = await client.post(f"{base_url}/audio/transcriptions", headers=headers, data=data, files=files)
+                    sent = time.monotonic()
+                    async with client.stream(
+                        "POST", f"{base_url}/audio/transcriptions", headers=headers, data=data, files=files
+                    ) as resp:
+                        headers_at = time.monotonic() - sent  # the whole transcription: nothing is streamed
+                        await resp.aread()
+                    status_code = resp.status_code
                     if resp.status_code == 200:
-                        result = resp.text.strip()
+                        body = resp.json()
+                        result = (body.get("text") or "").strip()
                         logger.info(f"Transcription successful: {len(result)} chars")
+                        outcome = "ok"
+                        record(body.get("usage") or {})
                         return result
                     else:
                         last_error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                        outcome = "http_error"
                         logger.warning(f"Transcription attempt {attempt+1} failed: {last_error}")
-        except HTTPError as e:
+        except httpx.HTTPError as e:
             last_error = str(e)
+            status_code, headers_at, outcome = None, None, "network_error"
             logger.warning(f"Transcription HTTP error attempt {attempt+1}: {e}")
             continue
         except Exception as e:
             last_error = str(e)
+            outcome = "error"
             logger.error(f"Transcription exception attempt {attempt+1}: {e}")
             break
     
     logger.error(f"Transcription failed after retries: {last_error}")
+    record({})
     return ""
-
@@ -170,6 +170,7 @@ type Chapter = {
   transcript_text?: string | null;
   polished_text?: string | null;
   status: string;
+  duplicate_of?: number | null;
 };
 
 const DEFAULT_API_BASE =
@@ -184,17 +185,96 @@ async function fetchChapters(): Promise<Chapter[]> {
   return res.json();
 }
 
-async function uploadChapter(form: { userId: string; title: string; anchorPrompt: string; file: File }) {
+// 每次录音一个幂等键：实时上传与回退上传带同一个键，服务端不会重复创建章节
+// （crypto.randomUUID 仅在 HTTPS 下可用，getRandomValues 则处处可用）
+function newIdempotencyKey(): string {
+  return Array.from(crypto.getRandomValues(new Uint8Array(16)), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function uploadChapter(form: {
+  userId: string;
+  title: string;
+  anchorPrompt: string;
+  file: File;
+  idempotencyKey?: string;
+}) {
   const fd = new FormData();
   fd.append("user_id", form.userId || "1");
   fd.append("title", form.title);
   if (form.anchorPrompt) fd.append("anchor_prompt", form.anchorPrompt);
+  if (form.idempotencyKey) fd.append("idempotency_key", form.idempotencyKey);
   fd.append("file", form.file);
   const res = await fetch(`${API_BASE}/upload_audio`, { method: "POST", body: fd });
   if (!res.ok) throw new Error(`Upload failed: ${res.status}`);
   return (await res.json()) as Chapter;
 }
 
+// 近似重复的章节：使用已润色章节的文字，或仍然重新润色
+async function resolveDuplicate(chapterId: number, reuse: boolean): Promise<Chapter> {
+  const path = reuse ? "reuse_polished" : "polish";
+  const res = await fetch(`${API_BASE}/chapters/${chapterId}/${path}`, { method: "POST" });
+  if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+  return (await res.json()) as Chapter;
+}
+
+type LiveIngest = {
+  idempotencyKey: string;
+  push: (chunk: Blob) => void;
+  end: () => void;
+  commit: (form: { title: string; anchorPrompt: string }) => Promise<Chapter>;
+  cancel: () => void;
+};
+
+// 边录边传：录音分片经 WebSocket 实时上传，服务端按窗口边录边转录。
+// 任何失败（不支持、断线、服务重启）都由调用方回退到 /upload_audio 整体上传，
+// 并带上同一个幂等键：若服务端其实已创建章节，回退上传直接返回该章节。
+function openLiveIngest(userId: string, mimeType: string, onWindow: (text: string) => void): LiveIngest {
+  const ws = new WebSocket(`${API_BASE.replace(/^http/, "ws")}/ws/ingest`);
+  const idempotencyKey = newIdempotencyKey();
+  const queue: (Blob | string)[] = [
+    JSON.stringify({ type: "start", user_id: Number(userId || "1"), mime_type: mimeType, idempotency_key: idempotencyKey }),
+  ];
+  let failed = false;
+  let settle: { resolve: (c: Chapter) => void; reject: (e: Error) => void } | null = null;
+  const chapter = new Promise<Chapter>((resolve, reject) => (settle = { resolve, reject }));
+  chapter.catch(() => undefined); // 未提交时的失败不需要处理
+
+  const send = (data: Blob | string) => {
+    if (failed) return;
+    if (ws.readyState === WebSocket.OPEN) ws.send(data);
+    else queue.push(data);
+  };
+  const fail = (reason: string) => {
+    failed = true;
+    settle?.reject(new Error(reason));
+  };
+
+  ws.onopen = () => queue.splice(0).forEach((data) => ws.send(data));
+  ws.onmessage = (e) => {
+    const msg = JSON.parse(e.data as string);
+    if (msg.type === "window" && msg.text) onWindow(msg.text);
+    else if (msg.type === "chapter") settle?.resolve(msg.chapter as Chapter);
+    else if (msg.type === "error") fail(msg.detail);
+  };
+  ws.onerror = () => fail("live ingest unavailable");
+  ws.onclose = () => fail("live ingest closed");
+
+  return {
+    idempotencyKey,
+    push: send,
+    end: () => send(JSON.stringify({ type: "end" })),
+    commit: ({ title, anchorPrompt }) => {
+      send(JSON.stringify({ type: "commit", title, anchor_prompt: anchorPrompt || null }));
+      return failed ? Promise.reject(new Error("live ingest failed")) : chapter;
+    },
+    cancel: () => {
+      send(JSON.stringify({ type: "cancel" }));
+      failed = true;
+      ws.close();
+    },
+  };
+}
+
 const statusStyles: Record<string, string> = {
   completed: "border-green-500 text-green-800",
   polished: "border-green-500 text-green-800",
@@ -242,11 +322,13 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
   const [audioBlob, setAudioBlob] = useState<Blob | null>(null);
   const [audioUrl, setAudioUrl] = useState<string | null>(null);
   const [micPermission, setMicPermission] = useState<"granted" | "denied" | "prompt">("prompt");
+  const [liveTranscript, setLiveTranscript] = useState("");
   
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const audioChunksRef = useRef<Blob[]>([]);
   const timerRef = useRef<NodeJS.Timeout | null>(null);
   const streamRef = useRef<MediaStream | null>(null);
+  const liveRef = useRef<LiveIngest | null>(null);
 
   // 登出处理
   const handleLogout = () => {
@@ -288,27 +370,40 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
     checkPermission();
   }, []);
 
+  // 订阅章节状态推送（SSE）：服务端只推送发生变化的章节，取代定时全量轮询
   useEffect(() => {
-    if (!lastUploadId) return;
-    const interval = setInterval(async () => {
+    const source = new EventSource(`${API_BASE}/events/chapters`);
+    source.addEventListener("chapter", (e) => {
+      const { chapter } = JSON.parse((e as MessageEvent).data) as { chapter?: Chapter };
+      if (!chapter) return;
+      setChapters((prev) => [...prev.filter((c) => c.id !== chapter.id), chapter].sort((a, b) => a.id - b.id));
+    });
+    source.addEventListener("deleted", (e) => {
+      const { id } = JSON.parse((e as MessageEvent).data) as { id: number };
+      setChapters((prev) => prev.filter((c) => c.id !== id));
+    });
+    // 客户端落后太多时服务端要求重新全量拉取
+    source.addEventListener("resync", async () => {
       try {
-        const data = await fetchChapters();
-        setChapters(data);
-        const found = data.find((c) => c.id === lastUploadId);
-        if (found && (found.transcript_text || found.polished_text)) {
-          setMessage("✅ 转录完成！AI 正在润色中...");
-          if (found.polished_text) {
-            setMessage("✅ AI 润色完成！");
-            clearInterval(interval);
-            setLastUploadId(null);
-          }
-        }
+        setChapters(await fetchChapters());
       } catch {
-        // ignore poll errors
+        // ignore resync errors
+      }
+    });
+    return () => source.close();
+  }, []);
+
+  useEffect(() => {
+    if (!lastUploadId) return;
+    const found = chapters.find((c) => c.id === lastUploadId);
+    if (found && (found.transcript_text || found.polished_text)) {
+      setMessage("✅ 转录完成！AI 正在润色中...");
+      if (found.polished_text) {
+        setMessage("✅ AI 润色完成！");
+        setLastUploadId(null);
       }
-    }, 3000);
-    return () => clearInterval(interval);
-  }, [lastUploadId]);
+    }
+  }, [chapters, lastUploadId]);
 
   const anchorPrompt = useMemo(() => chapters[0]?.anchor_prompt || "我的听诊器", [chapters]);
 
@@ -319,6 +414,7 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
       setAudioBlob(null);
       setAudioUrl(null);
       audioChunksRef.current = [];
+      setLiveTranscript("");
 
       // 请求麦克风权限
       const stream = await navigator.mediaDevices.getUserMedia({ 
@@ -341,10 +437,15 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
 
       const mediaRecorder = new MediaRecorder(stream, { mimeType });
       mediaRecorderRef.current = mediaRecorder;
+      liveRef.current?.cancel();
+      liveRef.current = openLiveIngest(form.userId, mimeType, (text) =>
+        setLiveTranscript((prev) => (prev ? `${prev}\n${text}` : text))
+      );
 
       mediaRecorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
           audioChunksRef.current.push(event.data);
+          liveRef.current?.push(event.data);
         }
       };
 
@@ -354,6 +455,8 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
         const url = URL.createObjectURL(audioBlob);
         setAudioUrl(url);
         setMessage("🎙️ 录音完成！请填写标题后上传。");
+        // 服务端此时转录最后一个窗口，与用户填写标题同时进行
+        liveRef.current?.end();
         
         // 停止所有音轨
         stream.getTracks().forEach(track => track.stop());
@@ -405,6 +508,9 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
     setAudioUrl(null);
     setRecordingTime(0);
     setMessage(null);
+    setLiveTranscript("");
+    liveRef.current?.cancel();
+    liveRef.current = null;
     
     if (streamRef.current) {
       streamRef.current.getTracks().forEach(track => track.stop());
@@ -426,15 +532,25 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
       const extension = audioBlob.type.includes("mp4") ? "m4a" : "webm";
       const file = new File([audioBlob], `recording_${Date.now()}.${extension}`, { type: audioBlob.type });
 
-      const created = await uploadChapter({
-        userId: form.userId,
-        title: form.title,
-        anchorPrompt: form.anchorPrompt,
-        file: file,
-      });
+      const live = liveRef.current;
+      liveRef.current = null;
+      let created: Chapter;
+      try {
+        if (!live) throw new Error("no live session");
+        created = await live.commit({ title: form.title, anchorPrompt: form.anchorPrompt });
+      } catch {
+        created = await uploadChapter({
+          userId: form.userId,
+          title: form.title,
+          anchorPrompt: form.anchorPrompt,
+          file: file,
+          idempotencyKey: live?.idempotencyKey,
+        });
+      }
 
-      setChapters((prev) => [...prev, created].sort((a, b) => a.id - b.id));
+      setChapters((prev) => [...prev.filter((c) => c.id !== created.id), created].sort((a, b) => a.id - b.id));
       setForm({ ...form, title: "", anchorPrompt: "" });
+      setLiveTranscript("");
       setAudioBlob(null);
       setAudioUrl(null);
       setRecordingTime(0);
@@ -473,6 +589,17 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
     }
   };
 
+  const handleDuplicate = async (chapterId: number, reuse: boolean) => {
+    try {
+      setMessage(reuse ? "⏳ 正在使用已有润色..." : "⏳ 重新润色中...");
+      const updated = await resolveDuplicate(chapterId, reuse);
+      setChapters((prev) => prev.map((c) => (c.id === updated.id ? updated : c)));
+      setMessage("✅ 已润色");
+    } catch (e: any) {
+      setMessage(`❌ 操作失败: ${e?.message}`);
+    }
+  };
+
   return (
     <div className="min-h-screen bg-background text-text pb-48">
       <div className="max-w-2xl mx-auto px-4 pt-8 space-y-6">
@@ -571,6 +698,13 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
             )}
           </div>
 
+          {/* 边录边转录的实时文字 */}
+          {liveTranscript && (
+            <div className="mb-4 rounded-xl bg-white/70 border border-[#E6E1D8] p-3 text-sm text-slate-600 whitespace-pre-wrap max-h-40 overflow-y-auto">
+              {liveTranscript}
+            </div>
+          )}
+
           {/* 权限提示 */}
           {micPermission === "denied" && (
             <div className="bg-red-50 border border-red-200 rounded-xl p-3 text-sm text-red-700">
@@ -704,12 +838,33 @@ function MainApp({ onLogout }: { onLogout: () => void }) {
                   <span className={`text-xs px-3 py-1 rounded-full ${
                     card.status === "polished" ? "bg-green-100 text-green-700" :
                     card.status === "pending" ? "bg-yellow-100 text-yellow-700" :
+                    card.status === "duplicate" ? "bg-amber-100 text-amber-700" :
                     "bg-slate-100 text-slate-600"
                   }`}>
                     {card.status === "polished" ? "✅ 已润色" : 
-                     card.status === "pending" ? "⏳ 处理中" : card.status}
+                     card.status === "pending" ? "⏳ 处理中" :
+                     card.status === "duplicate" ? "🔁 似曾讲过" : card.status}
                   </span>
                 </div>
+                {card.status === "duplicate" && card.duplicate_of && (
+                  <div className="mt-3 rounded-xl bg-amber-50 border border-amber-200 p-3 text-sm text-amber-800">
+                    <p>这段回忆和第 {card.duplicate_of} 章很像，可以直接使用那一章的润色文字。</p>
+                    <div className="mt-2 flex gap-2">
+                      <button
+                        onClick={() => handleDuplicate(card.id, true)}
+                        className="rounded-full bg-amber-600 text-white px-4 py-1.5 font-semibold"
+                      >
+                        使用已有润色
+                      </button>
+                      <button
+                        onClick={() => handleDuplicate(card.id, false)}
+                        className="rounded-full border border-amber-400 px-4 py-1.5"
+                      >
+                        重新润色
+                      </button>
+                    </div>
+                  </div>
+                )}
                 <p className="text-sm text-slate-600 mt-3 leading-relaxed line-clamp-3">
                   {card.polished_text || card.transcript_text || "正在转录中..."}
                 </p>